@@ -0,0 +1,91 @@
+"""Measure IVF recall@k and latency against exact matrix search."""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from rag.vector_index import IVFIndex, MatrixIndex
+
+
+def clustered_vectors(count: int, dimension: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Gaussian blobs around random centres, a rough stand-in for topical corpora."""
+
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimension))
+    labels = rng.integers(0, clusters, size=count)
+    return (centres[labels] + rng.normal(scale=0.6, size=(count, dimension))).astype(np.float32)
+
+
+def run(
+    count: int,
+    dimension: int,
+    queries: int,
+    top_k: int,
+    nlist: int,
+    nprobes: List[int],
+    seed: int = 0,
+) -> Dict[str, object]:
+    vectors = clustered_vectors(count + queries, dimension, clusters=max(nlist, 8), seed=seed)
+    corpus, query_vectors = vectors[:count], vectors[count:]
+    ids = [f"chunk-{idx}" for idx in range(count)]
+
+    exact = MatrixIndex(dimension)
+    exact.add(ids, corpus)
+    started = time.perf_counter()
+    truth = [{chunk_id for chunk_id, _ in exact.search(query, top_k)} for query in query_vectors]
+    exact_latency = (time.perf_counter() - started) / queries
+
+    ivf = IVFIndex(dimension, nlist=nlist)
+    ivf.add(ids, corpus)
+    started = time.perf_counter()
+    ivf.train()
+    train_seconds = time.perf_counter() - started
+
+    results = []
+    for nprobe in nprobes:
+        hits = 0
+        started = time.perf_counter()
+        for query, expected in zip(query_vectors, truth):
+            found = {chunk_id for chunk_id, _ in ivf.search(query, top_k, nprobe=nprobe)}
+            hits += len(found & expected)
+        latency = (time.perf_counter() - started) / queries
+        results.append(
+            {
+                "nprobe": nprobe,
+                f"recall_at_{top_k}": hits / (queries * top_k),
+                "latency_ms": latency * 1000,
+                "speedup": exact_latency / latency if latency else None,
+            }
+        )
+    return {
+        "count": count,
+        "dimension": dimension,
+        "queries": queries,
+        "top_k": top_k,
+        "nlist": ivf.centroids.shape[0],
+        "train_seconds": train_seconds,
+        "exact_latency_ms": exact_latency * 1000,
+        "ivf": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark IVF recall@k against exact search")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0, help="Number of lists (default: sqrt(count))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+    nlist = args.nlist or int(np.sqrt(args.count))
+    report = run(args.count, args.dimension, args.queries, args.top_k, nlist, args.nprobe)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
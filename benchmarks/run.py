@@ -0,0 +1,516 @@
+"""Benchmark suite for startup, ingestion, chunking, embedding, retrieval, reranking, prompts and writes.
+
+Runs fully offline with the hashing embedder and prints (or writes) one JSON
+document so results can be diffed between versions::
+
+    python -m benchmarks.run --sizes 1000 10000 100000 --output bench.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from benchmarks.synthetic import generate_corpus, paragraph, write_pdf, write_xlsx
+from generator.prompt import CompiledTemplate, pack_context
+from rag.embedder import EmbeddingClient, EmbeddingConfig
+from rag.ingest import iter_file_chunks, load_and_chunk, loader_class
+from rag.ingestion.chunker import chunk_spans
+from rag.models import DocumentChunk
+from rag.reranker import RerankerConfig, build_reranker
+from rag.sharded_store import ShardedStoreConfig, ShardedVectorStore
+from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
+
+SELECTIVITIES = (1.0, 0.1, 0.01)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def bench_ingest(root: Path, files_per_type: int, units_per_file: int) -> Dict[str, Dict[str, float]]:
+    corpus = generate_corpus(root, files_per_type, units_per_file)
+    results: Dict[str, Dict[str, float]] = {}
+    for kind, paths in corpus.items():
+        size = sum(path.stat().st_size for path in paths)
+        started = time.perf_counter()
+        chunks = sum(len(load_and_chunk(path, 200, 40).chunks) for path in paths)
+        elapsed = time.perf_counter() - started
+        # Chunk count without the per-doc_type strategies, for comparison.
+        window_chunks = sum(len(load_and_chunk(path, 200, 40, chunking="window").chunks) for path in paths)
+        results[kind] = {
+            "files": len(paths),
+            "megabytes": size / 1e6,
+            "chunks": chunks,
+            "window_chunks": window_chunks,
+            "seconds": elapsed,
+            "files_per_second": len(paths) / elapsed,
+            "megabytes_per_second": size / 1e6 / elapsed,
+            "chunks_per_second": chunks / elapsed,
+        }
+    return results
+
+
+def bench_streaming(root: Path, sizes: Sequence[int]) -> List[Dict[str, float]]:
+    """Peak traced memory while streaming one large PDF or workbook through chunking.
+
+    Workbooks get ``10 * size`` rows and PDFs ``size`` pages; with streaming
+    loaders the peak should stay roughly flat as the file grows (read-only
+    openpyxl still loads a workbook's shared-strings table whole).
+    """
+
+    rng = random.Random(0)
+    root.mkdir(parents=True, exist_ok=True)
+    results: List[Dict[str, float]] = []
+    for size in sizes:
+        for kind, path, units, writer in (
+            ("xlsx", root / f"large_{size}.xlsx", 10 * size, write_xlsx),
+            ("pdf", root / f"large_{size}.pdf", size, write_pdf),
+        ):
+            writer(path, rng, units)
+            # Import the loader first so module import is not counted as loading.
+            loader_class(path.suffix)
+            tracemalloc.start()
+            started = time.perf_counter()
+            chunks = sum(1 for _ in iter_file_chunks(path, 200, 40))
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append(
+                {
+                    "kind": kind,
+                    "units": units,
+                    "megabytes": path.stat().st_size / 1e6,
+                    "chunks": chunks,
+                    "seconds": elapsed,
+                    "peak_traced_mb": peak / 1e6,
+                }
+            )
+    return results
+
+
+def split_join_windows(text: str, chunk_size: int, overlap: int) -> List[str]:
+    """The previous word-count chunker, kept as the baseline for ``bench_chunking``."""
+
+    words = text.split()
+    step = max(chunk_size - overlap, 1)
+    return [" ".join(words[start : start + chunk_size]) for start in range(0, len(words), step)]
+
+
+def bench_chunking(megabytes: Sequence[float], repeats: int = 3) -> List[Dict[str, float]]:
+    """Split/join word windows versus approximate-token windows over one large text."""
+
+    rng = random.Random(0)
+    results: List[Dict[str, float]] = []
+    for size in megabytes:
+        parts: List[str] = []
+        length = 0
+        while length < size * 1e6:
+            parts.append(paragraph(rng, 6))
+            length += len(parts[-1]) + 2
+        text = "\n\n".join(parts)
+        for method, run in (
+            ("split_join", lambda: split_join_windows(text, 200, 40)),
+            ("approximate_tokens", lambda: [text[start:end] for start, end in chunk_spans(text, 200, 40)]),
+        ):
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                chunks = run()
+                timings.append(time.perf_counter() - started)
+            elapsed = min(timings)
+            results.append(
+                {
+                    "method": method,
+                    "megabytes": len(text) / 1e6,
+                    "chunks": len(chunks),
+                    "seconds": elapsed,
+                    "megabytes_per_second": len(text) / 1e6 / elapsed,
+                }
+            )
+    return results
+
+
+def replace_render(template: str, payload: Dict[str, str]) -> str:
+    """The previous prompt fill, one ``str.replace`` pass per key, kept as the baseline for ``bench_prompt``."""
+
+    for key, value in payload.items():
+        template = template.replace(f"{{{{{key}}}}}", value)
+    return template
+
+
+def bench_prompt(texts: List[str], template_kilobytes: Sequence[int], repeats: int = 20) -> List[Dict[str, float]]:
+    """Prompt fill cost versus template size, and context tokens packed into a fixed budget."""
+
+    chunks = [
+        DocumentChunk(id=str(n), text=text, metadata={"source": f"doc-{n % 5}", "doc_type": "bench"})
+        for n, text in enumerate(texts[:20])
+    ]
+    context = pack_context(chunks, budget=1500, max_snippets=20)
+    payload = {f"field_{n}": f"value {n}" for n in range(16)}
+    payload["retrieved_context"] = context.text
+    results: List[Dict[str, float]] = []
+    for kilobytes in template_kilobytes:
+        filler = paragraph(random.Random(kilobytes), 4)
+        body = (filler * (kilobytes * 1024 // len(filler) + 1))[: kilobytes * 1024]
+        template = body + "".join(f"\n{{{{{key}}}}}" for key in payload)
+        compiled = CompiledTemplate(template)
+        for method, run in (("replace", lambda: replace_render(template, payload)), ("compiled", lambda: compiled.render(payload))):
+            started = time.perf_counter()
+            for _ in range(repeats):
+                run()
+            results.append(
+                {
+                    "method": method,
+                    "template_kb": kilobytes,
+                    "ms_per_prompt": (time.perf_counter() - started) / repeats * 1000,
+                    "context_tokens": context.tokens,
+                    "snippets": len(context.chunks),
+                }
+            )
+    return results
+
+
+def bench_embedding(texts: List[str], backend: str) -> Dict[str, object]:
+    client = EmbeddingClient(EmbeddingConfig(backend=backend))
+    if backend != "hashing" and client._sentence_model is None:
+        return {"skipped": "sentence-transformers is not installed"}
+    client.embed(texts[:8])
+    started = time.perf_counter()
+    vectors = client.embed(texts)
+    elapsed = time.perf_counter() - started
+    return {
+        "model": client.model_id,
+        "texts": len(texts),
+        "dimension": int(vectors[0].shape[-1]),
+        "seconds": elapsed,
+        "texts_per_second": len(texts) / elapsed,
+    }
+
+
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+from rag.embedder import EmbeddingClient, EmbeddingConfig
+first = EmbeddingClient(EmbeddingConfig(backend=sys.argv[1]))
+first.embed(["warm up"])
+loaded = time.perf_counter()
+second = EmbeddingClient(EmbeddingConfig(backend=sys.argv[1]))
+second.embed(["warm up"])
+shared = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "first_embed_ms": (loaded - imported) * 1000,
+    "second_client_ms": (shared - loaded) * 1000,
+    "modules": len(sys.modules),
+}}))
+"""
+
+STARTUP_MODULES = ("rag.ingest", "rag.retriever", "generator.pipeline")
+
+
+def bench_startup(backend: str, repeats: int = 3) -> Dict[str, Dict[str, float]]:
+    """Cold-start cost of each entry point, measured in fresh interpreters.
+
+    ``first_embed_ms`` includes loading the model; ``second_client_ms`` shows
+    that further clients in the process reuse it from the model registry.
+    """
+
+    root = Path(__file__).resolve().parents[1]
+    results: Dict[str, Dict[str, float]] = {}
+    for module in STARTUP_MODULES:
+        runs = [
+            json.loads(
+                subprocess.run(
+                    [sys.executable, "-c", STARTUP_SCRIPT.format(module=module), backend],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                    cwd=root,
+                ).stdout
+            )
+            for _ in range(repeats)
+        ]
+        # The fastest run is the least disturbed by other activity on the machine.
+        results[module] = {key: min(run[key] for run in runs) for key in runs[0]}
+    return results
+
+
+def bench_rerank(texts: List[str], budgets: Sequence[int], queries: int, method: str = "bm25") -> List[Dict[str, object]]:
+    """Per-query reranking latency as the stage-one candidate budget grows."""
+
+    reranker = build_reranker(RerankerConfig(enabled=True, method=method, top_k=5, cache_items=0))
+    chunks = [DocumentChunk(id=f"chunk-{row}", text=text, metadata={}) for row, text in enumerate(texts)]
+    query_texts = [" ".join(text.split()[:6]) for text in texts[:: max(len(texts) // queries, 1)][:queries]]
+    results: List[Dict[str, object]] = []
+    for budget in budgets:
+        samples = []
+        for offset, query in enumerate(query_texts):
+            start = (offset * budget) % max(len(chunks) - budget, 1)
+            candidates = chunks[start : start + budget]
+            started = time.perf_counter()
+            reranker.rerank(query, candidates)
+            samples.append(time.perf_counter() - started)
+        results.append({"method": method, "candidates": budget, **percentiles(samples)})
+    return results
+
+
+def bench_search(
+    root: Path,
+    texts: List[str],
+    sizes: Sequence[int],
+    index: str,
+    queries: int,
+    top_k: int,
+) -> List[Dict[str, object]]:
+    """Latency of ``similarity_search`` versus corpus size and filter selectivity.
+
+    Corpora are built by cycling the synthetic chunk texts; every row carries
+    ``bucket_<n>`` metadata so filters can match 100%, 10% or 1% of the store.
+    """
+
+    embedder = EmbeddingClient(EmbeddingConfig(backend="hashing"))
+    vectors = np.vstack(embedder.embed(texts))
+    query_vectors = np.vstack(embedder.embed(texts[:: max(len(texts) // queries, 1)][:queries]))
+    results: List[Dict[str, object]] = []
+    for size in sizes:
+        path = root / f"store_{index}_{size}.sqlite"
+        store = SQLiteVectorStore(VectorStoreConfig(path=path, index=index))
+        for start in range(0, size, 5000):
+            store.upsert(
+                DocumentChunk(
+                    id=f"chunk-{row}",
+                    text=texts[row % len(texts)],
+                    metadata={"doc_type": "bench", "bucket_10": str(row % 10), "bucket_100": str(row % 100)},
+                    embedding=vectors[row % len(vectors)],
+                )
+                for row in range(start, min(start + 5000, size))
+            )
+        for selectivity in SELECTIVITIES:
+            filters: Optional[Dict[str, str]] = None
+            if selectivity < 1.0:
+                filters = {f"bucket_{round(1 / selectivity)}": "0"}
+            started = time.perf_counter()
+            store.similarity_search(query_vectors[0], top_k, filters)
+            first_query = time.perf_counter() - started
+            samples = []
+            for query in query_vectors:
+                started = time.perf_counter()
+                store.similarity_search(query, top_k, filters)
+                samples.append(time.perf_counter() - started)
+            results.append(
+                {
+                    "index": index,
+                    "size": size,
+                    "selectivity": selectivity,
+                    "first_query_ms": first_query * 1000,
+                    **percentiles(samples),
+                    "peak_rss_mb": peak_rss_mb(),
+                }
+            )
+        store.close()
+    return results
+
+
+def bench_sharded_search(
+    root: Path,
+    texts: List[str],
+    size: int,
+    shard_counts: Sequence[int],
+    queries: int,
+    top_k: int,
+) -> List[Dict[str, object]]:
+    """Query latency of one matrix-indexed store against hash shards searched in parallel."""
+
+    embedder = EmbeddingClient(EmbeddingConfig(backend="hashing"))
+    vectors = np.vstack(embedder.embed(texts))
+    query_vectors = np.vstack(embedder.embed(texts[:: max(len(texts) // queries, 1)][:queries]))
+    chunks = [
+        DocumentChunk(
+            id=f"chunk-{row}",
+            text=texts[row % len(texts)],
+            metadata={"doc_type": "bench", "bucket_10": str(row % 10)},
+            embedding=vectors[row % len(vectors)],
+        )
+        for row in range(size)
+    ]
+    results: List[Dict[str, object]] = []
+    for shards in shard_counts:
+        path = root / f"sharded_{shards}_{size}.sqlite"
+        if shards <= 1:
+            store = SQLiteVectorStore(VectorStoreConfig(path=path, index="matrix"))
+        else:
+            store = ShardedVectorStore(ShardedStoreConfig(path=path, shards=shards, shard={"index": "matrix"}))
+        with store.bulk_load():
+            for start in range(0, size, 5000):
+                store.upsert(chunks[start : start + 5000])
+        store.similarity_search(query_vectors[0], top_k)
+        samples = []
+        for query in query_vectors:
+            started = time.perf_counter()
+            store.similarity_search(query, top_k)
+            samples.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        store.similarity_search_many(query_vectors, top_k)
+        batch = time.perf_counter() - started
+        results.append({"shards": shards, "size": size, **percentiles(samples), "batch_ms": batch * 1000})
+        store.close()
+    return results
+
+
+def bench_write(root: Path, texts: List[str], sizes: Sequence[int], batch_size: int = 1000) -> List[Dict[str, object]]:
+    """Upsert throughput: rollback journal, WAL, and WAL inside ``bulk_load``."""
+
+    embedder = EmbeddingClient(EmbeddingConfig(backend="hashing"))
+    vectors = np.vstack(embedder.embed(texts))
+    results: List[Dict[str, object]] = []
+    for size in sizes:
+        chunks = [
+            DocumentChunk(
+                id=f"chunk-{row}",
+                text=texts[row % len(texts)],
+                metadata={"doc_type": "bench", "source": f"file-{row // 100}", "row": str(row)},
+                embedding=vectors[row % len(vectors)],
+            )
+            for row in range(size)
+        ]
+        for mode, journal_mode, bulk in (("rollback", "delete", False), ("wal", "wal", False), ("wal_bulk", "wal", True)):
+            store = SQLiteVectorStore(VectorStoreConfig(path=root / f"write_{mode}_{size}.sqlite", journal_mode=journal_mode))
+            started = time.perf_counter()
+            with store.bulk_load() if bulk else contextlib.nullcontext():
+                for start in range(0, size, batch_size):
+                    store.upsert(chunks[start : start + batch_size])
+            elapsed = time.perf_counter() - started
+            store.close()
+            results.append(
+                {"mode": mode, "size": size, "seconds": elapsed, "chunks_per_second": size / elapsed}
+            )
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[Sequence[str]] = None) -> Dict[str, object]:
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, embedding and retrieval")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Store sizes in chunks")
+    parser.add_argument("--index", nargs="+", default=["scan", "matrix"], help="Vector index modes to compare")
+    parser.add_argument("--files-per-type", type=int, default=10)
+    parser.add_argument("--units-per-file", type=int, default=50, help="Issues, rows or sections per file")
+    parser.add_argument(
+        "--stream-sizes", type=int, nargs="+", default=[100, 400], help="PDF pages (x10 workbook rows) for the streaming loaders"
+    )
+    parser.add_argument(
+        "--chunk-megabytes", type=float, nargs="+", default=[1.0, 4.0], help="Text sizes for the chunker comparison"
+    )
+    parser.add_argument(
+        "--write-sizes", type=int, nargs="+", default=[10000, 50000], help="Chunks upserted per write-throughput run"
+    )
+    parser.add_argument(
+        "--shard-counts", type=int, nargs="+", default=[1, 4], help="Shards compared at the largest --sizes entry"
+    )
+    parser.add_argument(
+        "--template-kilobytes", type=int, nargs="+", default=[4, 256], help="Prompt template sizes for the fill comparison"
+    )
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument(
+        "--rerank-budgets", type=int, nargs="+", default=[10, 50, 100], help="Candidates reranked per query"
+    )
+    parser.add_argument("--startup-repeats", type=int, default=3, help="Fresh interpreters per startup measurement")
+    parser.add_argument("--sentence-transformer", action="store_true", help="Also time the sentence-transformer")
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        root = Path(scratch)
+        ingest = bench_ingest(root / "corpus", args.files_per_type, args.units_per_file)
+        ingest_rss = peak_rss_mb()
+        streaming = bench_streaming(root / "large", args.stream_sizes)
+        chunking = bench_chunking(args.chunk_megabytes)
+        texts = [
+            chunk.text
+            for path in sorted((root / "corpus").iterdir())
+            for chunk in load_and_chunk(path, 200, 40).chunks
+        ]
+        embedding = {"hashing": bench_embedding(texts, "hashing")}
+        if args.sentence_transformer:
+            embedding["sentence-transformers"] = bench_embedding(texts, "sentence-transformers")
+        rerank = bench_rerank(texts, args.rerank_budgets, args.queries)
+        prompt = bench_prompt(texts, args.template_kilobytes)
+        startup = {"hashing": bench_startup("hashing", args.startup_repeats)}
+        if args.sentence_transformer:
+            startup["sentence-transformers"] = bench_startup("auto", args.startup_repeats)
+        write = bench_write(root, texts, args.write_sizes)
+        sharded = bench_sharded_search(root, texts, max(args.sizes), args.shard_counts, args.queries, args.top_k)
+        search = [
+            result
+            for index in args.index
+            for result in bench_search(root, texts, args.sizes, index, args.queries, args.top_k)
+        ]
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "parameters": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "ingest": ingest,
+        "ingest_peak_rss_mb": ingest_rss,
+        "streaming": streaming,
+        "chunking": chunking,
+        "embedding": embedding,
+        "startup": startup,
+        "rerank": rerank,
+        "prompt": prompt,
+        "search": search,
+        "write": write,
+        "sharded_search": sharded,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(payload + "\n", encoding="utf-8")
+    else:
+        print(payload)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Synthetic artifact corpora for offline benchmarks."""
+from __future__ import annotations
+
+import csv
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+WORDS = (
+    "policy renewal premium claim underwriting quote broker endorsement lapse coverage "
+    "customer account payment invoice refund audit report export import validation error "
+    "timeout retry session login password token permission role admin workflow approval "
+    "deadline notification email batch schedule interface service endpoint field record"
+).split()
+STATUSES = ["To Do", "In Progress", "Done", "Blocked"]
+ISSUE_TYPES = ["Story", "Bug", "Task", "Epic"]
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(sentence(rng, rng.randint(6, 16)) for _ in range(sentences))
+
+
+def write_jira(path: Path, rng: random.Random, issues: int, project: str = "BENCH") -> None:
+    payload = {
+        "issues": [
+            {
+                "key": f"{project}-{idx}",
+                "fields": {
+                    "summary": sentence(rng, 8),
+                    "description": paragraph(rng, 4),
+                    "status": {"name": rng.choice(STATUSES)},
+                    "assignee": {"displayName": f"User {idx % 17}"},
+                    "issuetype": {"name": rng.choice(ISSUE_TYPES)},
+                },
+            }
+            for idx in range(issues)
+        ]
+    }
+    path.write_text(json.dumps(payload), encoding="utf-8")
+
+
+def write_csv(path: Path, rng: random.Random, rows: int) -> None:
+    with path.open("w", newline="", encoding="utf-8") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["id", "requirement", "priority", "owner"])
+        for idx in range(rows):
+            writer.writerow([f"REQ-{idx}", sentence(rng, 12), rng.choice(["High", "Medium", "Low"]), f"Team {idx % 5}"])
+
+
+def write_markdown(path: Path, rng: random.Random, sections: int) -> None:
+    parts: List[str] = [f"# {sentence(rng, 4)}"]
+    for idx in range(sections):
+        parts.append(f"## Section {idx}\n\n{paragraph(rng, 6)}")
+    path.write_text("\n\n".join(parts), encoding="utf-8")
+
+
+def write_html(path: Path, rng: random.Random, sections: int) -> None:
+    body = "".join(f"<h2>Section {idx}</h2><p>{paragraph(rng, 6)}</p>" for idx in range(sections))
+    path.write_text(
+        f"<html><head><style>p {{}}</style></head><body><h1>{sentence(rng, 4)}</h1>{body}</body></html>",
+        encoding="utf-8",
+    )
+
+
+def write_xlsx(path: Path, rng: random.Random, rows: int) -> None:
+    from openpyxl import Workbook
+
+    # Write-only mode streams rows to disk, so large benchmark workbooks are cheap to build.
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Requirements")
+    sheet.append(["id", "requirement", "priority", "owner"])
+    for idx in range(rows):
+        sheet.append([f"REQ-{idx}", sentence(rng, 12), rng.choice(["High", "Medium", "Low"]), f"Team {idx % 5}"])
+    workbook.save(path)
+
+
+def write_pdf(path: Path, rng: random.Random, pages: int) -> None:
+    """Write a minimal text PDF with one paragraph per page (no PDF library needed)."""
+
+    def content(text: str) -> bytes:
+        lines = [text[start : start + 90] for start in range(0, len(text), 90)]
+        body = " ".join(f"({line.replace('(', '').replace(')', '')}) Tj 0 -14 Td" for line in lines)
+        return f"BT /F1 10 Tf 40 800 Td {body} ET".encode("latin-1")
+
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for _ in range(pages):
+        stream = content(paragraph(rng, 6))
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects)
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+    with path.open("wb") as handle:
+        handle.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(handle.tell())
+            handle.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        xref = handle.tell()
+        handle.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        handle.writelines(b"%010d 00000 n \n" % offset for offset in offsets)
+        handle.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def generate_corpus(root: Path, files_per_type: int = 10, units_per_file: int = 50, seed: int = 0) -> Dict[str, List[Path]]:
+    """Write Jira JSON, CSV, Markdown and HTML artifacts under ``root``.
+
+    ``units_per_file`` is the number of issues, rows or sections per file.
+    Returns the generated paths grouped by loader kind.
+    """
+
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    writers = {
+        "jira": (".json", write_jira),
+        "csv": (".csv", write_csv),
+        "markdown": (".md", write_markdown),
+        "html": (".html", write_html),
+    }
+    corpus: Dict[str, List[Path]] = {}
+    for kind, (suffix, writer) in writers.items():
+        corpus[kind] = []
+        for idx in range(files_per_type):
+            path = root / f"{kind}_{idx}{suffix}"
+            writer(path, rng, units_per_file)
+            corpus[kind].append(path)
+    return corpus
@@ -0,0 +1,91 @@
+"""Rate limiting and retry helpers for concurrent LLM calls."""
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 3
+    backoff_seconds: float = 1.0
+    max_backoff_seconds: float = 30.0
+
+    def delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given retry attempt (1-based)."""
+
+        ceiling = min(self.max_backoff_seconds, self.backoff_seconds * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
+
+
+class RateLimiter:
+    """Token bucket shared by all workers; ``rate`` is requests per second."""
+
+    def __init__(self, rate: Optional[float], burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        if not self.rate:
+            return
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        if not self.rate:
+            return
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+def call_with_retry(func: Callable[[], T], policy: RetryPolicy, limiter: Optional[RateLimiter] = None) -> T:
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func()
+        except Exception:
+            attempt += 1
+            if attempt > policy.max_retries:
+                raise
+            time.sleep(policy.delay(attempt))
+
+
+async def call_with_retry_async(
+    func: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    limiter: Optional[RateLimiter] = None,
+) -> T:
+    attempt = 0
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async()
+        try:
+            return await func()
+        except Exception:
+            attempt += 1
+            if attempt > policy.max_retries:
+                raise
+            await asyncio.sleep(policy.delay(attempt))
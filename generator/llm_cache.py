@@ -0,0 +1,188 @@
+"""Content-addressed on-disk cache of LLM responses and their verification."""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def response_key(model_id: str, prompt: str) -> str:
+    payload = f"{model_id}\0{prompt}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+@dataclass
+class LLMCacheConfig:
+    # SQLite file holding the cache; None keeps it in memory for this process.
+    path: Optional[Path] = None
+    # Identifies the model behind llm_callable; part of every key, so a new
+    # model never gets another model's answers. None uses the callable's name.
+    model: Optional[str] = None
+    max_bytes: int = 256 << 20
+    # Responses older than this are treated as misses and purged; None keeps them.
+    max_age_seconds: Optional[float] = 30 * 24 * 3600
+
+
+@dataclass
+class LLMCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Calls saved because an identical prompt was already in flight.
+    coalesced: int = 0
+    verifications_reused: int = 0
+    expired: int = 0
+    evicted: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "verifications_reused": self.verifications_reused,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class LLMCache:
+    """Responses keyed by ``sha256(model, prompt)`` in SQLite.
+
+    Entries expire ``max_age_seconds`` after they were stored, and once the
+    stored text exceeds ``max_bytes`` the least recently used entries are
+    dropped down to 90% of the limit. A verification result is kept next to
+    the response it checked, tagged with the verifier that produced it.
+    Safe to share between threads.
+    """
+
+    def __init__(self, config: LLMCacheConfig, clock=time.time) -> None:
+        self.config = config
+        self.stats = LLMCacheStats()
+        self._clock = clock
+        self._last_tick = 0.0
+        self._lock = threading.Lock()
+        if config.path is not None:
+            Path(config.path).parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(config.path or ":memory:", check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                verifier TEXT,
+                verification TEXT,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created)")
+        self._stored_bytes = int(self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0])
+        with self._lock:
+            self._expire()
+            self._connection.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self._is_expired(row[1]):
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._stored_bytes -= len(row[0].encode("utf-8"))
+                self.stats.expired += 1
+                row = None
+            if row is None:
+                self._connection.commit()
+                self.stats.misses += 1
+                return None
+            self._connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (self._tick(), key))
+            self._connection.commit()
+            self.stats.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            now = self._tick()
+            previous = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._connection.execute(
+                """
+                INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, response, size, now, now),
+            )
+            self._stored_bytes += size - (previous[0] if previous else 0)
+            if self._stored_bytes > self.config.max_bytes:
+                self._expire()
+                self._evict()
+            self._connection.commit()
+
+    def get_verification(self, key: str, response: str, verifier: str) -> Optional[Dict[str, str]]:
+        """The stored verification of ``response`` by ``verifier``, if that is what the entry holds."""
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT verification FROM responses WHERE key = ? AND response = ? AND verifier = ?",
+                (key, response, verifier),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        self.stats.verifications_reused += 1
+        return json.loads(row[0])
+
+    def put_verification(self, key: str, response: str, verifier: str, verification: Dict[str, str]) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE responses SET verifier = ?, verification = ? WHERE key = ? AND response = ?",
+                (verifier, json.dumps(verification), key, response),
+            )
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _tick(self) -> float:
+        # Strictly increasing so back-to-back writes keep a well-defined LRU order.
+        self._last_tick = max(self._clock(), self._last_tick + 1e-6)
+        return self._last_tick
+
+    def _is_expired(self, created: float) -> bool:
+        return self.config.max_age_seconds is not None and self._clock() - created > self.config.max_age_seconds
+
+    def _expire(self) -> None:
+        if self.config.max_age_seconds is None:
+            return
+        cutoff = self._clock() - self.config.max_age_seconds
+        removed = self._connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created < ?", (cutoff,)
+        ).fetchone()
+        self._connection.execute("DELETE FROM responses WHERE created < ?", (cutoff,))
+        self.stats.expired += removed[0]
+        self._stored_bytes -= removed[1]
+
+    def _evict(self) -> None:
+        target = int(self.config.max_bytes * 0.9)
+        remaining = self._stored_bytes
+        evicted = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if remaining <= target:
+                break
+            evicted.append((key,))
+            remaining -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.stats.evicted += len(evicted)
+        self._stored_bytes = remaining
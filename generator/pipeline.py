@@ -1,14 +1,23 @@
 """End-to-end orchestration for the test case generator."""
 from __future__ import annotations
 
-from dataclasses import dataclass
+import asyncio
+import inspect
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from itertools import islice
 from pathlib import Path
-from typing import Callable, Dict, Iterable, List, Optional
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from rag.models import DocumentChunk
 from rag.retriever import RetrieverConfig, SemanticRetriever
-from rag.reranker import IdentityReranker, RerankerConfig
+from rag.reranker import RerankerConfig, build_reranker
 
+from generator.concurrency import RateLimiter, RetryPolicy, call_with_retry, call_with_retry_async
+from generator.llm_cache import LLMCache, LLMCacheConfig, LLMCacheStats, response_key
+from generator.prompt import AssembledPrompt, CompiledTemplate, PackedContext, pack_context
 from generator.verifier import Verifier
 
 
@@ -16,6 +25,22 @@ from generator.verifier import Verifier
 class PromptConfig:
     master_prompt_path: Path
     max_context_snippets: int = 5
+    # Tokens the retrieved context may use; None leaves only the snippet limit.
+    context_tokens: Optional[int] = None
+    # Limit for the whole prompt; the context gets what the template and input leave.
+    max_prompt_tokens: Optional[int] = None
+    # Hugging Face tokenizer that counts tokens, or None for the fast estimate.
+    tokenizer: Optional[str] = None
+
+
+@dataclass
+class BatchConfig:
+    """Controls ``generate_many``: LLM concurrency, rate limit and retries."""
+
+    max_concurrency: int = 8
+    requests_per_second: Optional[float] = None
+    retrieval_batch_size: int = 32
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
 
 
 @dataclass
@@ -23,6 +48,14 @@ class GeneratorConfig:
     retriever: RetrieverConfig
     prompt: PromptConfig
     reranker: Optional[RerankerConfig] = None
+    batch: BatchConfig = field(default_factory=BatchConfig)
+    # Response cache; None calls the LLM for every prompt.
+    llm_cache: Optional[LLMCacheConfig] = None
+
+
+def _qualified_name(target: Any) -> str:
+    named = target if hasattr(target, "__qualname__") else type(target)
+    return f"{named.__module__}.{named.__qualname__}"
 
 
 class PromptBuilder:
@@ -31,34 +64,45 @@ class PromptBuilder:
     def __init__(self, config: PromptConfig) -> None:
         self.config = config
         self.template = Path(config.master_prompt_path).read_text(encoding="utf-8")
+        self.compiled = CompiledTemplate(self.template, config.tokenizer)
 
     def build(
         self,
         user_input: Dict[str, str],
         context_chunks: Iterable[DocumentChunk],
     ) -> str:
-        context_lines: List[str] = []
-        for chunk in list(context_chunks)[: self.config.max_context_snippets]:
-            context_lines.append(
-                "\n".join(
-                    [
-                        "<context>",
-                        f"source: {chunk.metadata.get('source', 'unknown')}",
-                        f"doc_type: {chunk.metadata.get('doc_type', 'unknown')}",
-                        chunk.text,
-                        "</context>",
-                    ]
-                )
-            )
-        context_block = "\n\n".join(context_lines) if context_lines else "<context>No supporting documents retrieved.</context>"
-        payload = {
-            **user_input,
-            "retrieved_context": context_block,
-        }
-        prompt = self.template
-        for key, value in payload.items():
-            prompt = prompt.replace(f"{{{{{key}}}}}", value)
-        return prompt
+        return self.assemble(user_input, context_chunks).text
+
+    def assemble(
+        self,
+        user_input: Dict[str, str],
+        context_chunks: Iterable[DocumentChunk],
+    ) -> AssembledPrompt:
+        """Render the prompt with as much ranked context as the token budget allows.
+
+        Context only counts against the budget where the template renders it:
+        once per ``{{retrieved_context}}`` placeholder, and not at all (nothing
+        is packed) in a template without one.
+        """
+
+        payload = {key: value for key, value in user_input.items() if key != "retrieved_context"}
+        fixed_tokens = self.compiled.count_tokens(payload)
+        copies = self.compiled.placeholders.count("retrieved_context")
+        if not copies:
+            context_chunks = list(context_chunks)
+            context = PackedContext(text="", tokens=0, dropped=len(context_chunks))
+            return AssembledPrompt(text=self.compiled.render(payload), prompt_tokens=fixed_tokens, context=context)
+        budget = self.config.context_tokens
+        if self.config.max_prompt_tokens is not None:
+            room = max(self.config.max_prompt_tokens - fixed_tokens, 0) // copies
+            budget = room if budget is None else min(budget, room)
+        context = pack_context(context_chunks, budget, self.config.max_context_snippets, self.config.tokenizer)
+        return AssembledPrompt(
+            text=self.compiled.render({**payload, "retrieved_context": context.text}),
+            prompt_tokens=fixed_tokens + copies * context.tokens,
+            context=context,
+            context_budget=budget,
+        )
 
 
 class TestCaseGenerator:
@@ -67,31 +111,262 @@ class TestCaseGenerator:
         config: GeneratorConfig,
         llm_callable: Callable[[str], str],
         verifier: Optional[Verifier] = None,
+        llm_cache: Optional[LLMCache] = None,
     ) -> None:
         self.config = config
         self.llm_callable = llm_callable
         self.retriever = SemanticRetriever(config.retriever)
         reranker_config = config.reranker or RerankerConfig(enabled=False)
-        self.reranker = IdentityReranker() if not reranker_config.enabled else IdentityReranker()
+        keep = reranker_config.top_k or config.retriever.top_k
+        self.reranker = build_reranker(replace(reranker_config, top_k=keep))
+        # Stage one over-fetches candidates for the reranker to narrow down to ``keep``.
+        self.candidate_k = max(reranker_config.candidates, keep) if reranker_config.enabled else None
         self.prompt_builder = PromptBuilder(config.prompt)
         self.verifier = verifier
+        # A cache passed in is shared (e.g. across server reloads) and closed
+        # by its owner; one built from ``config.llm_cache`` is closed by close().
+        self._owns_llm_cache = llm_cache is None and config.llm_cache is not None
+        self.llm_cache = LLMCache(config.llm_cache) if self._owns_llm_cache else llm_cache
+        self.llm_stats = self.llm_cache.stats if self.llm_cache is not None else LLMCacheStats()
+        cache_model = self.llm_cache.config.model if self.llm_cache is not None else None
+        self.model_id = cache_model or _qualified_name(llm_callable)
+        # Calls in flight by response key, shared by identical prompts.
+        self._calls: Dict[str, Future] = {}
+        self._calls_lock = threading.Lock()
 
     def generate(self, user_input: Dict[str, str]) -> Dict[str, str]:
+        query, filters = self.retrieval_query(user_input)
+        retrieved = self.retriever.retrieve(query, self.candidate_k, filters)
+        prompt, reranked = self.prepare(user_input, query, retrieved)
+        key = response_key(self.model_id, prompt.text)
+        output = self._cached(key)
+        return self._result(prompt, self._call(key, prompt.text) if output is None else output, reranked)
+
+    def generate_many(
+        self,
+        user_inputs: Iterable[Dict[str, str]],
+        batch: Optional[BatchConfig] = None,
+    ) -> Iterator[Tuple[int, Dict[str, str]]]:
+        """Generate for many inputs, yielding ``(input index, result)`` as calls complete.
+
+        Retrieval runs in batches of ``retrieval_batch_size`` through
+        ``retrieve_many`` and LLM calls run on a thread pool bounded by
+        ``max_concurrency``, throttled to ``requests_per_second`` and retried
+        with exponential backoff. An input whose call still fails gets a result
+        with an ``error`` entry instead of aborting the batch. Prompts answered
+        by the response cache skip the LLM, and identical prompts share one call.
+        """
+
+        batch = batch or self.config.batch
+        limiter = RateLimiter(batch.requests_per_second)
+        max_in_flight = max(batch.max_concurrency, 1)
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            in_flight: Dict[Future, List[Tuple[int, AssembledPrompt, List[DocumentChunk]]]] = {}
+
+            def drain(limit: int) -> Iterator[Tuple[int, Dict[str, str]]]:
+                while len(in_flight) > limit:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        for index, prompt, reranked in in_flight.pop(future):
+                            yield index, self.settle(future, prompt, reranked)
+
+            for index, prompt, reranked in self._prepared_batches(user_inputs, batch.retrieval_batch_size):
+                future = self.submit(executor, prompt, batch.retry, limiter)
+                in_flight.setdefault(future, []).append((index, prompt, reranked))
+                yield from drain(2 * max_in_flight)
+            yield from drain(0)
+
+    async def agenerate_many(
+        self,
+        user_inputs: Iterable[Dict[str, str]],
+        batch: Optional[BatchConfig] = None,
+    ) -> AsyncIterator[Tuple[int, Dict[str, str]]]:
+        """Asyncio variant of :meth:`generate_many`.
+
+        ``llm_callable`` may be a coroutine function; plain callables are run in
+        the default executor so they do not block the event loop.
+        """
+
+        batch = batch or self.config.batch
+        limiter = RateLimiter(batch.requests_per_second)
+        semaphore = asyncio.Semaphore(max(batch.max_concurrency, 1))
+        is_async = inspect.iscoroutinefunction(self.llm_callable)
+
+        async def complete(prompt: str) -> str:
+            if is_async:
+                return await self.llm_callable(prompt)
+            return await asyncio.get_running_loop().run_in_executor(None, self.llm_callable, prompt)
+
+        calls: Dict[str, asyncio.Future] = {}
+
+        async def call(key: str, prompt: str) -> str:
+            async with semaphore:
+                output = await call_with_retry_async(lambda: complete(prompt), batch.retry, limiter)
+            self._store(key, output)
+            return output
+
+        async def run(index: int, prompt: AssembledPrompt, reranked: List[DocumentChunk]) -> Tuple[int, Dict[str, str]]:
+            key = response_key(self.model_id, prompt.text)
+            try:
+                if key in calls:
+                    self.llm_stats.coalesced += 1
+                    output = await calls[key]
+                else:
+                    output = self._cached(key)
+                    if output is None:
+                        calls[key] = asyncio.ensure_future(call(key, prompt.text))
+                        output = await calls[key]
+            except Exception as exc:  # noqa: BLE001 - reported per input
+                return index, self._error_result(prompt, exc, reranked)
+            return index, self._result(prompt, output, reranked)
+
+        pending: set = set()
+        for index, prompt, reranked in self._prepared_batches(user_inputs, batch.retrieval_batch_size):
+            pending.add(asyncio.ensure_future(run(index, prompt, reranked)))
+            if len(pending) >= 2 * batch.max_concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+
+    # Steps of :meth:`generate` for callers that schedule retrieval and LLM
+    # calls themselves, such as the generation service:
+    # retrieval_query -> retrieve -> prepare -> submit -> settle.
+
+    def retrieval_query(self, user_input: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, str]]]:
+        """The search query and metadata filters for ``user_input``."""
+
         query = user_input.get("acceptance_criteria") or user_input.get("summary") or ""
         filters = user_input.get('filters') if isinstance(user_input.get('filters'), dict) else None
-        retrieved = self.retriever.retrieve(query, filters=filters)
-        reranked = self.reranker.rerank(retrieved)
-        prompt = self.prompt_builder.build(user_input, reranked)
-        llm_output = self.llm_callable(prompt)
+        return query, filters
+
+    def prepare(
+        self,
+        user_input: Dict[str, str],
+        query: str,
+        retrieved: List[DocumentChunk],
+    ) -> Tuple[AssembledPrompt, List[DocumentChunk]]:
+        """Rerank chunks retrieved for ``query`` and assemble the prompt."""
+
+        reranked = self.reranker.rerank(query, retrieved)
+        return self.prompt_builder.assemble(user_input, reranked), reranked
+
+    def submit(self, executor: ThreadPoolExecutor, prompt: AssembledPrompt, retry: RetryPolicy, limiter: RateLimiter) -> Future:
+        """Future output for ``prompt``: a cached response, an identical call in flight, or a new call.
+
+        The call runs on ``executor`` with ``retry`` and ``limiter``; pass the
+        future to :meth:`settle` for the result.
+        """
+
+        key = response_key(self.model_id, prompt.text)
+        with self._calls_lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.llm_stats.coalesced += 1
+                return future
+            output = self._cached(key)
+            if output is not None:
+                future = Future()
+                future.set_result(output)
+                return future
+            future = executor.submit(call_with_retry, lambda: self._call(key, prompt.text), retry, limiter)
+            self._calls[key] = future
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future
+
+    def settle(self, future: Future, prompt: AssembledPrompt, reranked: List[DocumentChunk]) -> Dict[str, str]:
+        """Result for a :meth:`submit` future, verified, or with an ``error`` entry if the call failed."""
+
+        try:
+            return self._result(prompt, future.result(), reranked)
+        except Exception as exc:  # noqa: BLE001 - reported per input
+            return self._error_result(prompt, exc, reranked)
+
+    def _prepared_batches(
+        self,
+        user_inputs: Iterable[Dict[str, str]],
+        batch_size: int,
+    ) -> Iterator[Tuple[int, AssembledPrompt, List[DocumentChunk]]]:
+        """Retrieve for inputs in batches and yield ready-to-send prompts.
+
+        ``retrieve_many`` applies one filter set to a whole batch, so inputs are
+        grouped by their filters within each batch.
+        """
+
+        numbered = enumerate(user_inputs)
+        while True:
+            window = list(islice(numbered, max(batch_size, 1)))
+            if not window:
+                return
+            groups: Dict[str, List[Tuple[int, Dict[str, str], str]]] = {}
+            group_filters: Dict[str, Optional[Dict[str, str]]] = {}
+            for index, user_input in window:
+                query, filters = self.retrieval_query(user_input)
+                key = json.dumps(filters, sort_keys=True, default=str)
+                groups.setdefault(key, []).append((index, user_input, query))
+                group_filters[key] = filters
+            prepared: List[Tuple[int, AssembledPrompt, List[DocumentChunk]]] = []
+            for key, members in groups.items():
+                queries = [query for _, _, query in members]
+                results = self.retriever.retrieve_many(queries, self.candidate_k, group_filters[key])
+                for (index, user_input, _), reranked in zip(members, self.reranker.rerank_many(queries, results)):
+                    prepared.append((index, self.prompt_builder.assemble(user_input, reranked), reranked))
+            prepared.sort(key=lambda item: item[0])
+            yield from prepared
+
+    def _forget(self, key: str, future: Future) -> None:
+        with self._calls_lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def _cached(self, key: str) -> Optional[str]:
+        return self.llm_cache.get(key) if self.llm_cache is not None else None
+
+    def _call(self, key: str, prompt: str) -> str:
+        output = self.llm_callable(prompt)
+        self._store(key, output)
+        return output
+
+    def _store(self, key: str, output: str) -> None:
+        if self.llm_cache is not None:
+            self.llm_cache.put(key, self.model_id, output)
+
+    def _result(self, prompt: AssembledPrompt, llm_output: str, reranked: List[DocumentChunk]) -> Dict[str, str]:
         result = {
-            "prompt": prompt,
+            "prompt": prompt.text,
             "raw_output": llm_output,
             "retrieved_chunks": [chunk.metadata for chunk in reranked],
+            "token_usage": prompt.usage(),
         }
         if self.verifier is not None:
-            verification = self.verifier.verify(llm_output)
-            result["verification"] = verification.to_dict()
+            result["verification"] = self._verification(prompt, llm_output)
         return result
 
+    def _verification(self, prompt: AssembledPrompt, llm_output: str) -> Dict[str, str]:
+        """Verify ``llm_output``, reusing the verdict cached with that exact response."""
+
+        if self.llm_cache is None:
+            return self.verifier.verify(llm_output).to_dict()
+        key = response_key(self.model_id, prompt.text)
+        verifier = _qualified_name(self.verifier)
+        verification = self.llm_cache.get_verification(key, llm_output, verifier)
+        if verification is None:
+            verification = self.verifier.verify(llm_output).to_dict()
+            self.llm_cache.put_verification(key, llm_output, verifier, verification)
+        return verification
+
+    def _error_result(self, prompt: AssembledPrompt, error: Exception, reranked: List[DocumentChunk]) -> Dict[str, str]:
+        return {
+            "prompt": prompt.text,
+            "error": f"{type(error).__name__}: {error}",
+            "retrieved_chunks": [chunk.metadata for chunk in reranked],
+            "token_usage": prompt.usage(),
+        }
+
     def close(self) -> None:
         self.retriever.close()
+        if self._owns_llm_cache:
+            self.llm_cache.close()
@@ -0,0 +1,170 @@
+"""Compiled prompt templates and token-budgeted context packing."""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from rag.ingestion.chunker import count_tokens
+from rag.models import DocumentChunk
+
+PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+NO_CONTEXT = "<context>No supporting documents retrieved.</context>"
+# Metadata that differs between windows cut from the same record.
+WINDOW_KEYS = frozenset({"chunk_index", "char_start", "char_end", "section", "heading_path", "duplicate_sources"})
+
+
+class CompiledTemplate:
+    """A template split once into literal text and ``{{name}}`` placeholders.
+
+    Rendering is a single join over the segments, so its cost grows with the
+    template and payload, not with the number of payload keys. The literal
+    text is token-counted once. Placeholders without a value are left as is.
+    """
+
+    def __init__(self, template: str, tokenizer: Optional[str] = None) -> None:
+        parts = PLACEHOLDER.split(template)
+        self.literals: List[str] = parts[0::2]
+        self.placeholders: List[str] = parts[1::2]
+        self.tokenizer = tokenizer
+        self.literal_tokens = sum(count_tokens(literal, tokenizer) for literal in self.literals if literal)
+
+    def render(self, payload: Mapping[str, Any]) -> str:
+        pieces = [self.literals[0]]
+        for name, literal in zip(self.placeholders, self.literals[1:]):
+            value = payload.get(name)
+            pieces.append(f"{{{{{name}}}}}" if value is None else str(value))
+            pieces.append(literal)
+        return "".join(pieces)
+
+    def count_tokens(self, payload: Mapping[str, Any]) -> int:
+        """Tokens of the rendered template, counting only placeholders ``payload`` fills."""
+
+        return self.literal_tokens + sum(
+            count_tokens(str(payload[name]), self.tokenizer) for name in self.placeholders if payload.get(name) is not None
+        )
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    # Chunks as they appear in the prompt; overlapping windows are trimmed.
+    chunks: List[DocumentChunk] = field(default_factory=list)
+    # Candidates left out by the budget, the snippet limit or deduplication.
+    dropped: int = 0
+
+
+@dataclass
+class AssembledPrompt:
+    text: str
+    prompt_tokens: int
+    context: PackedContext
+    context_budget: Optional[int] = None
+
+    def usage(self) -> Dict[str, Optional[int]]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "context_tokens": self.context.tokens,
+            "context_budget": self.context_budget,
+            "snippets": len(self.context.chunks),
+            "dropped": self.context.dropped,
+        }
+
+
+def context_block(chunk: DocumentChunk) -> str:
+    return "\n".join(
+        [
+            "<context>",
+            f"source: {chunk.metadata.get('source', 'unknown')}",
+            f"doc_type: {chunk.metadata.get('doc_type', 'unknown')}",
+            chunk.text,
+            "</context>",
+        ]
+    )
+
+
+def _record_key(chunk: DocumentChunk) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in chunk.metadata.items() if key not in WINDOW_KEYS))
+
+
+def _uncovered(chunk: DocumentChunk, covered: List[Tuple[int, int]]) -> Optional[DocumentChunk]:
+    """``chunk`` without the part of its record already in the prompt; None if nothing is left.
+
+    Offsets index the record's text and the chunk text ends with that span (a
+    repeated heading may precede it). A chunk with text left on both sides of
+    a covered span is kept whole.
+    """
+
+    try:
+        start, end = int(chunk.metadata["char_start"]), int(chunk.metadata["char_end"])
+    except (KeyError, ValueError):
+        return chunk
+    gaps = [(start, end)]
+    for covered_start, covered_end in covered:
+        gaps = [
+            piece
+            for gap_start, gap_end in gaps
+            for piece in ((gap_start, min(gap_end, covered_start)), (max(gap_start, covered_end), gap_end))
+            if piece[0] < piece[1]
+        ]
+    if not gaps:
+        return None
+    if len(gaps) > 1 or gaps[0] == (start, end) or len(chunk.text) < end - start:
+        return chunk
+    (begin, stop), = gaps
+    body_start = len(chunk.text) - (end - start)
+    body = chunk.text[body_start + begin - start : body_start + stop - start]
+    if not body.strip():
+        return None
+    # Cuts fall on the whitespace between windows; keep offsets on the visible text.
+    begin += len(body) - len(body.lstrip())
+    stop -= len(body) - len(body.rstrip())
+    text = chunk.text[:body_start] + body.strip()
+    metadata = {**chunk.metadata, "char_start": str(begin), "char_end": str(stop)}
+    return DocumentChunk(id=chunk.id, text=text, metadata=metadata, embedding=chunk.embedding)
+
+
+def pack_context(
+    chunks: Iterable[DocumentChunk],
+    budget: Optional[int] = None,
+    max_snippets: Optional[int] = None,
+    tokenizer: Optional[str] = None,
+) -> PackedContext:
+    """Fill up to ``budget`` tokens with context blocks, best-ranked chunks first.
+
+    A chunk that does not fit is skipped in favour of smaller, lower-ranked
+    ones. Windows of a record that overlap text already packed from the same
+    source are trimmed to their new text or dropped, and repeated texts from
+    one source are packed once.
+    """
+
+    candidates = list(chunks)
+    packed: List[DocumentChunk] = []
+    blocks: List[str] = []
+    covered: Dict[Tuple[Tuple[str, str], ...], List[Tuple[int, int]]] = {}
+    seen: Set[Tuple[str, str]] = set()
+    used = 0
+    for chunk in candidates:
+        if max_snippets is not None and len(packed) >= max_snippets:
+            break
+        key = _record_key(chunk)
+        trimmed = _uncovered(chunk, covered.get(key, []))
+        if trimmed is None:
+            continue
+        source = str(chunk.metadata.get("source", ""))
+        if (source, chunk.text.strip()) in seen or (source, trimmed.text.strip()) in seen:
+            continue
+        block = context_block(trimmed)
+        tokens = count_tokens(block, tokenizer)
+        if budget is not None and used + tokens > budget:
+            continue
+        used += tokens
+        seen.update({(source, chunk.text.strip()), (source, trimmed.text.strip())})
+        packed.append(trimmed)
+        blocks.append(block)
+        if "char_start" in trimmed.metadata and "char_end" in trimmed.metadata:
+            covered.setdefault(key, []).append((int(trimmed.metadata["char_start"]), int(trimmed.metadata["char_end"])))
+    if not blocks:
+        return PackedContext(text=NO_CONTEXT, tokens=count_tokens(NO_CONTEXT, tokenizer), dropped=len(candidates))
+    return PackedContext(text="\n\n".join(blocks), tokens=used, chunks=packed, dropped=len(candidates) - len(packed))
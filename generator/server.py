@@ -0,0 +1,477 @@
+"""Long-running retrieval and generation service.
+
+Keeps the embedding model, SQLite connection, vector index and prompt template
+warm across requests so CI jobs can call one local process instead of paying
+the startup cost on every run::
+
+    python -m generator.server --config config/rag.yml --port 8765
+    python -m generator.server --config config/rag.yml --socket /tmp/testgen.sock
+
+Endpoints (JSON in, JSON out):
+
+* ``POST /retrieve`` ``{"query": str, "top_k"?: int, "filters"?: {...}}``
+* ``POST /retrieve_many`` ``{"queries": [str], "top_k"?: int, "filters"?: {...}}``
+* ``POST /generate`` ``{"input": {...}}`` or ``{"inputs": [{...}]}``
+* ``POST /reload`` rebuilds the generator; ``GET /health`` reports counters.
+
+All SQLite and embedding work happens on one retrieval thread that coalesces
+concurrent queries into a single ``retrieve_many`` call; LLM calls and
+verification run on a bounded worker pool.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import queue
+import signal
+import socketserver
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rag.embedder import EmbeddingConfig
+from rag.models import DocumentChunk
+from rag.reranker import RerankerConfig
+from rag.retriever import RetrieverConfig
+from rag.sharded_store import store_config
+
+from generator.concurrency import RateLimiter
+from generator.llm_cache import LLMCache, LLMCacheConfig
+from generator.pipeline import BatchConfig, GeneratorConfig, PromptConfig, TestCaseGenerator
+from generator.verifier import JsonSchemaVerifier
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    # Serve on a Unix domain socket instead of TCP when set.
+    socket_path: Optional[Path] = None
+    # Concurrent queries are coalesced into batches of at most ``max_batch``,
+    # waiting up to ``max_wait_ms`` after the first one for others to arrive.
+    max_batch: int = 64
+    max_wait_ms: float = 5.0
+    # Seconds between checks of the store file and prompt template for changes.
+    watch_interval: float = 2.0
+
+
+def stub_llm(prompt: str) -> str:
+    """Deterministic local stand-in for an LLM, useful for CI and smoke tests."""
+
+    return json.dumps({"test_cases": [], "model": "stub", "prompt_characters": len(prompt)})
+
+
+def load_callable(target: str) -> Callable[[str], str]:
+    """Resolve a ``package.module:function`` string to the LLM callable it names."""
+
+    module_name, _, attribute = target.partition(":")
+    if not attribute:
+        raise ValueError(f"Expected 'module:function', got {target!r}")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def chunk_payload(chunk: DocumentChunk) -> Dict[str, Any]:
+    return {"id": chunk.id, "text": chunk.text, "metadata": chunk.metadata}
+
+
+class QueryCoalescer:
+    """Owns the generator and runs all retrieval on a single thread.
+
+    Queries submitted from request threads queue up; the retrieval thread takes
+    the first one, waits briefly for more, and answers each group sharing
+    ``(top_k, filters)`` with one ``retrieve_many`` call, i.e. one embedding
+    batch and one scoring pass. Owning the generator on one thread also keeps
+    the SQLite connections on the thread that opened them.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], TestCaseGenerator],
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+        watch_interval: float = 2.0,
+    ) -> None:
+        self.factory = factory
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max_wait_ms / 1000
+        self.watch_interval = watch_interval
+        self.batches = 0
+        self.queries = 0
+        self.reloads = 0
+        self._queue: "queue.Queue[Optional[Tuple[Any, ...]]]" = queue.Queue()
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self.generator: Optional[TestCaseGenerator] = None
+        self._fingerprint: Tuple[Any, ...] = ()
+        self._thread = threading.Thread(target=self._run, name="retrieval", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def retrieve(self, query: str, top_k: Optional[int] = None, filters: Optional[dict] = None) -> "Future[List[DocumentChunk]]":
+        future: "Future[List[DocumentChunk]]" = Future()
+        self._queue.put(("query", query, top_k, filters, future))
+        return future
+
+    def call(self, function: Callable[[TestCaseGenerator], Any]) -> Future:
+        """Run ``function(generator)`` on the retrieval thread, between batches."""
+
+        future: Future = Future()
+        self._queue.put(("call", function, future))
+        return future
+
+    def reload(self) -> Future:
+        """Swap in a freshly built generator once queued queries have been answered."""
+
+        future: Future = Future()
+        self._queue.put(("reload", future))
+        return future
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            self._load()
+        except BaseException as exc:  # noqa: BLE001 - re-raised in the constructor
+            self._error = exc
+            self._ready.set()
+            return
+        self._ready.set()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.watch_interval)
+            except queue.Empty:
+                self._reload_if_changed()
+                continue
+            if item is None:
+                break
+            if item[0] == "query":
+                self._answer(self._gather(item))
+            elif item[0] == "call":
+                _, function, future = item
+                self._settle(future, lambda: function(self.generator))
+            else:
+                self._settle(item[1], self._load)
+            self._reload_if_changed()
+        if self.generator is not None:
+            self.generator.close()
+
+    def _gather(self, first: Tuple[Any, ...]) -> List[Tuple[Any, ...]]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is None or item[0] != "query":
+                # Control items keep their place: answer this batch first.
+                self._requeue_front(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _requeue_front(self, item: Optional[Tuple[Any, ...]]) -> None:
+        with self._queue.mutex:
+            self._queue.queue.appendleft(item)
+            self._queue.not_empty.notify()
+
+    def _answer(self, batch: List[Tuple[Any, ...]]) -> None:
+        groups: Dict[str, List[Tuple[Any, ...]]] = {}
+        for item in batch:
+            _, _, top_k, filters, _ = item
+            groups.setdefault(json.dumps([top_k, filters], sort_keys=True, default=str), []).append(item)
+        for members in groups.values():
+            _, _, top_k, filters, _ = members[0]
+            live = [item for item in members if item[4].set_running_or_notify_cancel()]
+            if not live:
+                continue
+            try:
+                results = self.generator.retriever.retrieve_many([item[1] for item in live], top_k, filters)
+            except Exception as exc:  # noqa: BLE001 - reported to every caller in the group
+                for item in live:
+                    item[4].set_exception(exc)
+                continue
+            for item, result in zip(live, results):
+                item[4].set_result(result)
+            self.batches += 1
+            self.queries += len(live)
+
+    def _settle(self, future: Future, function: Callable[[], Any]) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function())
+        except Exception as exc:  # noqa: BLE001 - reported to the caller
+            future.set_exception(exc)
+
+    def _load(self) -> None:
+        generator = self.factory()
+        previous, self.generator = self.generator, generator
+        self._fingerprint = self._current_fingerprint()
+        if previous is not None:
+            # Requests already past retrieval only use the old generator's prompt
+            # builder and verifier, which do not need its connections.
+            previous.close()
+            self.reloads += 1
+
+    def _current_fingerprint(self) -> Tuple[Any, ...]:
+        """State the warm generator was built from.
+
+        The store's generation and, for a sharded store, its catalog version
+        change with every write and routing change, including ones made by
+        other processes. Those writes keep the file's inode, so the inode only
+        catches a store that was replaced, e.g. a rebuilt store renamed into
+        place, which the open connection would never see. The template's inode
+        and mtime catch prompt edits.
+        """
+
+        config = self.generator.config
+        store = self.generator.retriever.vector_store
+        try:
+            store_inode = os.stat(config.retriever.vector_store.path).st_ino
+            template = os.stat(config.prompt.master_prompt_path)
+            generation = store.generation
+            catalog_version = getattr(store, "catalog_version", None)
+        except (OSError, sqlite3.Error):
+            return ()
+        return (store_inode, generation, catalog_version, template.st_ino, template.st_mtime_ns)
+
+    def _reload_if_changed(self) -> None:
+        if self._current_fingerprint() == self._fingerprint:
+            return
+        logger.info("Store or prompt template changed; reloading")
+        try:
+            self._load()
+        except Exception:  # noqa: BLE001 - keep serving with the previous state
+            logger.exception("Reload failed; keeping the previous generator")
+            self._fingerprint = self._current_fingerprint()
+
+
+class GenerationService:
+    """Request handling shared by the HTTP and Unix-socket front ends."""
+
+    def __init__(
+        self,
+        factory: Callable[[], TestCaseGenerator],
+        config: ServerConfig,
+        batch: Optional[BatchConfig] = None,
+    ) -> None:
+        self.config = config
+        self.coalescer = QueryCoalescer(factory, config.max_batch, config.max_wait_ms, config.watch_interval)
+        self.batch = batch or self.coalescer.generator.config.batch
+        self.limiter = RateLimiter(self.batch.requests_per_second)
+        self.workers = ThreadPoolExecutor(max_workers=max(self.batch.max_concurrency, 1), thread_name_prefix="llm")
+
+    def retrieve(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        chunks = self.coalescer.retrieve(body["query"], body.get("top_k"), body.get("filters")).result()
+        return {"chunks": [chunk_payload(chunk) for chunk in chunks]}
+
+    def retrieve_many(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        futures = [self.coalescer.retrieve(query, body.get("top_k"), body.get("filters")) for query in body["queries"]]
+        return {"results": [[chunk_payload(chunk) for chunk in future.result()] for future in futures]}
+
+    def generate(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body["inputs"] if "inputs" in body else [body["input"]]
+        generator = self.coalescer.generator
+        retrievals = []
+        for user_input in inputs:
+            query, filters = generator.retrieval_query(user_input)
+            retrievals.append((query, self.coalescer.retrieve(query, generator.candidate_k, filters)))
+        pending = []
+        for user_input, (query, retrieval) in zip(inputs, retrievals):
+            prompt, reranked = generator.prepare(user_input, query, retrieval.result())
+            future = generator.submit(self.workers, prompt, self.batch.retry, self.limiter)
+            pending.append((future, prompt, reranked))
+        results = [generator.settle(future, prompt, reranked) for future, prompt, reranked in pending]
+        return {"results": results} if "inputs" in body else results[0]
+
+    def reload(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        self.coalescer.reload().result()
+        return self.health()
+
+    def health(self, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        generation, cache_stats, llm_stats = self.coalescer.call(
+            lambda generator: (
+                generator.retriever.vector_store.generation,
+                generator.retriever.cache_stats().to_dict(),
+                generator.llm_stats.to_dict(),
+            )
+        ).result()
+        return {
+            "status": "ok",
+            "generation": generation,
+            "retrieval_cache": cache_stats,
+            "llm_cache": llm_stats,
+            "reloads": self.coalescer.reloads,
+            "queries": self.coalescer.queries,
+            "batches": self.coalescer.batches,
+        }
+
+    def routes(self) -> Dict[Tuple[str, str], Callable[[Dict[str, Any]], Dict[str, Any]]]:
+        return {
+            ("POST", "/retrieve"): self.retrieve,
+            ("POST", "/retrieve_many"): self.retrieve_many,
+            ("POST", "/generate"): self.generate,
+            ("POST", "/reload"): self.reload,
+            ("GET", "/health"): self.health,
+        }
+
+    def close(self) -> None:
+        self.workers.shutdown(wait=True)
+        self.coalescer.close()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str) -> None:
+        route = self.server.service.routes().get((method, self.path.split("?", 1)[0]))
+        if route is None:
+            self._reply(404, {"error": f"No route for {method} {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            self._reply(200, route(body))
+        except (KeyError, TypeError, ValueError) as exc:
+            self._reply(400, {"error": f"{type(exc).__name__}: {exc}"})
+        except Exception as exc:  # noqa: BLE001 - reported to the client
+            logger.exception("Request to %s failed", self.path)
+            self._reply(500, {"error": f"{type(exc).__name__}: {exc}"})
+
+    def _reply(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix-socket peers have no (host, port) address.
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service: GenerationService) -> socketserver.BaseServer:
+    """Bind the service to its TCP port or Unix socket (not yet serving)."""
+
+    config = service.config
+    if config.socket_path is not None:
+        socket_path = Path(config.socket_path)
+        if socket_path.exists():
+            socket_path.unlink()
+        server: socketserver.BaseServer = UnixHTTPServer(str(socket_path), ServiceHandler)
+    else:
+        server = ThreadingHTTPServer((config.host, config.port), ServiceHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def generator_factory(
+    config_data: Dict[str, Any],
+    llm_callable: Callable[[str], str],
+    llm_cache: Optional[LLMCache] = None,
+) -> Callable[[], TestCaseGenerator]:
+    """Build generators from a parsed ``rag.yml``; called again on every reload.
+
+    Every generator shares ``llm_cache``, so requests still settling on a
+    replaced generator keep a usable cache. The caller closes it.
+    """
+
+    def factory() -> TestCaseGenerator:
+        prompt_data = config_data.get("prompt", {})
+        config = GeneratorConfig(
+            retriever=RetrieverConfig(
+                vector_store=store_config(config_data["vector_store"]),
+                embedding=EmbeddingConfig(**config_data.get("embedding", {})),
+                **config_data.get("retriever", {}),
+            ),
+            prompt=PromptConfig(
+                **{
+                    **prompt_data,
+                    "master_prompt_path": Path(
+                        prompt_data.get("master_prompt_path", "prompts/master_orchestration_prompt.md")
+                    ),
+                }
+            ),
+            reranker=RerankerConfig(**config_data.get("reranker", {})),
+            batch=BatchConfig(**config_data.get("batch", {})),
+        )
+        return TestCaseGenerator(config, llm_callable, verifier=JsonSchemaVerifier(), llm_cache=llm_cache)
+
+    return factory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve retrieval and test case generation with warm state")
+    parser.add_argument("--config", type=Path, required=True, help="Path to rag.yml configuration")
+    parser.add_argument("--host", help="Override server.host")
+    parser.add_argument("--port", type=int, help="Override server.port")
+    parser.add_argument("--socket", type=Path, help="Serve on this Unix socket instead of TCP")
+    parser.add_argument(
+        "--llm",
+        default="generator.server:stub_llm",
+        help="LLM callable as 'module:function' (defaults to a local stub)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    config_data = json.loads(args.config.read_text()) if args.config.suffix == ".json" else None
+    if config_data is None:
+        import yaml
+
+        config_data = yaml.safe_load(args.config.read_text())
+    server_config = ServerConfig(**config_data.get("server", {}))
+    server_config.host = args.host or server_config.host
+    server_config.port = args.port if args.port is not None else server_config.port
+    server_config.socket_path = args.socket or server_config.socket_path
+
+    llm_cache = LLMCache(LLMCacheConfig(**config_data["llm_cache"])) if config_data.get("llm_cache") else None
+    service = GenerationService(generator_factory(config_data, load_callable(args.llm), llm_cache), server_config)
+    server = make_server(service)
+    # SIGHUP reloads the warm state; SIGTERM drains in-flight requests and exits.
+    signal.signal(signal.SIGHUP, lambda *_: service.coalescer.reload())
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    where = server_config.socket_path or f"http://{server_config.host}:{server.server_address[1]}"
+    print(f"Serving on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if llm_cache is not None:
+            llm_cache.close()
+
+
+if __name__ == "__main__":
+    main()
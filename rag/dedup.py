@@ -0,0 +1,87 @@
+"""Near-duplicate detection and result diversity.
+
+Chunks are fingerprinted with a 64-bit SimHash over word bigrams. Two texts
+whose fingerprints differ in at most ``distance`` bits are near-duplicates.
+Splitting the fingerprint into ``distance + 1`` bands guarantees that such a
+pair agrees exactly on at least one band, so candidates are found with plain
+equality lookups on indexed band columns.
+
+:func:`maximal_marginal_relevance` re-orders search results so that the top
+of the list is not filled with chunks that say the same thing.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from rag.models import DocumentChunk
+
+FINGERPRINT_BITS = 64
+BANDS = 4
+# Bits that may differ between near-duplicates; BANDS - 1 keeps lookups exact.
+MAX_DISTANCE = BANDS - 1
+BAND_BITS = FINGERPRINT_BITS // BANDS
+
+_TOKEN = re.compile(r"[\w-]+")
+
+
+def simhash(text: str) -> int:
+    """Signed 64-bit SimHash of ``text`` (signed so SQLite can store it as INTEGER)."""
+
+    tokens = _TOKEN.findall(text.lower())
+    features = [f"{first} {second}" for first, second in zip(tokens, tokens[1:])] or tokens
+    if not features:
+        return 0
+    digests = b"".join(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest() for feature in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(features), 8), axis=1)
+    # A bit is set when most features set it.
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(features)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big", signed=True)
+
+
+def bands(fingerprint: int) -> List[int]:
+    unsigned = fingerprint & ((1 << FINGERPRINT_BITS) - 1)
+    mask = (1 << BAND_BITS) - 1
+    return [(unsigned >> (band * BAND_BITS)) & mask for band in range(BANDS)]
+
+
+def hamming(first: int, second: int) -> int:
+    return ((first ^ second) & ((1 << FINGERPRINT_BITS) - 1)).bit_count()
+
+
+def maximal_marginal_relevance(
+    query_embedding: np.ndarray,
+    chunks: Sequence[DocumentChunk],
+    top_k: int,
+    diversity: float = 0.5,
+) -> List[DocumentChunk]:
+    """Pick ``top_k`` chunks trading relevance against similarity to those already picked.
+
+    ``diversity`` is the weight of redundancy: 0 keeps the relevance order and
+    1 ignores relevance after the first pick. Chunks without an embedding keep
+    their relevance rank after the chunks that have one.
+    """
+
+    embedded = [chunk for chunk in chunks if chunk.embedding is not None]
+    if len(embedded) <= 1 or diversity <= 0:
+        return list(chunks)[:top_k]
+    vectors = np.vstack([np.asarray(chunk.embedding, dtype=np.float32) for chunk in embedded])
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-10
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    relevance = vectors @ (query / (np.linalg.norm(query) + 1e-10))
+    similarity = vectors @ vectors.T
+    selected: List[int] = []
+    redundancy: Optional[np.ndarray] = None
+    available = np.ones(len(embedded), dtype=bool)
+    for _ in range(min(top_k, len(embedded))):
+        score = (1 - diversity) * relevance - diversity * (redundancy if redundancy is not None else 0.0)
+        pick = int(np.argmax(np.where(available, score, -np.inf)))
+        selected.append(pick)
+        available[pick] = False
+        redundancy = similarity[pick] if redundancy is None else np.maximum(redundancy, similarity[pick])
+    ranked = [embedded[position] for position in selected]
+    ranked.extend(chunk for chunk in chunks if chunk.embedding is None)
+    return ranked[:top_k]
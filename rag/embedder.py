@@ -2,41 +2,114 @@
 from __future__ import annotations
 
 import importlib
+import importlib.util
 from dataclasses import dataclass
-from typing import Iterable, List
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
 
 import numpy as np
-from sklearn.feature_extraction.text import HashingVectorizer
+
+from rag import model_registry
+from rag.embedding_cache import CacheStats, EmbeddingCache, cache_key
+
+HASHING_FEATURES = 1024
 
 
 @dataclass
 class EmbeddingConfig:
     model_name: str = "sentence-transformers/all-MiniLM-L6-v2"
     batch_size: int = 32
+    # "auto" uses sentence-transformers when installed, "hashing" forces the fallback.
+    backend: str = "auto"
+    # Optional embedding cache: an on-disk SQLite tier and an in-process LRU.
+    cache_path: Optional[str] = None
+    cache_memory_items: int = 0
+    cache_max_bytes: int = 1 << 30
 
 
 class EmbeddingClient:
-    """Lightweight wrapper that can use a sentence-transformer or a hashing fallback."""
+    """Lightweight wrapper that can use a sentence-transformer or a hashing fallback.
+
+    Models are loaded on first use from the process-wide registry, so creating
+    a client is cheap and every client in the process shares one model.
+    """
 
     def __init__(self, config: EmbeddingConfig | None = None) -> None:
         self.config = config or EmbeddingConfig()
-        self._vectorizer = HashingVectorizer(n_features=1024, alternate_sign=False)
-        self._sentence_model = self._load_sentence_transformer()
+        self.cache: Optional[EmbeddingCache] = None
+        if self.config.cache_path or self.config.cache_memory_items > 0:
+            self.cache = EmbeddingCache(
+                Path(self.config.cache_path) if self.config.cache_path else None,
+                memory_items=self.config.cache_memory_items,
+                max_bytes=self.config.cache_max_bytes,
+            )
 
-    def _load_sentence_transformer(self):
-        spec = importlib.util.find_spec("sentence_transformers")
-        if spec is None:
+    @property
+    def model_id(self) -> str:
+        """Identifies the backend that actually produces the vectors."""
+
+        if self._uses_sentence_transformer():
+            return self.config.model_name
+        return f"hashing-{HASHING_FEATURES}"
+
+    def _uses_sentence_transformer(self) -> bool:
+        if self.config.backend == "hashing":
+            return False
+        return importlib.util.find_spec("sentence_transformers") is not None
+
+    @property
+    def _sentence_model(self):
+        if not self._uses_sentence_transformer():
             return None
+        return model_registry.get_model("sentence-transformer", self.config.model_name, self._load_sentence_transformer)
+
+    def _load_sentence_transformer(self):
         module = importlib.import_module("sentence_transformers")
         return module.SentenceTransformer(self.config.model_name)
 
+    @property
+    def _vectorizer(self):
+        return model_registry.get_model("hashing", str(HASHING_FEATURES), _hashing_vectorizer)
+
     def embed(self, texts: Iterable[str]) -> List[np.ndarray]:
         texts_list = list(texts)
-        if self._sentence_model is not None:
-            embeddings = self._sentence_model.encode(texts_list, batch_size=self.config.batch_size)
-            return [np.asarray(embedding, dtype=float) for embedding in embeddings]
+        if self.cache is None:
+            return self._compute(texts_list)
+        keys = [cache_key(self.model_id, text) for text in texts_list]
+        found = self.cache.get_many(keys)
+        # Only unique cache misses are sent to the model.
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts_list):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            computed = dict(zip(missing, self._compute(list(missing.values()))))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def _compute(self, texts_list: List[str]) -> List[np.ndarray]:
+        if not texts_list:
+            return []
+        sentence_model = self._sentence_model
+        if sentence_model is not None:
+            embeddings = sentence_model.encode(texts_list, batch_size=self.config.batch_size)
+            return list(np.asarray(embeddings, dtype=np.float32).reshape(len(texts_list), -1))
         hashed = self._vectorizer.transform(texts_list)
-        return [row.toarray().astype(float).ravel() for row in hashed]
+        return list(hashed.toarray().astype(np.float32))
 
     def embed_query(self, text: str) -> np.ndarray:
         return self.embed([text])[0]
+
+    def cache_stats(self) -> CacheStats:
+        return self.cache.stats if self.cache is not None else CacheStats()
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+
+def _hashing_vectorizer():
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(n_features=HASHING_FEATURES, alternate_sign=False)
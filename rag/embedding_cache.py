@@ -0,0 +1,168 @@
+"""Persistent embedding cache keyed by model and normalized text."""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model_id: str, text: str) -> str:
+    payload = f"{model_id}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class EmbeddingCache:
+    """In-process LRU in front of an optional SQLite file.
+
+    The disk tier is evicted least-recently-used first once the stored vectors
+    exceed ``max_bytes``; it is trimmed to 90% of the limit so eviction does not
+    run on every insert.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        memory_items: int = 10_000,
+        max_bytes: int = 1 << 30,
+    ) -> None:
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._stored_bytes = 0
+        self._last_tick = 0.0
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path)
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    dtype TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+            self._connection.commit()
+            row = self._connection.execute("SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings").fetchone()
+            self._stored_bytes = int(row[0])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        missing = []
+        for key in dict.fromkeys(keys):
+            vector = self._memory.get(key)
+            if vector is None:
+                missing.append(key)
+                continue
+            self._memory.move_to_end(key)
+            found[key] = vector
+            self.stats.memory_hits += 1
+        if missing and self._connection is not None:
+            for offset in range(0, len(missing), 500):
+                part = missing[offset : offset + 500]
+                placeholders = ", ".join("?" for _ in part)
+                rows = self._connection.execute(
+                    f"SELECT key, vector, dtype FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob, dtype in rows:
+                    vector = np.frombuffer(blob, dtype=dtype)
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self.stats.disk_hits += 1
+                if rows:
+                    now = self._tick()
+                    self._connection.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        ((now, key) for key, _, _ in rows),
+                    )
+            self._connection.commit()
+        self.stats.misses += sum(1 for key in missing if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        for key, vector in items.items():
+            self._remember(key, vector)
+        if self._connection is None or not items:
+            return
+        now = self._tick()
+        rows = [(key, np.ascontiguousarray(vector).tobytes(), str(vector.dtype), now) for key, vector in items.items()]
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector, dtype, last_used) VALUES (?, ?, ?, ?)",
+            rows,
+        )
+        self._stored_bytes += sum(len(blob) for _, blob, _, _ in rows)
+        if self._stored_bytes > self.max_bytes:
+            self._evict()
+        self._connection.commit()
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _tick(self) -> float:
+        # Strictly increasing so back-to-back writes keep a well-defined LRU order.
+        self._last_tick = max(time.time(), self._last_tick + 1e-6)
+        return self._last_tick
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        if self.memory_items <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self) -> None:
+        target = int(self.max_bytes * 0.9)
+        cursor = self._connection.execute("SELECT key, length(vector) FROM embeddings ORDER BY last_used")
+        evicted = []
+        remaining = int(
+            self._connection.execute("SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings").fetchone()[0]
+        )
+        for key, size in cursor:
+            if remaining <= target:
+                break
+            evicted.append((key,))
+            remaining -= size
+        cursor.close()
+        self._connection.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self._stored_bytes = remaining
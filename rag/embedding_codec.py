@@ -0,0 +1,46 @@
+"""Encoding of embeddings for compact storage."""
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+
+# float64 is what stores written before dtypes were configurable contain.
+STORAGE_DTYPES = ("float64", "float32", "float16", "int8")
+
+
+def check_dtype(dtype: str) -> str:
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+    return dtype
+
+
+def encode(vector: np.ndarray, dtype: str) -> Tuple[bytes, float]:
+    """Serialize ``vector`` as ``dtype`` and return ``(blob, scale)``.
+
+    ``int8`` uses symmetric scalar quantization with one scale per vector, so
+    each value is stored as ``round(value / scale)`` with ``scale = max|v| / 127``.
+    Other dtypes are stored as-is with a scale of 1.
+    """
+
+    if check_dtype(dtype) != "int8":
+        return np.asarray(vector, dtype=dtype).ravel().tobytes(), 1.0
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    peak = float(np.max(np.abs(vector))) if vector.size else 0.0
+    scale = peak / 127.0 if peak else 1.0
+    quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+    return quantized.tobytes(), scale
+
+
+def decode(blob: bytes, dtype: str, scale: float = 1.0) -> np.ndarray:
+    """Inverse of :func:`encode`, always returning float32."""
+
+    return dequantize(np.frombuffer(blob, dtype=check_dtype(dtype)), dtype, scale)
+
+
+def dequantize(values: np.ndarray, dtype: str, scale: float = 1.0) -> np.ndarray:
+    """Convert stored values (for example a memory-mapped row) back to float32."""
+
+    if dtype == "int8":
+        return values.astype(np.float32) * np.float32(scale)
+    return values.astype(np.float32)
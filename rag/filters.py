@@ -0,0 +1,144 @@
+"""Typed metadata filter expressions compiled to SQL over the metadata side table.
+
+A filter maps metadata keys to conditions, and all conditions must hold::
+
+    {"doc_type": "jira"}                          # equality
+    {"status": ["To Do", "In Progress"]}          # IN
+    {"jira_key": {"$prefix": "PAY-"}}             # prefix
+    {"page": {"$gte": 10, "$lt": 20}}             # numeric range
+    {"status": {"$not": "Done"}}                  # negation of any condition
+    {"issue_type": {"$nin": ["Epic", "Task"]}}    # NOT IN
+
+String bounds in a range compare lexically; numeric bounds compare against the
+numeric value of the metadata entry, so ``"page": "9"`` is below ``10``.
+"""
+from __future__ import annotations
+
+import operator
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+RANGE_OPERATORS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+OPERATORS = {"$eq", "$ne", "$in", "$nin", "$prefix", "$not", *RANGE_OPERATORS}
+
+
+class FilterError(ValueError):
+    """Raised for malformed filter expressions."""
+
+
+def numeric_value(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _condition(expression: Any) -> Tuple[str, List[Any], bool]:
+    """Compile one key's condition to ``(sql, params, negated)``."""
+
+    if isinstance(expression, (list, tuple, set, frozenset)):
+        expression = {"$in": list(expression)}
+    if not isinstance(expression, Mapping):
+        expression = {"$eq": expression}
+    unknown = set(expression) - OPERATORS
+    if unknown:
+        raise FilterError(f"Unsupported filter operators: {sorted(unknown)}")
+    if "$not" in expression:
+        if len(expression) != 1:
+            raise FilterError("'$not' cannot be combined with other operators")
+        sql, params, negated = _condition(expression["$not"])
+        return sql, params, not negated
+    if "$ne" in expression or "$nin" in expression:
+        if len(expression) != 1:
+            raise FilterError("'$ne' and '$nin' cannot be combined with other operators")
+        ((operator, value),) = expression.items()
+        return _condition({"$not": {"$eq" if operator == "$ne" else "$in": value}})
+
+    clauses: List[str] = []
+    params: List[Any] = []
+    if "$eq" in expression:
+        clauses.append("value = ?")
+        params.append(str(expression["$eq"]))
+    if "$in" in expression:
+        values = [str(value) for value in expression["$in"]]
+        if not values:
+            return "0", [], False
+        clauses.append(f"value IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+    if "$prefix" in expression:
+        prefix = str(expression["$prefix"])
+        # A half-open range keeps the (key, value) index usable, unlike LIKE/GLOB.
+        clauses.append("value >= ? AND value < ?")
+        params.extend([prefix, prefix + "\U0010ffff"])
+    for operator, sql_operator in RANGE_OPERATORS.items():
+        if operator not in expression:
+            continue
+        bound = expression[operator]
+        if isinstance(bound, (int, float)) and not isinstance(bound, bool):
+            clauses.append(f"num {sql_operator} ?")
+        else:
+            clauses.append(f"value {sql_operator} ?")
+            bound = str(bound)
+        params.append(bound)
+    return " AND ".join(clauses), params, False
+
+
+def compile_filters(filters: Optional[Dict[str, Any]], table: str, metadata_table: str) -> Tuple[str, List[Any]]:
+    """Return a ``SELECT`` producing the ids of chunks matching ``filters``."""
+
+    positive: List[Tuple[str, List[Any]]] = []
+    negative: List[Tuple[str, List[Any]]] = []
+    for key, expression in (filters or {}).items():
+        sql, params, negated = _condition(expression)
+        selection = f"SELECT chunk_id FROM {metadata_table} WHERE key = ? AND {sql}"
+        (negative if negated else positive).append((selection, [key, *params]))
+    parts = positive or [(f"SELECT id FROM {table}", [])]
+    query = " INTERSECT ".join(sql for sql, _ in parts)
+    params = [param for _, part_params in parts for param in part_params]
+    for sql, part_params in negative:
+        query += f" EXCEPT {sql}"
+        params.extend(part_params)
+    return query, params
+
+
+def matches(expression: Any, value: Optional[str]) -> bool:
+    """Whether one metadata ``value`` (None: key absent) satisfies ``expression``.
+
+    Mirrors the SQL built by :func:`compile_filters`, so callers can decide
+    without a query whether a known set of values can match a filter.
+    """
+
+    if isinstance(expression, (list, tuple, set, frozenset)):
+        expression = {"$in": list(expression)}
+    if not isinstance(expression, Mapping):
+        expression = {"$eq": expression}
+    unknown = set(expression) - OPERATORS
+    if unknown:
+        raise FilterError(f"Unsupported filter operators: {sorted(unknown)}")
+    if "$not" in expression:
+        return not matches(expression["$not"], value)
+    if "$ne" in expression:
+        return not matches({"$eq": expression["$ne"]}, value)
+    if "$nin" in expression:
+        return not matches({"$in": expression["$nin"]}, value)
+    if value is None:
+        return False
+    if "$eq" in expression and value != str(expression["$eq"]):
+        return False
+    if "$in" in expression and value not in {str(item) for item in expression["$in"]}:
+        return False
+    if "$prefix" in expression and not value.startswith(str(expression["$prefix"])):
+        return False
+    for name, compare in COMPARISONS.items():
+        if name not in expression:
+            continue
+        bound = expression[name]
+        if isinstance(bound, (int, float)) and not isinstance(bound, bool):
+            left = numeric_value(value)
+            if left is None:
+                return False
+        else:
+            left, bound = value, str(bound)
+        if not compare(left, bound):
+            return False
+    return True
@@ -2,34 +2,57 @@
 from __future__ import annotations
 
 import argparse
+import importlib
 import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Iterable, List
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar
 
 from rag.embedder import EmbeddingClient, EmbeddingConfig
-from rag.ingestion.chunker import chunk_records
-from rag.ingestion.html_loader import HtmlLoader
-from rag.ingestion.jira_loader import JiraLoader
-from rag.ingestion.pdf_loader import PdfLoader
-from rag.ingestion.spreadsheet_loader import SpreadsheetLoader
-from rag.ingestion.text_loader import TextLoader
+from rag.ingestion.base_loader import ArtifactLoader
+from rag.ingestion.chunker import APPROXIMATE, CHUNKING_MODES, iter_chunks
+from rag.manifest import SourceManifest, SourceState, manifest_key
 from rag.models import ArtifactRecord, DocumentChunk
-from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
-
-LOADER_MAPPING = {
-    ".pdf": PdfLoader,
-    ".html": HtmlLoader,
-    ".htm": HtmlLoader,
-    ".json": JiraLoader,
-    ".txt": TextLoader,
-    ".md": TextLoader,
-    ".markdown": TextLoader,
-    ".csv": SpreadsheetLoader,
-    ".xlsx": SpreadsheetLoader,
-    ".xlsm": SpreadsheetLoader,
+from rag.vector_store import SQLiteVectorStore
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Loaders are imported on first use so that, for example, ingesting Markdown
+# never pays for importing pypdf, BeautifulSoup or openpyxl.
+LOADER_MAPPING: Dict[str, str] = {
+    ".pdf": "rag.ingestion.pdf_loader:PdfLoader",
+    ".html": "rag.ingestion.html_loader:HtmlLoader",
+    ".htm": "rag.ingestion.html_loader:HtmlLoader",
+    ".json": "rag.ingestion.jira_loader:JiraLoader",
+    ".txt": "rag.ingestion.text_loader:TextLoader",
+    ".md": "rag.ingestion.text_loader:TextLoader",
+    ".markdown": "rag.ingestion.text_loader:TextLoader",
+    ".csv": "rag.ingestion.spreadsheet_loader:SpreadsheetLoader",
+    ".xlsx": "rag.ingestion.spreadsheet_loader:SpreadsheetLoader",
+    ".xlsm": "rag.ingestion.spreadsheet_loader:SpreadsheetLoader",
 }
 
 
+@lru_cache(maxsize=None)
+def loader_class(suffix: str) -> Optional[Type[ArtifactLoader]]:
+    """Import and return the loader registered for ``suffix`` (None if unsupported)."""
+
+    target = LOADER_MAPPING.get(suffix.lower())
+    if target is None:
+        return None
+    module_name, class_name = target.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
 def discover_artifacts(paths: Iterable[Path]) -> List[Path]:
     resolved: List[Path] = []
     for path in paths:
@@ -43,19 +66,336 @@ def discover_artifacts(paths: Iterable[Path]) -> List[Path]:
 
 
 def load_records(path: Path) -> List[ArtifactRecord]:
-    loader_cls = LOADER_MAPPING.get(path.suffix.lower())
+    return list(iter_records(path))
+
+
+def iter_records(path: Path) -> Iterator[ArtifactRecord]:
+    loader_cls = loader_class(path.suffix)
     if loader_cls is None:
         raise ValueError(f"Unsupported artifact type: {path}")
     loader = loader_cls(path)
-    return loader.load()
+    return loader.iter_load()
+
+
+def iter_file_chunks(
+    path: Path,
+    chunk_size: int,
+    overlap: int,
+    tokenizer: Optional[str] = None,
+    chunking: str = "auto",
+) -> Iterator[DocumentChunk]:
+    """Stream one artifact's chunks; only the current record (or pack of records) is held in memory."""
+
+    return iter_chunks(iter_records(path), chunk_size, overlap, path.stem, tokenizer, chunking)
+
+
+def iter_batches(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """Group an arbitrary iterable into lists of at most ``batch_size`` items."""
+
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, max(batch_size, 1)))
+        if not batch:
+            return
+        yield batch
+
+
+@dataclass
+class LoadResult:
+    """Chunks produced from one artifact, or the error that stopped it."""
+
+    path: Path
+    chunks: List[DocumentChunk] = field(default_factory=list)
+    error: Optional[str] = None
+    # Ids of every chunk emitted for the file, including when chunks were
+    # streamed rather than collected in ``chunks``.
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+def load_and_chunk(
+    path: Path,
+    chunk_size: int,
+    overlap: int,
+    tokenizer: Optional[str] = None,
+    chunking: str = "auto",
+) -> LoadResult:
+    """Load and chunk a single artifact, capturing failures instead of raising.
+
+    This is the unit of work shipped to worker processes, so it must stay a
+    module-level function and only return picklable values.
+    """
+
+    try:
+        chunks = list(iter_file_chunks(path, chunk_size, overlap, tokenizer, chunking))
+    except Exception as exc:  # noqa: BLE001 - one bad file must not abort the run
+        return LoadResult(path=path, error=f"{type(exc).__name__}: {exc}")
+    return LoadResult(path=path, chunks=chunks, chunk_ids=[chunk.id for chunk in chunks])
+
+
+def iter_loaded(
+    artifact_paths: Iterable[Path],
+    chunk_size: int,
+    overlap: int,
+    workers: int = 1,
+    tokenizer: Optional[str] = None,
+    chunking: str = "auto",
+) -> Iterator[LoadResult]:
+    """Load and chunk artifacts, optionally in a process pool.
+
+    Results are yielded in the order of ``artifact_paths`` regardless of which
+    worker finishes first, and at most ``2 * workers`` files are in flight so
+    memory stays bounded when the writer is slower than the loaders.
+    """
+
+    if workers <= 1:
+        for artifact_path in artifact_paths:
+            yield load_and_chunk(artifact_path, chunk_size, overlap, tokenizer, chunking)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Deque[Future] = deque()
+        for artifact_path in artifact_paths:
+            pending.append(executor.submit(load_and_chunk, artifact_path, chunk_size, overlap, tokenizer, chunking))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def embed_batches(
+    chunks: Iterable[DocumentChunk],
+    embedder: EmbeddingClient,
+    batch_size: int,
+) -> Iterator[List[DocumentChunk]]:
+    """Embed chunks in batches, yielding each batch once its embeddings are ready."""
+
+    for batch in iter_batches(chunks, batch_size):
+        yield embed_chunks(batch, embedder)
+
+
+def embed_chunks(chunks: List[DocumentChunk], embedder: EmbeddingClient) -> List[DocumentChunk]:
+    if not chunks:
+        return []
+    embeddings = embedder.embed([chunk.text for chunk in chunks])
+    return [chunk.with_embedding(embedding) for chunk, embedding in zip(chunks, embeddings)]
+
+
+@dataclass
+class IngestStats:
+    batches: int = 0
+    chunks: int = 0
+    files: int = 0
+    skipped: int = 0
+    removed: int = 0
+    # Chunks stored as references to a near-identical chunk instead of embedded.
+    duplicates: int = 0
+    elapsed: float = 0.0
+    failures: List[Tuple[Path, str]] = field(default_factory=list)
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+
+def _is_under(path: str, roots: Iterable[Path]) -> bool:
+    candidate = Path(path)
+    for root in roots:
+        root = Path(root).resolve()
+        if candidate == root or root in candidate.parents:
+            return True
+    return False
+
+
+def purge_removed(
+    manifest: SourceManifest,
+    vector_store: SQLiteVectorStore,
+    artifact_paths: Iterable[Path],
+    roots: Iterable[Path],
+) -> int:
+    """Delete chunks of manifest sources under ``roots`` that no longer exist."""
+
+    roots = list(roots)
+    present = {manifest_key(path) for path in artifact_paths}
+    removed = [path for path in manifest.paths() if path not in present and _is_under(path, roots)]
+    for path in removed:
+        state = manifest.get(Path(path))
+        if state is not None:
+            vector_store.delete(state.chunk_ids)
+    manifest.remove(removed)
+    return len(removed)
+
+
+def ingest(
+    artifact_paths: Iterable[Path],
+    embedder: EmbeddingClient,
+    vector_store: SQLiteVectorStore,
+    chunk_size: int = 200,
+    overlap: int = 40,
+    batch_size: int = 256,
+    progress: Optional[Callable[[IngestStats], None]] = None,
+    workers: int = 1,
+    manifest: Optional[SourceManifest] = None,
+    force: bool = False,
+    tokenizer: Optional[str] = None,
+    chunking: str = "auto",
+) -> IngestStats:
+    """Stream artifacts through load, chunk, embed and upsert.
+
+    At most ``batch_size`` embedded chunks are held in memory at a time, and
+    each batch is committed to the store before the next one is embedded, so
+    a crash late in the run keeps everything ingested so far. With
+    ``workers > 1`` loading and chunking run in a process pool while this
+    process remains the single embedding and writing stage.
+
+    With ``workers <= 1`` each file's chunks stream straight from its loader,
+    so memory stays bounded even for very large PDFs and workbooks; with a
+    process pool, a file's chunks are collected to cross the process boundary.
+
+    With a ``manifest``, files whose mtime/size or content hash are unchanged
+    are skipped. A changed file's manifest entry is only rewritten, and its
+    stale chunks deleted, once all of its new chunks have been committed.
+    ``force`` re-ingests every file while still replacing stale chunks.
+
+    When the store has ``dedup`` enabled, near-duplicates of a stored chunk
+    are recorded as references to it and never embedded.
+
+    ``chunk_size`` and ``overlap`` count tokens of ``tokenizer`` (a Hugging
+    Face model name), or estimated tokens when it is None. ``chunking``
+    selects per-doc_type strategies (``"auto"``) or a plain sliding window
+    over every record (``"window"``).
+    """
+
+    stats = IngestStats()
+    started = time.perf_counter()
+    changes: Dict[Path, Tuple[Optional[SourceState], SourceState]] = {}
+    if manifest is not None:
+        changed_paths: List[Path] = []
+        for artifact_path in artifact_paths:
+            previous, current = manifest.check(artifact_path, force)
+            if current is None:
+                stats.skipped += 1
+                continue
+            changes[artifact_path] = (previous, current)
+            changed_paths.append(artifact_path)
+        artifact_paths = changed_paths
+
+    # Files whose chunks have all been handed to the embedder, keyed by the
+    # running chunk count at which they are fully committed.
+    pending: Deque[Tuple[int, LoadResult]] = deque()
+    emitted = 0
+
+    def chunk_stream() -> Iterator[DocumentChunk]:
+        nonlocal emitted
+        if workers > 1:
+            for result in iter_loaded(artifact_paths, chunk_size, overlap, workers, tokenizer, chunking):
+                if result.error is not None:
+                    logger.warning("Skipping %s: %s", result.path, result.error)
+                    stats.failures.append((result.path, result.error))
+                    continue
+                emitted += len(result.chunks)
+                pending.append((emitted, result))
+                yield from result.chunks
+                result.chunks = []
+            return
+        for artifact_path in artifact_paths:
+            result = LoadResult(path=artifact_path)
+            try:
+                for chunk in iter_file_chunks(artifact_path, chunk_size, overlap, tokenizer, chunking):
+                    result.chunk_ids.append(chunk.id)
+                    emitted += 1
+                    yield chunk
+            except Exception as exc:  # noqa: BLE001 - one bad file must not abort the run
+                result.error = f"{type(exc).__name__}: {exc}"
+                logger.warning("Skipping %s: %s", artifact_path, result.error)
+                stats.failures.append((artifact_path, result.error))
+            pending.append((emitted, result))
+
+    def finalize(committed: int) -> None:
+        while pending and pending[0][0] <= committed:
+            _, result = pending.popleft()
+            if result.error is not None:
+                if manifest is not None:
+                    # A file that failed part-way already streamed some chunks;
+                    # drop the ones its manifest entry does not account for.
+                    previous = changes[result.path][0]
+                    vector_store.delete(set(result.chunk_ids) - set(previous.chunk_ids if previous else ()))
+                continue
+            stats.files += 1
+            if manifest is None:
+                continue
+            previous, current = changes[result.path]
+            current.chunk_ids = result.chunk_ids
+            if previous is not None:
+                vector_store.delete(set(previous.chunk_ids) - set(current.chunk_ids))
+            manifest.record(current)
+
+    for batch in iter_batches(chunk_stream(), batch_size):
+        unique, duplicates = vector_store.split_duplicates(batch)
+        vector_store.upsert(embed_chunks(unique, embedder))
+        vector_store.add_duplicates(duplicates)
+        stats.duplicates += len(duplicates)
+        stats.batches += 1
+        stats.chunks += len(batch)
+        finalize(stats.chunks)
+        stats.elapsed = time.perf_counter() - started
+        if progress is not None:
+            progress(stats)
+    finalize(stats.chunks)
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def _print_progress(stats: IngestStats) -> None:
+    print(f"Batch {stats.batches}: {stats.chunks} chunks ({stats.chunks_per_second:.1f} chunks/s)", flush=True)
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Ingest artifacts into the vector store")
     parser.add_argument("paths", nargs="+", type=Path, help="Files or directories to ingest")
     parser.add_argument("--config", type=Path, required=True, help="Path to rag.yml configuration")
-    parser.add_argument("--chunk-size", type=int, default=200)
-    parser.add_argument("--overlap", type=int, default=40)
+    parser.add_argument("--chunk-size", type=int, default=200, help="Tokens per chunk")
+    parser.add_argument("--overlap", type=int, default=40, help="Tokens shared by consecutive chunks")
+    parser.add_argument(
+        "--tokenizer",
+        default=APPROXIMATE,
+        help=(
+            "Tokenizer that sizes chunks: a Hugging Face model name such as "
+            "sentence-transformers/all-MiniLM-L6-v2, or 'approximate' for a fast estimate"
+        ),
+    )
+    parser.add_argument(
+        "--chunking",
+        choices=CHUNKING_MODES,
+        default="auto",
+        help=(
+            "auto packs small spreadsheet rows and Jira issues and splits Markdown/HTML on headings; "
+            "window slides the token window over every record"
+        ),
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=256,
+        help="Chunks embedded and committed per batch; bounds peak memory",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used to load and chunk artifacts in parallel",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-ingest every file even if the manifest says it is unchanged",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help=(
+            "Drop the store's secondary indexes and relax fsync while loading, then rebuild them; "
+            "much faster for large loads, lexical search lags until the load finishes"
+        ),
+    )
     args = parser.parse_args()
 
     config_data = json.loads(Path(args.config).read_text()) if args.config.suffix == ".json" else None
@@ -64,22 +404,52 @@ def main() -> None:
 
         config_data = yaml.safe_load(Path(args.config).read_text())
 
-    vector_store_config = VectorStoreConfig(path=Path(config_data["vector_store"]["path"]))
+    from rag.sharded_store import open_store, store_config
+
+    vector_store_config = store_config(config_data["vector_store"])
     embedding_config = EmbeddingConfig(**config_data.get("embedding", {}))
     embedder = EmbeddingClient(embedding_config)
-    vector_store = SQLiteVectorStore(vector_store_config)
+    vector_store = open_store(vector_store_config)
 
     artifact_paths = discover_artifacts([Path(p) for p in args.paths])
-    chunks: List[DocumentChunk] = []
-    for artifact_path in artifact_paths:
-        records = load_records(artifact_path)
-        artifact_chunks = chunk_records(records, args.chunk_size, args.overlap, prefix=artifact_path.stem)
-        embeddings = embedder.embed([chunk.text for chunk in artifact_chunks])
-        for chunk, embedding in zip(artifact_chunks, embeddings):
-            chunks.append(chunk.with_embedding(embedding))
-    vector_store.upsert(chunks)
-    vector_store.close()
-    print(f"Ingested {len(chunks)} chunks into {vector_store_config.path}")
+    manifest = SourceManifest(vector_store_config.path, vector_store_config.table_name)
+    try:
+        with vector_store.bulk_load() if args.bulk else nullcontext():
+            removed = purge_removed(manifest, vector_store, artifact_paths, args.paths)
+            stats = ingest(
+                artifact_paths,
+                embedder,
+                vector_store,
+                chunk_size=args.chunk_size,
+                overlap=args.overlap,
+                batch_size=args.batch_size,
+                progress=_print_progress,
+                workers=args.workers,
+                manifest=manifest,
+                force=args.full,
+                tokenizer=args.tokenizer,
+                chunking=args.chunking,
+            )
+            stats.removed = removed
+    finally:
+        manifest.close()
+        vector_store.close()
+        embedder.close()
+    print(
+        f"Ingested {stats.chunks} chunks into {vector_store_config.path} "
+        f"in {stats.elapsed:.1f}s ({stats.chunks_per_second:.1f} chunks/s); "
+        f"{stats.files} files updated, {stats.skipped} unchanged, {stats.removed} removed"
+    )
+    if stats.duplicates:
+        print(f"Near-duplicates stored as references: {stats.duplicates}")
+    if embedder.cache is not None:
+        cache_stats = embedder.cache_stats()
+        print(
+            f"Embedding cache: {cache_stats.hits} hits, {cache_stats.misses} misses "
+            f"({cache_stats.hit_rate:.0%} hit rate)"
+        )
+    for path, error in stats.failures:
+        print(f"Failed to ingest {path}: {error}")
 
 
 if __name__ == "__main__":
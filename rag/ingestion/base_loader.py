@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Iterable, List, Sequence
+from typing import Iterable, Iterator, List, Sequence
 
 from rag.models import ArtifactRecord, ensure_metadata_path
 
@@ -16,13 +16,14 @@ class ArtifactLoader(ABC):
         self.doc_type = doc_type or self.path.suffix.lstrip(".")
 
     def load(self) -> List[ArtifactRecord]:
-        records = list(self._load())
+        return list(self.iter_load())
+
+    def iter_load(self) -> Iterator[ArtifactRecord]:
+        """Yield records one at a time so large files never sit in memory whole."""
+
         metadata = {"doc_type": self.doc_type}
-        with_path = [
-            record.with_metadata(**ensure_metadata_path(record.metadata, self.path), **metadata)
-            for record in records
-        ]
-        return with_path
+        for record in self._load():
+            yield record.with_metadata(**ensure_metadata_path(record.metadata, self.path), **metadata)
 
     @abstractmethod
     def _load(self) -> Iterable[ArtifactRecord]:
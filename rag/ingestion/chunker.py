@@ -1,22 +1,221 @@
-"""Chunking utilities for artifact records."""
+"""Chunking utilities for artifact records.
+
+Windows are sized in model tokens and cut at character offsets into the
+record text, so each chunk is a single slice of the original string and its
+``char_start``/``char_end`` metadata locate it exactly. Token counts come from
+a Hugging Face tokenizer when one is named, or from a vectorized estimate
+(``APPROXIMATE``) that never calls into Python per word.
+"""
 from __future__ import annotations
 
 import hashlib
-from typing import Iterable, List
+import importlib.util
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
 
+from rag import model_registry
 from rag.models import ArtifactRecord, DocumentChunk, merge_metadata
 
+APPROXIMATE = "approximate"
+
+# Characters per word-piece assumed for the letters of a word in approximate
+# mode; punctuation characters and CJK ideographs count one token each.
+CHARS_PER_TOKEN = 8
+
+_UNICODE_SPACES = np.array(
+    [0x85, 0xA0, 0x1680, *range(0x2000, 0x200B), 0x2028, 0x2029, 0x202F, 0x205F, 0x3000],
+    dtype=np.uint32,
+)
+
+Spans = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Chunking strategy per ``doc_type`` in ``chunking="auto"`` mode:
+#   pack      consecutive small records with the same metadata share a chunk
+#             up to the token budget; only numeric keys such as ``row`` may differ
+#   issue     one chunk per record; a long one repeats its first (summary) line
+#             in every window
+#   headings  Markdown headings start a new chunk; long sections are windowed
+#   window    the token window slides over each record on its own (default)
+DOC_TYPE_STRATEGIES: Dict[str, str] = {
+    "spreadsheet": "pack",
+    "jira": "issue",
+    "markdown": "headings",
+    "html": "headings",
+}
+CHUNKING_MODES = ("auto", "window")
+
+SHORT_TEXT = 512
+_SHORT_TOKEN = re.compile(r"\w{1,%d}|[^\w\s]" % CHARS_PER_TOKEN)
+_HEADING = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$", re.MULTILINE)
+_FENCE = re.compile(r"^[ \t]*(?:```|~~~)", re.MULTILINE)
+
+
+def approximate_spans(text: str) -> Spans:
+    """Whitespace-delimited words with their start/end offsets and estimated token counts."""
+
+    if text.isascii():
+        codes = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+        visible = codes > 32
+        wide = None
+    else:
+        # UTF-32 gives one code point per element, so indexes are str offsets.
+        # Only the (usually few) code points beyond Latin-1 controls are
+        # checked for Unicode spaces and CJK.
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        visible = codes > 32
+        high = np.flatnonzero(codes > 0x84)
+        high_codes = codes[high]
+        visible[high[np.isin(high_codes, _UNICODE_SPACES)]] = False
+        wide = high[
+            ((high_codes >= 0x2E80) & (high_codes <= 0x9FFF))
+            | ((high_codes >= 0xAC00) & (high_codes <= 0xD7A3))
+            | ((high_codes >= 0xF900) & (high_codes <= 0xFAFF))
+        ]
+    if not visible.any():
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    edges = np.flatnonzero(visible[1:] != visible[:-1]) + 1
+    if visible[0]:
+        edges = np.concatenate(([0], edges))
+    if visible[-1]:
+        edges = np.concatenate((edges, [len(codes)]))
+    starts, ends = edges[0::2], edges[1::2]
+
+    # ASCII punctuation (everything visible below 127 that is not [0-9A-Za-z_]).
+    single = visible & (
+        (codes < 48)
+        | ((codes > 57) & (codes < 65))
+        | ((codes > 90) & (codes < 97) & (codes != 95))
+        | ((codes > 122) & (codes < 127))
+    )
+    if wide is not None:
+        single[wide] = True
+    # Each single-token character is attributed to the word containing it.
+    owner = np.searchsorted(starts, np.flatnonzero(single), side="right") - 1
+    singles = np.bincount(owner, minlength=len(starts))
+    letters = ends - starts - singles
+    tokens = np.maximum(singles + (letters + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN, 1)
+    return starts, ends, tokens
+
+
+def tokenizer_spans(text: str, name: str) -> Spans:
+    """Offsets of every token produced by the Hugging Face tokenizer ``name``."""
+
+    tokenizer = model_registry.get_model("tokenizer", name, lambda: _load_tokenizer(name))
+    encoding = tokenizer(
+        text,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        verbose=False,
+    )
+    offsets = np.asarray(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+    return offsets[:, 0], offsets[:, 1], np.ones(len(offsets), dtype=np.int64)
+
+
+def _load_tokenizer(name: str):
+    from transformers import AutoTokenizer
+
+    return AutoTokenizer.from_pretrained(name)
+
+
+def token_spans(text: str, tokenizer: Optional[str] = None) -> Spans:
+    """Spans for ``tokenizer``: a model name, or None/``APPROXIMATE`` for the estimate.
+
+    A named tokenizer falls back to the estimate when transformers is not installed.
+    """
+
+    if tokenizer in (None, APPROXIMATE) or importlib.util.find_spec("transformers") is None:
+        return approximate_spans(text)
+    return tokenizer_spans(text, tokenizer)
+
+
+def chunk_spans(
+    text: str,
+    chunk_size: int,
+    overlap: int,
+    tokenizer: Optional[str] = None,
+) -> Iterator[Tuple[int, int]]:
+    """Yield ``(start, end)`` character offsets of windows of at most ``chunk_size`` tokens.
+
+    Consecutive windows share about ``overlap`` tokens. A window never splits
+    a span, so in approximate mode a single word longer than ``chunk_size``
+    tokens becomes its own oversized window.
+    """
+
+    starts, ends, tokens = token_spans(text, tokenizer)
+    count = len(starts)
+    if not count:
+        return
+    # bisect over memoryviews reads single elements as Python ints without
+    # converting whole arrays; numpy scalar calls per window cost more.
+    through = memoryview(np.cumsum(tokens, dtype=np.int64))
+    starts, ends = memoryview(starts.astype(np.int64, copy=False)), memoryview(ends.astype(np.int64, copy=False))
+    overlap = min(max(overlap, 0), max(chunk_size - 1, 0))
+    first = 0
+    while first < count:
+        before = through[first - 1] if first else 0
+        stop = max(bisect_right(through, before + chunk_size, first), first + 1)
+        yield starts[first], ends[stop - 1]
+        if stop >= count:
+            return
+        # The first span starting at or after ``overlap`` tokens before the end.
+        following = bisect_left(through, through[stop - 1] - overlap, first) + 1
+        first = max(following, first + 1)
+
+
+def chunk_text(
+    text: str,
+    chunk_size: int,
+    overlap: int,
+    tokenizer: Optional[str] = None,
+) -> Iterable[str]:
+    for start, end in chunk_spans(text, chunk_size, overlap, tokenizer):
+        yield text[start:end]
 
-def chunk_text(text: str, chunk_size: int, overlap: int) -> Iterable[str]:
-    words = text.split()
-    if not words:
-        return []
-    step = max(chunk_size - overlap, 1)
-    for start in range(0, len(words), step):
-        chunk_words = words[start : start + chunk_size]
-        if not chunk_words:
-            continue
-        yield " ".join(chunk_words)
+
+def count_tokens(text: str, tokenizer: Optional[str] = None) -> int:
+    """Token count of ``text``; short texts skip numpy in approximate mode."""
+
+    if tokenizer in (None, APPROXIMATE) and len(text) <= SHORT_TEXT:
+        return len(_SHORT_TOKEN.findall(text))
+    return int(token_spans(text, tokenizer)[2].sum())
+
+
+def heading_sections(text: str) -> Iterator[Tuple[int, int, int, List[str]]]:
+    """Split Markdown on ATX headings outside code fences.
+
+    Yields ``(start, body_start, end, path)`` where ``text[start:body_start]``
+    holds the heading lines and ``path`` the titles of the enclosing headings.
+    Headings with no body of their own are merged into the section that
+    follows, and text before the first heading has an empty path.
+    """
+
+    fences = [match.start() for match in _FENCE.finditer(text)]
+    headings = [
+        match
+        for match in _HEADING.finditer(text)
+        # An odd number of fences before the heading means it is inside a code block.
+        if bisect_left(fences, match.start()) % 2 == 0
+    ]
+    stack: List[Tuple[int, str]] = []
+    start = body_start = 0
+    path: List[str] = []
+    for match in headings:
+        if text[body_start : match.start()].strip():
+            yield start, body_start, match.start(), path
+            start = match.start()
+        level = len(match.group(1))
+        while stack and stack[-1][0] >= level:
+            stack.pop()
+        stack.append((level, match.group(2).strip()))
+        path = [title for _, title in stack]
+        body_start = match.end()
+    if text[start:].strip():
+        yield start, body_start, len(text), path
 
 
 def chunk_records(
@@ -24,19 +223,121 @@ def chunk_records(
     chunk_size: int = 200,
     overlap: int = 40,
     prefix: str | None = None,
+    tokenizer: Optional[str] = None,
+    chunking: str = "auto",
 ) -> List[DocumentChunk]:
     """Chunk artifact records into DocumentChunk instances."""
 
-    chunks: List[DocumentChunk] = []
-    for record in records:
-        for index, text_chunk in enumerate(chunk_text(record.text, chunk_size, overlap)):
-            chunk_id_source = f"{prefix or 'chunk'}-{record.metadata.get('source', '')}-{index}-{text_chunk[:32]}"
-            chunk_id = hashlib.sha1(chunk_id_source.encode("utf-8")).hexdigest()
-            chunks.append(
-                DocumentChunk(
-                    id=chunk_id,
-                    text=text_chunk,
-                    metadata=merge_metadata(record.metadata, {"chunk_index": str(index)}),
-                )
+    return list(iter_chunks(records, chunk_size, overlap, prefix, tokenizer, chunking))
+
+
+def iter_chunks(
+    records: Iterable[ArtifactRecord],
+    chunk_size: int = 200,
+    overlap: int = 40,
+    prefix: str | None = None,
+    tokenizer: Optional[str] = None,
+    chunking: str = "auto",
+) -> Iterator[DocumentChunk]:
+    """Lazily chunk records as they arrive from a streaming loader.
+
+    With ``chunking="auto"`` each record's ``doc_type`` picks a strategy from
+    ``DOC_TYPE_STRATEGIES``; ``"window"`` slides the token window over every
+    record. ``char_start``/``char_end`` are offsets into the record's text;
+    packed chunks span whole records and carry none. Records are only packed
+    when their metadata agrees on every non-numeric key, so each metadata
+    value of a packed chunk still holds for every record in it and filters
+    on those keys match exactly.
+    """
+
+    if chunking not in CHUNKING_MODES:
+        raise ValueError(f"Unsupported chunking mode: {chunking}")
+    counters: Dict[str, int] = {}
+    pack: List[ArtifactRecord] = []
+    pack_tokens = 0
+    pack_group: Optional[Tuple[Tuple[str, str], ...]] = None
+
+    def emit(text: str, metadata: Dict[str, str], extra: Dict[str, str]) -> DocumentChunk:
+        source = metadata.get("source", "")
+        index = counters.get(source, 0)
+        counters[source] = index + 1
+        chunk_id_source = f"{prefix or 'chunk'}-{source}-{index}-{text[:32]}"
+        return DocumentChunk(
+            id=hashlib.sha1(chunk_id_source.encode("utf-8")).hexdigest(),
+            text=text,
+            metadata=merge_metadata(metadata, {"chunk_index": str(index), **extra}),
+        )
+
+    def flush() -> Iterator[DocumentChunk]:
+        nonlocal pack, pack_tokens
+        if len(pack) == 1:
+            yield emit(pack[0].text, pack[0].metadata, {"char_start": "0", "char_end": str(len(pack[0].text))})
+        elif pack:
+            yield emit("\n".join(record.text for record in pack), _packed_metadata(pack), {"records": str(len(pack))})
+        pack, pack_tokens = [], 0
+
+    def windows(record: ArtifactRecord, start: int, body_start: int, end: int, extra: Dict[str, str]):
+        text = record.text
+        heading = text[start:body_start].strip()
+        section = text if (start, end) == (0, len(text)) else text[start:end]
+        if not heading or count_tokens(section, tokenizer) <= chunk_size:
+            spans = [(begin + start, stop + start) for begin, stop in chunk_spans(section, chunk_size, overlap, tokenizer)]
+            for begin, stop in spans:
+                yield emit(text[begin:stop], record.metadata, {**extra, "char_start": str(begin), "char_end": str(stop)})
+            return
+        # An oversized section or issue repeats its heading (or summary) line
+        # in every window so each chunk stays self-describing.
+        budget = max(chunk_size - count_tokens(heading, tokenizer), chunk_size // 2, 1)
+        for begin, stop in chunk_spans(text[body_start:end], budget, overlap, tokenizer):
+            begin, stop = begin + body_start, stop + body_start
+            yield emit(
+                f"{heading}\n{text[begin:stop]}",
+                record.metadata,
+                {**extra, "char_start": str(begin), "char_end": str(stop)},
             )
-    return chunks
+
+    for record in records:
+        strategy = DOC_TYPE_STRATEGIES.get(record.metadata.get("doc_type", ""), "window") if chunking == "auto" else "window"
+        if strategy != "pack":
+            yield from flush()
+        if strategy == "pack":
+            group = _pack_group(record.metadata)
+            tokens = count_tokens(record.text, tokenizer)
+            if group != pack_group or pack_tokens + tokens > chunk_size:
+                yield from flush()
+                pack_group = group
+            if tokens > chunk_size:
+                yield from windows(record, 0, 0, len(record.text), {})
+                continue
+            pack.append(record)
+            pack_tokens += tokens
+        elif strategy == "issue":
+            newline = record.text.find("\n")
+            yield from windows(record, 0, newline + 1 if newline > 0 else 0, len(record.text), {})
+        elif strategy == "headings":
+            for start, body_start, end, path in heading_sections(record.text):
+                extra = {"section": path[-1], "heading_path": " > ".join(path)} if path else {}
+                yield from windows(record, start, body_start, end, extra)
+        else:
+            yield from windows(record, 0, 0, len(record.text), {})
+    yield from flush()
+
+
+def _pack_group(metadata: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """Records pack together only when this matches: same keys, same non-numeric values."""
+
+    return tuple(sorted((key, "" if value.isdigit() else value) for key, value in metadata.items()))
+
+
+def _packed_metadata(records: List[ArtifactRecord]) -> Dict[str, str]:
+    """Metadata of packed records, which differ only in numeric keys.
+
+    A numeric key such as ``row`` keeps the first value and gains
+    ``<key>_end`` with the last one.
+    """
+
+    metadata = dict(records[0].metadata)
+    for key in records[0].metadata:
+        if any(record.metadata[key] != metadata[key] for record in records[1:]):
+            metadata[f"{key}_end"] = records[-1].metadata[key]
+    return metadata
@@ -9,6 +9,8 @@ from bs4 import BeautifulSoup
 from rag.ingestion.base_loader import ArtifactLoader
 from rag.models import ArtifactRecord
 
+HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+
 
 class HtmlLoader(ArtifactLoader):
     """Extracts cleaned text from HTML pages."""
@@ -21,5 +23,9 @@ class HtmlLoader(ArtifactLoader):
         soup = BeautifulSoup(html, "html.parser")
         for script in soup(["script", "style"]):
             script.decompose()
+        # Headings become Markdown-style lines so the chunker can split on them.
+        for heading in soup(HEADING_TAGS):
+            title = heading.get_text(" ", strip=True)
+            heading.replace_with(f"\n{'#' * int(heading.name[1])} {title}\n" if title else "\n")
         text = "\n".join(line.strip() for line in soup.get_text().splitlines())
         yield ArtifactRecord(text=text, metadata={"section": "body"})
@@ -17,11 +17,22 @@ class PdfLoader(ArtifactLoader):
         super().__init__(path, doc_type="pdf")
 
     def _load(self) -> Iterable[ArtifactRecord]:
-        reader = PdfReader(str(self.path))
-        for page_number, page in enumerate(reader.pages, start=1):
-            text = page.extract_text() or ""
-            if text.strip():
-                yield ArtifactRecord(
-                    text=text,
-                    metadata={"page": str(page_number)},
-                )
+        # Given a path, pypdf reads the whole file into memory; a file handle
+        # lets it seek to each page's objects instead.
+        with self.path.open("rb") as handle:
+            reader = PdfReader(handle)
+            # Parsed objects (content streams, fonts) are cached on the reader
+            # in ``resolved_objects``, a private dict (written against pypdf
+            # 6.20). Dropping it after each page keeps memory
+            # flat at the cost of re-parsing shared resources; if a release
+            # renames or changes it, pages are still read, just without the cap.
+            for page_number, page in enumerate(reader.pages, start=1):
+                text = page.extract_text() or ""
+                resolved = getattr(reader, "resolved_objects", None)
+                if isinstance(resolved, dict):
+                    resolved.clear()
+                if text.strip():
+                    yield ArtifactRecord(
+                        text=text,
+                        metadata={"page": str(page_number)},
+                    )
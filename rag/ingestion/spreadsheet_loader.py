@@ -34,14 +34,19 @@ class SpreadsheetLoader(ArtifactLoader):
                 yield ArtifactRecord(text=text, metadata={"row": str(idx)})
 
     def _load_xlsx(self) -> Iterable[ArtifactRecord]:
-        workbook = load_workbook(filename=self.path, data_only=True)
-        for sheet in workbook.worksheets:
-            headers = [cell.value or "" for cell in next(sheet.iter_rows(max_row=1))]
-            for row_index, row in enumerate(sheet.iter_rows(min_row=2), start=2):
-                values = [cell.value for cell in row]
-                pairs = [f"{header}: {value}" for header, value in zip(headers, values)]
-                text = " | ".join(pairs)
-                yield ArtifactRecord(
-                    text=text,
-                    metadata={"sheet": sheet.title, "row": str(row_index)},
-                )
+        # Read-only mode streams rows from the sheet XML instead of building
+        # every cell object up front.
+        workbook = load_workbook(filename=self.path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                rows = sheet.iter_rows(values_only=True)
+                headers = [value or "" for value in next(rows, ())]
+                for row_index, values in enumerate(rows, start=2):
+                    pairs = [f"{header}: {value}" for header, value in zip(headers, values)]
+                    text = " | ".join(pairs)
+                    yield ArtifactRecord(
+                        text=text,
+                        metadata={"sheet": sheet.title, "row": str(row_index)},
+                    )
+        finally:
+            workbook.close()
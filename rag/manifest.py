@@ -0,0 +1,117 @@
+"""Content-hash manifest used for incremental re-ingestion."""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+
+@dataclass
+class SourceState:
+    """What the store last ingested from one artifact file."""
+
+    path: str
+    mtime: float
+    size: int
+    content_hash: str
+    chunk_ids: List[str] = field(default_factory=list)
+
+
+def file_hash(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with Path(path).open("rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_key(path: Path) -> str:
+    return str(Path(path).resolve())
+
+
+class SourceManifest:
+    """Tracks path, mtime, size, content hash and chunk ids per ingested source.
+
+    The manifest lives in a ``<table>_manifest`` table inside the vector store's
+    SQLite file so it is always moved and backed up together with the chunks.
+    """
+
+    def __init__(self, path: Path, table_name: str = "chunks") -> None:
+        self.table = f"{table_name}_manifest"
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+
+    def get(self, path: Path) -> Optional[SourceState]:
+        row = self._connection.execute(
+            f"SELECT path, mtime, size, content_hash, chunk_ids FROM {self.table} WHERE path = ?",
+            (manifest_key(path),),
+        ).fetchone()
+        if row is None:
+            return None
+        key, mtime, size, content_hash, chunk_ids = row
+        return SourceState(key, mtime, size, content_hash, json.loads(chunk_ids))
+
+    def paths(self) -> List[str]:
+        return [path for (path,) in self._connection.execute(f"SELECT path FROM {self.table}")]
+
+    def record(self, state: SourceState) -> None:
+        self._connection.execute(
+            f"""
+            INSERT INTO {self.table} (path, mtime, size, content_hash, chunk_ids)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                mtime=excluded.mtime,
+                size=excluded.size,
+                content_hash=excluded.content_hash,
+                chunk_ids=excluded.chunk_ids
+            """,
+            (state.path, state.mtime, state.size, state.content_hash, json.dumps(state.chunk_ids)),
+        )
+        self._connection.commit()
+
+    def remove(self, paths: Iterable[str]) -> None:
+        self._connection.executemany(
+            f"DELETE FROM {self.table} WHERE path = ?",
+            ((path,) for path in paths),
+        )
+        self._connection.commit()
+
+    def check(self, path: Path, force: bool = False) -> tuple[Optional[SourceState], Optional[SourceState]]:
+        """Return ``(previous, current)`` states, with ``current=None`` if unchanged.
+
+        The content hash is only computed when mtime or size moved, so an
+        unchanged tree costs one ``stat`` per file. A touched file whose bytes
+        did not change has its mtime refreshed and is still reported unchanged.
+        ``force`` reports every file as changed.
+        """
+
+        stat = Path(path).stat()
+        previous = self.get(path)
+        if force:
+            return previous, SourceState(manifest_key(path), stat.st_mtime, stat.st_size, file_hash(path))
+        if previous is not None and previous.mtime == stat.st_mtime and previous.size == stat.st_size:
+            return previous, None
+        content_hash = file_hash(path)
+        current = SourceState(manifest_key(path), stat.st_mtime, stat.st_size, content_hash)
+        if previous is not None and previous.content_hash == content_hash:
+            current.chunk_ids = previous.chunk_ids
+            self.record(current)
+            return previous, None
+        return previous, current
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,45 @@
+"""Process-wide registry of loaded models.
+
+Loading a sentence-transformer (or any other model) takes seconds and hundreds
+of megabytes, so every retriever, ingest run and generator in a process shares
+one instance per ``(kind, name)`` instead of loading its own.
+"""
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+_models: Dict[Tuple[str, str], Any] = {}
+_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def get_model(kind: str, name: str, factory: Callable[[], Any]) -> Any:
+    """Return the shared model for ``(kind, name)``, calling ``factory`` on first use.
+
+    Concurrent first calls for the same key wait for a single load; loads of
+    different models do not block each other.
+    """
+
+    key = (kind, name)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _models:
+            _models[key] = factory()
+        return _models[key]
+
+
+def loaded_models() -> List[Tuple[str, str]]:
+    return list(_models)
+
+
+def clear() -> None:
+    """Forget every loaded model, e.g. to release memory or between tests."""
+
+    with _registry_lock:
+        _models.clear()
+        _locks.clear()
@@ -3,7 +3,10 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import TYPE_CHECKING, Dict, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 @dataclass
@@ -26,14 +29,14 @@ class DocumentChunk:
     id: str
     text: str
     metadata: Dict[str, str]
-    embedding: Optional[Iterable[float]] = None
+    embedding: Optional["np.ndarray"] = None
 
-    def with_embedding(self, embedding: Iterable[float]) -> "DocumentChunk":
+    def with_embedding(self, embedding: "np.ndarray") -> "DocumentChunk":
         return DocumentChunk(
             id=self.id,
             text=self.text,
             metadata=self.metadata,
-            embedding=list(embedding),
+            embedding=embedding,
         )
 
 
@@ -1,20 +1,217 @@
-"""Optional re-ranking utilities."""
+"""Second-stage re-ranking of retrieved candidates.
+
+Retrieval over-fetches ``RerankerConfig.candidates`` chunks cheaply from the
+vector store; a reranker then scores each ``(query, chunk)`` pair with a more
+precise scorer and keeps the best ``top_k``. A larger candidate budget improves
+recall at the cost of scoring more pairs.
+"""
 from __future__ import annotations
 
+import importlib.util
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
 
+from rag import model_registry
 from rag.models import DocumentChunk
 
+TOKEN_PATTERN = re.compile(r"[\w-]+")
+
 
 @dataclass
 class RerankerConfig:
     enabled: bool = False
+    # Chunks kept after re-ranking; None keeps the retriever's top_k.
     top_k: int | None = None
+    # "bm25" scores lexically and works offline; "cross-encoder" uses
+    # sentence-transformers' CrossEncoder and falls back to bm25 without it.
+    method: str = "bm25"
+    model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    # Candidates fetched from the vector store per query for re-ranking.
+    candidates: int = 20
+    # Pairs per cross-encoder forward pass.
+    batch_size: int = 32
+    # Cached (query, chunk) scores; only used for scorers whose scores do not
+    # depend on the rest of the candidate set.
+    cache_items: int = 10_000
+
+
+class PairScorer(Protocol):
+    name: str
+    cacheable: bool
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        """Relevance of each ``(query, text)`` pair; higher is better."""
+
+
+def tokenize(text: str) -> List[str]:
+    # Hyphens stay inside tokens so Jira keys such as PAY-123 match exactly.
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Scorer:
+    """Okapi BM25 with term statistics taken from each query's candidate set.
+
+    Scores depend on the other candidates, so they are not cached.
+    """
+
+    name = "bm25"
+    cacheable = False
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        by_query: Dict[str, List[int]] = {}
+        for position, (query, _) in enumerate(pairs):
+            by_query.setdefault(query, []).append(position)
+        scores = [0.0] * len(pairs)
+        for query, positions in by_query.items():
+            for position, score in zip(positions, self.score(query, [pairs[p][1] for p in positions])):
+                scores[position] = score
+        return scores
+
+    def score(self, query: str, texts: Sequence[str]) -> List[float]:
+        documents = [Counter(tokenize(text)) for text in texts]
+        if not documents:
+            return []
+        lengths = [sum(document.values()) for document in documents]
+        average_length = sum(lengths) / len(lengths) or 1.0
+        frequencies = Counter(term for document in documents for term in document)
+        terms = set(tokenize(query))
+        idf = {
+            term: math.log(1 + (len(documents) - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+            for term in terms
+        }
+        scores = []
+        for document, length in zip(documents, lengths):
+            score = 0.0
+            for term in terms:
+                count = document.get(term, 0)
+                if count:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    score += idf[term] * count * (self.k1 + 1) / (count + norm)
+            scores.append(score)
+        return scores
+
+
+class CrossEncoderScorer:
+    """Scores pairs with a sentence-transformers cross-encoder shared across the process."""
+
+    cacheable = True
+
+    def __init__(self, model_name: str, batch_size: int = 32) -> None:
+        self.name = f"cross-encoder:{model_name}"
+        self.model_name = model_name
+        self.batch_size = batch_size
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        model = model_registry.get_model("cross-encoder", self.model_name, self._load)
+        scores = model.predict([list(pair) for pair in pairs], batch_size=self.batch_size)
+        return [float(score) for score in scores]
+
+    def _load(self):
+        from sentence_transformers import CrossEncoder
+
+        return CrossEncoder(self.model_name)
 
 
 class IdentityReranker:
     """Default no-op reranker that returns incoming chunks."""
 
-    def rerank(self, chunks: Iterable[DocumentChunk]) -> List[DocumentChunk]:
-        return list(chunks)
+    def rerank(self, query: str, chunks: Iterable[DocumentChunk], top_k: Optional[int] = None) -> List[DocumentChunk]:
+        return list(chunks)[:top_k]
+
+    def rerank_many(
+        self,
+        queries: Sequence[str],
+        candidates: Sequence[Sequence[DocumentChunk]],
+        top_k: Optional[int] = None,
+    ) -> List[List[DocumentChunk]]:
+        return [self.rerank(query, chunks, top_k) for query, chunks in zip(queries, candidates)]
+
+
+class ScoringReranker(IdentityReranker):
+    """Orders candidates by a :class:`PairScorer`, with an LRU cache of pair scores."""
+
+    def __init__(
+        self,
+        scorer: PairScorer,
+        top_k: Optional[int] = None,
+        cache_items: int = 10_000,
+    ) -> None:
+        self.scorer = scorer
+        self.top_k = top_k
+        self.cache_items = cache_items if scorer.cacheable else 0
+        self._cache: "OrderedDict[Tuple[str, str, int], float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rerank(self, query: str, chunks: Iterable[DocumentChunk], top_k: Optional[int] = None) -> List[DocumentChunk]:
+        return self.rerank_many([query], [list(chunks)], top_k)[0]
+
+    def rerank_many(
+        self,
+        queries: Sequence[str],
+        candidates: Sequence[Sequence[DocumentChunk]],
+        top_k: Optional[int] = None,
+    ) -> List[List[DocumentChunk]]:
+        """Rerank several candidate lists, scoring every uncached pair in shared batches."""
+
+        top_k = top_k or self.top_k
+        keys = [[(query, chunk.id, hash(chunk.text)) for chunk in chunks] for query, chunks in zip(queries, candidates)]
+        scores = self._cached([key for row in keys for key in row])
+        missing = {}
+        for query, chunks, row in zip(queries, candidates, keys):
+            for chunk, key in zip(chunks, row):
+                if key not in scores and key not in missing:
+                    missing[key] = (query, chunk.text)
+        if missing:
+            # One call for all queries: the cross-encoder fills its own batches of
+            # ``batch_size`` and BM25 sees each query's full candidate set.
+            computed = dict(zip(missing, self.scorer.score_pairs(list(missing.values()))))
+            scores.update(computed)
+            self._store(computed)
+        ranked = []
+        for chunks, row in zip(candidates, keys):
+            order = sorted(range(len(chunks)), key=lambda position: scores[row[position]], reverse=True)
+            ranked.append([chunks[position] for position in order][:top_k])
+        return ranked
+
+    def _cached(self, keys: List[Tuple[str, str, int]]) -> Dict[Tuple[str, str, int], float]:
+        if not self.cache_items:
+            return {}
+        with self._lock:
+            found = {}
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    found[key] = self._cache[key]
+            return found
+
+    def _store(self, scores: Dict[Tuple[str, str, int], float]) -> None:
+        if not self.cache_items:
+            return
+        with self._lock:
+            self._cache.update(scores)
+            while len(self._cache) > self.cache_items:
+                self._cache.popitem(last=False)
+
+
+def build_reranker(config: Optional[RerankerConfig]) -> IdentityReranker:
+    """The reranker described by ``config``; the identity reranker when disabled."""
+
+    if config is None or not config.enabled:
+        return IdentityReranker()
+    if config.method == "cross-encoder" and importlib.util.find_spec("sentence_transformers") is not None:
+        scorer: PairScorer = CrossEncoderScorer(config.model_name, config.batch_size)
+    elif config.method in {"bm25", "cross-encoder"}:
+        scorer = BM25Scorer()
+    else:
+        raise ValueError(f"Unsupported reranker method: {config.method}")
+    return ScoringReranker(scorer, config.top_k, config.cache_items)
@@ -0,0 +1,102 @@
+"""In-process LRU + TTL cache of retrieval results."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+@dataclass
+class ResultCacheStats:
+    hits: int = 0
+    misses: int = 0
+    # Entries dropped because they outlived the TTL, exceeded capacity, or
+    # belonged to an older store generation.
+    expired: int = 0
+    evicted: int = 0
+    invalidated: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class ResultCache(Generic[V]):
+    """Bounded LRU whose entries also expire ``ttl_seconds`` after being stored.
+
+    Entries are tagged with the store generation they were computed against;
+    seeing a newer generation drops everything, so results never outlive a
+    write to the store.
+    """
+
+    def __init__(
+        self,
+        max_items: int = 1024,
+        ttl_seconds: Optional[float] = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.stats = ResultCacheStats()
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, generation: int) -> Optional[V]:
+        with self._lock:
+            self._sync(generation)
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and self._clock() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.stats.expired += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: V, generation: int) -> None:
+        with self._lock:
+            if self._generation is None:
+                self._generation = generation
+            # A result computed before a concurrent write is dropped rather than
+            # cached under the newer generation.
+            if self._generation != generation or self.max_items <= 0:
+                return
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.stats.evicted += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.stats.invalidated += len(self._entries)
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _sync(self, generation: int) -> None:
+        if generation != self._generation:
+            self.stats.invalidated += len(self._entries)
+            self._entries.clear()
+            self._generation = generation
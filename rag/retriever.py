@@ -1,35 +1,143 @@
 """Semantic retriever built on the vector store."""
 from __future__ import annotations
 
+import json
 from dataclasses import dataclass
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 from rag.embedder import EmbeddingClient, EmbeddingConfig
+from rag.dedup import maximal_marginal_relevance
+from rag.embedding_cache import normalize_text
 from rag.models import DocumentChunk
-from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
+from rag.result_cache import ResultCache, ResultCacheStats
+from rag.sharded_store import ShardedStoreConfig, open_store
+from rag.vector_store import MMR_CANDIDATES, VectorStoreConfig
 
 
 @dataclass
 class RetrieverConfig:
-    vector_store: VectorStoreConfig
+    # A ShardedStoreConfig searches several shards in parallel.
+    vector_store: Union[VectorStoreConfig, ShardedStoreConfig]
     embedding: EmbeddingConfig | None = None
     top_k: int = 5
+    # "vector" ranks by embedding similarity; "hybrid" fuses it with FTS5 BM25
+    # ranking through reciprocal rank fusion; "lexical" uses BM25 alone.
+    mode: str = "vector"
+    # Candidates taken from each ranking before fusion, and the RRF constant.
+    hybrid_candidates: int = 50
+    rrf_k: int = 60
+    # Result cache keyed by (normalized query, top_k, filters, store generation);
+    # 0 disables it. Entries expire after cache_ttl_seconds (None: never).
+    cache_items: int = 1024
+    cache_ttl_seconds: Optional[float] = 300.0
+    # Weight (0-1) of redundancy in maximal marginal relevance re-ordering of
+    # vector and hybrid results; None keeps the plain relevance order.
+    diversity: Optional[float] = None
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[DocumentChunk]], k: int = 60) -> List[DocumentChunk]:
+    """Merge rankings by summing ``1 / (k + rank)`` for every list a chunk appears in.
+
+    Only ranks are used, so BM25 and cosine scores need no calibration against
+    each other. Ties keep the order in which chunks were first seen.
+    """
+
+    scores: Dict[str, float] = {}
+    chunks: Dict[str, DocumentChunk] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, start=1):
+            scores[chunk.id] = scores.get(chunk.id, 0.0) + 1.0 / (k + rank)
+            chunks.setdefault(chunk.id, chunk)
+    return [chunks[chunk_id] for chunk_id in sorted(scores, key=scores.__getitem__, reverse=True)]
 
 
 class SemanticRetriever:
     def __init__(self, config: RetrieverConfig) -> None:
+        if config.mode not in {"vector", "hybrid", "lexical"}:
+            raise ValueError(f"Unsupported retrieval mode: {config.mode}")
         self.config = config
         self.embedder = EmbeddingClient(config.embedding)
-        self.vector_store = SQLiteVectorStore(config.vector_store)
+        self.vector_store = open_store(config.vector_store)
+        self.cache: Optional[ResultCache[List[DocumentChunk]]] = None
+        if config.cache_items > 0:
+            self.cache = ResultCache(config.cache_items, config.cache_ttl_seconds)
 
     def retrieve(
         self,
         query: str,
         top_k: Optional[int] = None,
-        filters: Optional[Dict[str, str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
     ) -> List[DocumentChunk]:
-        query_embedding = self.embedder.embed_query(query)
-        return self.vector_store.similarity_search(query_embedding, top_k or self.config.top_k, filters)
+        return self.retrieve_many([query], top_k, filters)[0]
+
+    def retrieve_many(
+        self,
+        queries: Sequence[str],
+        top_k: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[DocumentChunk]]:
+        """Retrieve for a batch of queries with one embedding call and one scoring pass.
+
+        Cached results are reused while the store generation is unchanged; only
+        the remaining queries are embedded and scored.
+        """
+
+        if not queries:
+            return []
+        top_k = top_k or self.config.top_k
+        if self.cache is None:
+            return self._search(list(queries), top_k, filters)
+        generation = self.vector_store.generation
+        keys = [self._cache_key(query, top_k, filters) for query in queries]
+        results: Dict[Tuple[Any, ...], List[DocumentChunk]] = {}
+        for key in keys:
+            if key not in results:
+                cached = self.cache.get(key, generation)
+                if cached is not None:
+                    results[key] = cached
+        missing = {key: query for key, query in zip(keys, queries) if key not in results}
+        if missing:
+            for key, result in zip(missing, self._search(list(missing.values()), top_k, filters)):
+                self.cache.put(key, result, generation)
+                results[key] = result
+        # Callers get their own lists so they cannot reorder a cached entry.
+        return [list(results[key]) for key in keys]
+
+    def cache_stats(self) -> ResultCacheStats:
+        return self.cache.stats if self.cache is not None else ResultCacheStats()
+
+    def _cache_key(self, query: str, top_k: int, filters: Optional[Dict[str, Any]]) -> Tuple[Any, ...]:
+        return (normalize_text(query), top_k, json.dumps(filters, sort_keys=True, default=str))
+
+    def _search(
+        self,
+        queries: List[str],
+        top_k: int,
+        filters: Optional[Dict[str, Any]],
+    ) -> List[List[DocumentChunk]]:
+        if self.config.mode == "vector" and len(queries) == 1:
+            query_embedding = self.embedder.embed_query(queries[0])
+            return [self.vector_store.similarity_search(query_embedding, top_k, filters, self.config.diversity)]
+        if self.config.mode == "lexical":
+            return [self.vector_store.lexical_search(query, top_k, filters) for query in queries]
+        query_embeddings = self.embedder.embed(queries)
+        if self.config.mode == "vector":
+            return self.vector_store.similarity_search_many(query_embeddings, top_k, filters, self.config.diversity)
+        candidates = max(self.config.hybrid_candidates, top_k)
+        dense = self.vector_store.similarity_search_many(query_embeddings, candidates, filters)
+        fused = [
+            reciprocal_rank_fusion(
+                [ranked, self.vector_store.lexical_search(query, candidates, filters)], self.config.rrf_k
+            )
+            for query, ranked in zip(queries, dense)
+        ]
+        if self.config.diversity:
+            return [
+                maximal_marginal_relevance(query_embedding, ranked[: top_k * MMR_CANDIDATES], top_k, self.config.diversity)
+                for query_embedding, ranked in zip(query_embeddings, fused)
+            ]
+        return [ranked[:top_k] for ranked in fused]
 
     def close(self) -> None:
         self.vector_store.close()
+        self.embedder.close()
@@ -0,0 +1,126 @@
+"""Append-only embedding segment files read through ``np.memmap``.
+
+A segment holds fixed-width rows of one dtype and dimension in a raw ``.bin``
+file plus a parallel ``.norms`` file of float32 row norms. SQLite stays the
+source of truth: it records each segment's committed row count and file name,
+and each chunk's ``(segment, segment_row)``. Bytes past the committed count are
+left over from an interrupted write and are truncated by the next append.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from rag.vector_index import MatrixIndex
+
+
+class SegmentFile:
+    """One append-only file of embedding rows and its norms."""
+
+    def __init__(self, path: Path, dtype: str, dimension: int) -> None:
+        self.path = Path(path)
+        self.norms_path = self.path.with_suffix(".norms")
+        self.dtype = np.dtype(dtype)
+        self.dimension = dimension
+        self._vectors: Optional[np.ndarray] = None
+        self._norms: Optional[np.ndarray] = None
+
+    def append(self, vectors: np.ndarray, norms: np.ndarray, committed_rows: int) -> int:
+        """Write rows after ``committed_rows`` and return the first new row number."""
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dimension)
+        norms = np.ascontiguousarray(norms, dtype=np.float32)
+        for path, data, width in (
+            (self.path, vectors, self.dtype.itemsize * self.dimension),
+            (self.norms_path, norms, 4),
+        ):
+            with path.open("ab") as handle:
+                handle.truncate(committed_rows * width)
+                handle.write(data.tobytes())
+        return committed_rows
+
+    def truncate(self, rows: int) -> None:
+        """Drop rows past ``rows``, e.g. ones appended by a transaction that rolled back."""
+
+        for path, width in ((self.path, self.dtype.itemsize * self.dimension), (self.norms_path, 4)):
+            if path.exists():
+                with path.open("r+b") as handle:
+                    handle.truncate(rows * width)
+
+    def vectors(self, rows: int) -> np.ndarray:
+        """Read-only view of the first ``rows`` rows, shared through the OS page cache."""
+
+        if self._vectors is None or self._vectors.shape[0] < rows:
+            self._vectors = self._map(self.path, self.dtype, (rows, self.dimension))
+        return self._vectors[:rows]
+
+    def norms(self, rows: int) -> np.ndarray:
+        if self._norms is None or self._norms.shape[0] < rows:
+            self._norms = self._map(self.norms_path, np.dtype(np.float32), (rows,))
+        return self._norms[:rows]
+
+    def rewrite(self, path: Path, rows: np.ndarray, committed_rows: int, block: int = 65536) -> "SegmentFile":
+        """Copy ``rows`` (in order) into a new segment file at ``path``."""
+
+        target = SegmentFile(path, self.dtype.name, self.dimension)
+        for candidate in (target.path, target.norms_path):
+            if candidate.exists():
+                candidate.unlink()
+        vectors, norms = self.vectors(committed_rows), self.norms(committed_rows)
+        written = 0
+        for start in range(0, rows.shape[0], block):
+            part = rows[start : start + block]
+            target.append(vectors[part], norms[part], written)
+            written += part.shape[0]
+        if rows.shape[0] == 0:
+            target.append(np.empty((0, self.dimension), self.dtype), np.empty(0, np.float32), 0)
+        return target
+
+    def remove(self) -> None:
+        for path in (self.path, self.norms_path):
+            if path.exists():
+                path.unlink()
+
+    @staticmethod
+    def _map(path: Path, dtype: np.dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        if shape[0] == 0:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class SegmentIndex(MatrixIndex):
+    """Exact index that scores a float32 segment memmap in place.
+
+    Nothing is copied at load time: only the row -> id mapping is read from
+    SQLite. Rows superseded by later upserts or deletes stay in the file until
+    compaction and are masked out of every search.
+    """
+
+    def __init__(self, vectors: np.ndarray, norms: np.ndarray, ids_by_row: Sequence[Optional[str]]) -> None:
+        super().__init__(vectors.shape[1])
+        self._vectors = vectors
+        self._segment_norms = norms
+        self.ids: List[Optional[str]] = list(ids_by_row)
+        self.positions = {chunk_id: row for row, chunk_id in enumerate(self.ids) if chunk_id is not None}
+        self._dead = np.asarray([row for row, chunk_id in enumerate(self.ids) if chunk_id is None], dtype=np.int64)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._vectors
+
+    @property
+    def norms(self) -> np.ndarray:
+        return self._segment_norms
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> np.ndarray:
+        raise TypeError("SegmentIndex is read-only; reload it after writing to the segment")
+
+    def remove(self, ids):
+        raise TypeError("SegmentIndex is read-only; reload it after writing to the segment")
+
+    def _mask(self, scores: np.ndarray, rows: Optional[np.ndarray]) -> None:
+        if rows is None and self._dead.size:
+            scores[:, self._dead] = -np.inf
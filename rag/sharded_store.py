@@ -0,0 +1,556 @@
+"""Vector store partitioned across several SQLite shards.
+
+A catalog database at ``path`` records the shards, where every chunk lives
+and, when partitioning by a metadata key, which shard owns each key value.
+Shards are ordinary :class:`SQLiteVectorStore` files stored next to it
+(``<path>.shard-<n>.sqlite``) and share one set of store options.
+
+Searches run on every candidate shard at once and the per-shard top-k lists
+are merged with a heap. Each shard is confined to its own thread because a
+SQLite connection belongs to the thread that opened it; NumPy scoring and
+SQLite both release the GIL, so shards really do search in parallel.
+
+Chunks are routed either by a jump consistent hash of their id
+(``partition="hash"``) or by one metadata value (``partition="doc_type"``).
+Adding a shard only affects where new chunks go; :meth:`ShardedVectorStore.rebalance`
+then moves existing chunks, a batch at a time, without re-embedding anything.
+Near-duplicates are detected within a shard and always live with their
+canonical chunk, so partition by a key when copies should be found across
+the whole corpus.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import heapq
+import json
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from rag.dedup import maximal_marginal_relevance
+from rag.filters import matches
+from rag.models import DocumentChunk
+from rag.vector_store import MMR_CANDIDATES, SQLiteVectorStore, VectorStoreConfig
+
+
+@dataclass
+class ShardedStoreConfig:
+    # Catalog database; shards are stored next to it.
+    path: Path
+    # Number of shards created for a new store; use add_shard() to grow it.
+    shards: int = 4
+    # "hash" spreads chunks by id; any other value names the metadata key
+    # (e.g. doc_type or project) whose values are assigned to shards, so
+    # filters on that key only search the shards holding matching values.
+    partition: str = "hash"
+    # VectorStoreConfig options shared by every shard (index, dtype, fts, ...).
+    shard: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def table_name(self) -> str:
+        return self.shard.get("table_name", "chunks")
+
+    def shard_config(self, shard_id: int) -> VectorStoreConfig:
+        path = Path(self.path)
+        return VectorStoreConfig(**{**self.shard, "path": path.with_name(f"{path.name}.shard-{shard_id}.sqlite")})
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Lamping and Veach's jump consistent hash: growing ``buckets`` by one moves 1/n of the keys."""
+
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def id_hash(chunk_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(chunk_id.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def store_config(data: Dict[str, Any]) -> Union[VectorStoreConfig, ShardedStoreConfig]:
+    """Build a store config from the ``vector_store`` section of ``rag.yml``.
+
+    A positive ``shards`` entry selects the sharded store; the remaining
+    options then apply to every shard.
+    """
+
+    options = {**data, "path": Path(data["path"])}
+    shards = options.pop("shards", 0)
+    partition = options.pop("partition", "hash")
+    if not shards:
+        return VectorStoreConfig(**options)
+    path = options.pop("path")
+    return ShardedStoreConfig(path=path, shards=shards, partition=partition, shard=options)
+
+
+def open_store(config: Union[VectorStoreConfig, ShardedStoreConfig]) -> Union[SQLiteVectorStore, "ShardedVectorStore"]:
+    if isinstance(config, ShardedStoreConfig):
+        return ShardedVectorStore(config)
+    return SQLiteVectorStore(config)
+
+
+class _Shard:
+    """A shard's store, only ever touched from the shard's own thread."""
+
+    def __init__(self, shard_id: int, config: VectorStoreConfig) -> None:
+        self.id = shard_id
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"shard-{shard_id}")
+        try:
+            self.store: SQLiteVectorStore = self._executor.submit(SQLiteVectorStore, config).result()
+        except Exception:
+            self._executor.shutdown()
+            raise
+
+    def run(self, function: Callable[..., Any], *args: Any) -> Future:
+        return self._executor.submit(function, *args)
+
+    def submit(self, method: str, *args: Any) -> Future:
+        return self.run(getattr(self.store, method), *args)
+
+    def call(self, method: str, *args: Any) -> Any:
+        return self.submit(method, *args).result()
+
+    def close(self) -> None:
+        try:
+            self.call("close")
+        finally:
+            self._executor.shutdown()
+
+
+class ShardedVectorStore:
+    """Drop-in replacement for :class:`SQLiteVectorStore` spread over several shards.
+
+    Writes go to the catalog after the shards, so a crash in between leaves a
+    chunk searchable but unknown to the catalog; re-ingesting its file repairs it.
+    Adding a shard or a partition value bumps the catalog ``version``; every
+    handle checks it before routing or searching and reloads what changed, so
+    readers see shards and values added by other handles and processes.
+    """
+
+    def __init__(self, config: ShardedStoreConfig) -> None:
+        if config.shards < 1:
+            raise ValueError("A sharded store needs at least one shard")
+        if not config.partition:
+            raise ValueError("partition must be 'hash' or a metadata key")
+        self.config = config
+        self._catalog = sqlite3.connect(config.path)
+        self._ensure_catalog()
+        self._routes: Dict[str, int] = {}
+        self._shards: List[_Shard] = []
+        self._version: Optional[int] = None
+        try:
+            self._refresh()
+        except Exception:
+            self.close()
+            raise
+
+    def _ensure_catalog(self) -> None:
+        cursor = self._catalog.cursor()
+        cursor.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS shards (id INTEGER PRIMARY KEY)")
+        # route is the JSON-encoded partition value (null: key absent); NULL when hashing.
+        cursor.execute("CREATE TABLE IF NOT EXISTS routes (route TEXT PRIMARY KEY, shard INTEGER NOT NULL)")
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS locations (
+                chunk_id TEXT PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                route TEXT
+            ) WITHOUT ROWID
+            """
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_locations_route ON locations(route, shard)")
+        cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('partition', ?)", (self.config.partition,))
+        cursor.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('version', '0')")
+        (partition,) = cursor.execute("SELECT value FROM settings WHERE key = 'partition'").fetchone()
+        if partition != self.config.partition:
+            raise ValueError(f"Store at {self.config.path} is partitioned by {partition!r}, not {self.config.partition!r}")
+        if cursor.execute("SELECT 1 FROM shards").fetchone() is None:
+            cursor.executemany("INSERT INTO shards (id) VALUES (?)", ((shard_id,) for shard_id in range(self.config.shards)))
+        self._catalog.commit()
+
+    @property
+    def catalog_version(self) -> int:
+        """Counter bumped whenever a shard or partition value is added or re-routed."""
+
+        (version,) = self._catalog.execute("SELECT value FROM settings WHERE key = 'version'").fetchone()
+        return int(version)
+
+    def _bump_version(self) -> None:
+        self._catalog.execute("UPDATE settings SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+    def _refresh(self) -> None:
+        """Reload routes and open shards if the catalog changed since the last look."""
+
+        version = self.catalog_version
+        if version == self._version:
+            return
+        self._routes = dict(self._catalog.execute("SELECT route, shard FROM routes"))
+        for (shard_id,) in self._catalog.execute("SELECT id FROM shards WHERE id >= ? ORDER BY id", (len(self._shards),)).fetchall():
+            self._shards.append(_Shard(shard_id, self.config.shard_config(shard_id)))
+        self._version = version
+
+    @property
+    def shard_count(self) -> int:
+        self._refresh()
+        return len(self._shards)
+
+    @property
+    def generation(self) -> int:
+        """Sum of the shard generations plus the catalog version.
+
+        It grows with every write to any shard and with every routing change,
+        so caches keyed on it also drop results computed before a shard or
+        partition value was added.
+        """
+
+        self._refresh()
+        return self._version + sum(
+            self._gather(shard.run(lambda store: store.generation, shard.store) for shard in self._shards)
+        )
+
+    # -- routing -----------------------------------------------------------
+
+    def _route(self, chunk: DocumentChunk) -> Optional[str]:
+        if self.config.partition == "hash":
+            return None
+        value = chunk.metadata.get(self.config.partition)
+        return json.dumps(None if value is None else str(value))
+
+    def _target(self, chunk_id: str, route: Optional[str]) -> int:
+        if route is None:
+            return jump_hash(id_hash(chunk_id), len(self._shards))
+        if route not in self._routes:
+            # Another handle may have routed this value already.
+            self._refresh()
+        if route not in self._routes:
+            # New values go to the shard holding the fewest chunks, then the fewest values.
+            load = dict(self._catalog.execute("SELECT shard, COUNT(*) FROM locations GROUP BY shard"))
+            owned = list(self._routes.values())
+            shard_id = min(
+                range(len(self._shards)), key=lambda shard_id: (load.get(shard_id, 0), owned.count(shard_id), shard_id)
+            )
+            self._catalog.execute("INSERT OR IGNORE INTO routes (route, shard) VALUES (?, ?)", (route, shard_id))
+            self._bump_version()
+            (self._routes[route],) = self._catalog.execute("SELECT shard FROM routes WHERE route = ?", (route,)).fetchone()
+        return self._routes[route]
+
+    def _locations(self, chunk_ids: Sequence[str]) -> Dict[str, int]:
+        located: Dict[str, int] = {}
+        for offset in range(0, len(chunk_ids), 500):
+            part = list(chunk_ids[offset : offset + 500])
+            located.update(
+                self._catalog.execute(
+                    f"SELECT chunk_id, shard FROM locations WHERE chunk_id IN ({', '.join('?' for _ in part)})", part
+                )
+            )
+        return located
+
+    def _candidate_shards(self, filters: Optional[dict]) -> List[_Shard]:
+        """Shards that can hold chunks matching ``filters``."""
+
+        self._refresh()
+        if self.config.partition == "hash":
+            return list(self._shards)
+        expression = (filters or {}).get(self.config.partition)
+        owners = {
+            shard_id
+            for route, shard_id in self._routes.items()
+            if filters is None or self.config.partition not in filters or matches(expression, json.loads(route))
+        }
+        return [shard for shard in self._shards if shard.id in owners]
+
+    # -- writes ------------------------------------------------------------
+
+    def upsert(self, chunks: Iterable[DocumentChunk]) -> None:
+        chunks = list(chunks)
+        if not chunks:
+            return
+        self._refresh()
+        routes = {chunk.id: self._route(chunk) for chunk in chunks}
+        targets = {chunk_id: self._target(chunk_id, route) for chunk_id, route in routes.items()}
+        groups: Dict[int, List[DocumentChunk]] = {}
+        for chunk in chunks:
+            groups.setdefault(targets[chunk.id], []).append(chunk)
+        self._gather(self._shards[shard_id].submit("upsert", group) for shard_id, group in groups.items())
+        # Chunks whose route changed are removed from their old shard only once stored in the new one.
+        self._remove_moved(targets)
+        self._catalog.executemany(
+            "INSERT OR REPLACE INTO locations (chunk_id, shard, route) VALUES (?, ?, ?)",
+            ((chunk_id, shard_id, routes[chunk_id]) for chunk_id, shard_id in targets.items()),
+        )
+        self._catalog.commit()
+
+    def split_duplicates(
+        self, chunks: Iterable[DocumentChunk]
+    ) -> Tuple[List[DocumentChunk], List[Tuple[DocumentChunk, str]]]:
+        """``SQLiteVectorStore.split_duplicates`` against the shard each chunk is routed to."""
+
+        chunks = list(chunks)
+        self._refresh()
+        groups: Dict[int, List[DocumentChunk]] = {}
+        for chunk in chunks:
+            groups.setdefault(self._target(chunk.id, self._route(chunk)), []).append(chunk)
+        self._catalog.commit()
+        results = self._gather(
+            self._shards[shard_id].submit("split_duplicates", group) for shard_id, group in groups.items()
+        )
+        unique_ids = {chunk.id for unique, _ in results for chunk in unique}
+        return (
+            [chunk for chunk in chunks if chunk.id in unique_ids],
+            [pair for _, duplicates in results for pair in duplicates],
+        )
+
+    def add_duplicates(self, duplicates: Iterable[Tuple[DocumentChunk, str]]) -> None:
+        """Record duplicates in the shard of their canonical chunk."""
+
+        duplicates = list(duplicates)
+        if not duplicates:
+            return
+        self._refresh()
+        canonical = self._locations([canonical_id for _, canonical_id in duplicates])
+        targets: Dict[str, int] = {}
+        routes: Dict[str, Optional[str]] = {}
+        groups: Dict[int, List[Tuple[DocumentChunk, str]]] = {}
+        for chunk, canonical_id in duplicates:
+            routes[chunk.id] = self._route(chunk)
+            targets[chunk.id] = canonical.get(canonical_id, self._target(chunk.id, routes[chunk.id]))
+            groups.setdefault(targets[chunk.id], []).append((chunk, canonical_id))
+        self._gather(self._shards[shard_id].submit("add_duplicates", group) for shard_id, group in groups.items())
+        self._remove_moved(targets)
+        self._catalog.executemany(
+            "INSERT OR REPLACE INTO locations (chunk_id, shard, route) VALUES (?, ?, ?)",
+            ((chunk_id, shard_id, routes[chunk_id]) for chunk_id, shard_id in targets.items()),
+        )
+        self._catalog.commit()
+
+    def delete(self, chunk_ids: Iterable[str]) -> None:
+        chunk_ids = list(chunk_ids)
+        self._refresh()
+        groups: Dict[int, List[str]] = {}
+        for chunk_id, shard_id in self._locations(chunk_ids).items():
+            groups.setdefault(shard_id, []).append(chunk_id)
+        self._gather(self._shards[shard_id].submit("delete", ids) for shard_id, ids in groups.items())
+        self._catalog.executemany("DELETE FROM locations WHERE chunk_id = ?", ((chunk_id,) for chunk_id in chunk_ids))
+        self._catalog.commit()
+
+    def _remove_moved(self, targets: Dict[str, int]) -> None:
+        stale: Dict[int, List[str]] = {}
+        for chunk_id, shard_id in self._locations(list(targets)).items():
+            if shard_id != targets[chunk_id]:
+                stale.setdefault(shard_id, []).append(chunk_id)
+        self._gather(self._shards[shard_id].submit("delete", ids) for shard_id, ids in stale.items())
+
+    @contextmanager
+    def bulk_load(self) -> Iterator["ShardedVectorStore"]:
+        """``SQLiteVectorStore.bulk_load`` on every shard for the duration."""
+
+        self._refresh()
+        managers = [(shard, shard.store.bulk_load()) for shard in self._shards]
+        entered = []
+        try:
+            for shard, manager in managers:
+                shard.run(manager.__enter__).result()
+                entered.append((shard, manager))
+            yield self
+        finally:
+            self._gather(shard.run(manager.__exit__, None, None, None) for shard, manager in entered)
+
+    # -- searches ----------------------------------------------------------
+
+    def similarity_search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        filters: Optional[dict] = None,
+        diversity: Optional[float] = None,
+    ) -> List[DocumentChunk]:
+        return self.similarity_search_many(np.asarray(query_embedding).reshape(1, -1), top_k, filters, diversity)[0]
+
+    def similarity_search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        filters: Optional[dict] = None,
+        diversity: Optional[float] = None,
+    ) -> List[List[DocumentChunk]]:
+        """Search every candidate shard in parallel and merge their top-k lists by cosine score."""
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.size == 0:
+            return []
+        queries = queries.reshape(len(queries), -1)
+        fetch = top_k * MMR_CANDIDATES if diversity else top_k
+        per_shard = self._gather(
+            shard.submit("similarity_search_many", queries, fetch, filters) for shard in self._candidate_shards(filters)
+        )
+        results = []
+        for position, query in enumerate(queries):
+            merged = merge_ranked([ranked[position] for ranked in per_shard], _cosine_scores(query), fetch)
+            results.append(maximal_marginal_relevance(query, merged, top_k, diversity) if diversity else merged)
+        return results
+
+    def lexical_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[dict] = None,
+    ) -> List[DocumentChunk]:
+        """BM25 search on every candidate shard, merged by score.
+
+        BM25 uses each shard's own term statistics, so scores from shards with
+        very different content are only approximately comparable.
+        """
+
+        per_shard = self._gather(
+            shard.submit("lexical_search_with_scores", query, top_k, filters) for shard in self._candidate_shards(filters)
+        )
+        return [chunk for chunk, _ in heapq.nlargest(top_k, (pair for ranked in per_shard for pair in ranked), key=lambda pair: pair[1])]
+
+    # -- maintenance -------------------------------------------------------
+
+    def add_shard(self) -> int:
+        """Add an empty shard; new chunks start using it, existing ones move on ``rebalance``."""
+
+        self._refresh()
+        shard_id = len(self._shards)
+        self._catalog.execute("INSERT INTO shards (id) VALUES (?)", (shard_id,))
+        self._bump_version()
+        self._catalog.commit()
+        self._refresh()
+        return shard_id
+
+    def rebalance(self, batch_size: int = 1000) -> int:
+        """Move chunks to the shard they would be routed to now; returns the number moved.
+
+        With hash partitioning that is the jump hash over the current shard
+        count. With a metadata key, whole values are moved from the fullest to
+        the emptiest shard while that narrows the gap between them. Embeddings
+        are copied, not recomputed, and each batch is committed on its own.
+        """
+
+        self._refresh()
+        if self.config.partition != "hash":
+            self._reassign_routes()
+        misplaced: Dict[Tuple[int, int], List[str]] = {}
+        for chunk_id, shard_id, route in self._catalog.execute("SELECT chunk_id, shard, route FROM locations"):
+            target = jump_hash(id_hash(chunk_id), len(self._shards)) if route is None else self._routes[route]
+            if target != shard_id:
+                misplaced.setdefault((shard_id, target), []).append(chunk_id)
+        moved = 0
+        for (source, target), chunk_ids in misplaced.items():
+            for offset in range(0, len(chunk_ids), batch_size):
+                moved += self._move(self._shards[source], self._shards[target], chunk_ids[offset : offset + batch_size])
+        return moved
+
+    def _reassign_routes(self) -> None:
+        counts: Dict[str, int] = dict(self._catalog.execute("SELECT route, COUNT(*) FROM locations GROUP BY route"))
+        load = {shard.id: 0 for shard in self._shards}
+        for route, shard_id in self._routes.items():
+            load[shard_id] += counts.get(route, 0)
+        while True:
+            fullest = max(load, key=load.__getitem__)
+            emptiest = min(load, key=load.__getitem__)
+            gap = load[fullest] - load[emptiest]
+            movable = [route for route, shard_id in self._routes.items() if shard_id == fullest and 0 < counts.get(route, 0) < gap]
+            if not movable:
+                break
+            route = max(movable, key=counts.__getitem__)
+            self._routes[route] = emptiest
+            load[fullest] -= counts[route]
+            load[emptiest] += counts[route]
+        self._catalog.executemany("UPDATE routes SET shard = ? WHERE route = ?", ((shard_id, route) for route, shard_id in self._routes.items()))
+        self._bump_version()
+        self._catalog.commit()
+
+    def _move(self, source: _Shard, target: _Shard, chunk_ids: List[str]) -> int:
+        # Duplicates stay with their canonical chunk; ids that are duplicates
+        # of a chunk not being moved are left where they are.
+        chunks = source.call("get", chunk_ids)
+        duplicates = source.call("duplicates_of", [chunk.id for chunk in chunks])
+        target.call("upsert", chunks)
+        target.call("add_duplicates", duplicates)
+        moved = [chunk.id for chunk in chunks] + [chunk.id for chunk, _ in duplicates]
+        source.call("delete", moved)
+        self._catalog.executemany("UPDATE locations SET shard = ? WHERE chunk_id = ?", ((target.id, chunk_id) for chunk_id in moved))
+        self._catalog.commit()
+        return len(chunks)
+
+    def shard_sizes(self) -> Dict[int, int]:
+        """Chunks (including duplicates) per shard, from the catalog."""
+
+        self._refresh()
+        sizes = {shard.id: 0 for shard in self._shards}
+        sizes.update(self._catalog.execute("SELECT shard, COUNT(*) FROM locations GROUP BY shard"))
+        return sizes
+
+    def close(self) -> None:
+        for shard in self._shards:
+            shard.close()
+        self._catalog.close()
+
+    @staticmethod
+    def _gather(futures: Iterable[Future]) -> List[Any]:
+        futures = list(futures)
+        return [future.result() for future in futures]
+
+
+def _cosine_scores(query: np.ndarray) -> Callable[[List[DocumentChunk]], np.ndarray]:
+    unit = query / (np.linalg.norm(query) + 1e-10)
+
+    def score(chunks: List[DocumentChunk]) -> np.ndarray:
+        vectors = np.vstack([np.asarray(chunk.embedding, dtype=np.float32) for chunk in chunks])
+        return vectors @ unit / (np.linalg.norm(vectors, axis=1) + 1e-10)
+
+    return score
+
+
+def merge_ranked(
+    rankings: Sequence[List[DocumentChunk]],
+    score: Callable[[List[DocumentChunk]], np.ndarray],
+    top_k: int,
+) -> List[DocumentChunk]:
+    """K-way merge of per-shard result lists, keeping the ``top_k`` best by ``score``."""
+
+    scored = [pair for ranked in rankings if ranked for pair in zip(ranked, score(ranked).tolist())]
+    # nlargest is stable, so ties keep shard order and then each shard's own rank.
+    return [chunk for chunk, _ in heapq.nlargest(top_k, scored, key=lambda pair: pair[1])]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Add shards to a sharded vector store and rebalance it")
+    parser.add_argument("--config", type=Path, required=True, help="Path to rag.yml configuration")
+    parser.add_argument("--add", type=int, default=0, help="Empty shards to add")
+    parser.add_argument("--rebalance", action="store_true", help="Move chunks to the shards they now route to")
+    args = parser.parse_args()
+
+    config_data = json.loads(Path(args.config).read_text()) if args.config.suffix == ".json" else None
+    if config_data is None:
+        import yaml
+
+        config_data = yaml.safe_load(Path(args.config).read_text())
+    config = store_config(config_data["vector_store"])
+    if not isinstance(config, ShardedStoreConfig):
+        parser.error("vector_store.shards is not set in the configuration")
+    store = ShardedVectorStore(config)
+    try:
+        for _ in range(args.add):
+            store.add_shard()
+        moved = store.rebalance() if args.rebalance else 0
+        sizes = store.shard_sizes()
+    finally:
+        store.close()
+    print(f"{len(sizes)} shards, {moved} chunks moved: " + ", ".join(f"#{shard_id} {size}" for shard_id, size in sizes.items()))
+
+
+if __name__ == "__main__":
+    main()
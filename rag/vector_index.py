@@ -0,0 +1,324 @@
+"""In-memory vector indexes used by the SQLite vector store."""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class MatrixIndex:
+    """Contiguous float32 embedding matrix with precomputed row norms."""
+
+    def __init__(self, dimension: int) -> None:
+        self.dimension = dimension
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self._matrix = np.empty((0, dimension), dtype=np.float32)
+        self._norms = np.empty(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[: len(self.ids)]
+
+    @property
+    def norms(self) -> np.ndarray:
+        return self._norms[: len(self.ids)]
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> np.ndarray:
+        """Insert or overwrite rows and return the row numbers that were written.
+
+        The last vector wins when an id is repeated within ``ids``.
+        """
+
+        latest: Dict[str, int] = {}
+        for offset, chunk_id in enumerate(ids):
+            latest[chunk_id] = offset
+        if not latest:
+            return np.empty(0, dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dimension)
+        norms = np.linalg.norm(vectors, axis=1)
+        appended = [chunk_id for chunk_id in latest if chunk_id not in self.positions]
+        self._reserve(len(self.ids) + len(appended))
+        for chunk_id in appended:
+            self.positions[chunk_id] = len(self.ids)
+            self.ids.append(chunk_id)
+        rows = np.fromiter((self.positions[chunk_id] for chunk_id in latest), dtype=np.int64, count=len(latest))
+        offsets = np.fromiter(latest.values(), dtype=np.int64, count=len(latest))
+        self._matrix[rows] = vectors[offsets]
+        self._norms[rows] = norms[offsets]
+        return rows
+
+    def remove(self, ids: Iterable[str]) -> Optional[np.ndarray]:
+        """Drop rows and return the boolean mask of rows that were kept."""
+
+        dropped = [self.positions[chunk_id] for chunk_id in set(ids) if chunk_id in self.positions]
+        if not dropped:
+            return None
+        keep = np.ones(len(self.ids), dtype=bool)
+        keep[dropped] = False
+        self._matrix = self.matrix[keep].copy()
+        self._norms = self.norms[keep].copy()
+        self.ids = [chunk_id for chunk_id, kept in zip(self.ids, keep) if kept]
+        self.positions = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        return keep
+
+    def vector(self, chunk_id: str) -> np.ndarray:
+        return self.matrix[self.positions[chunk_id]].copy()
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[str, float]]:
+        """Return ``(id, cosine score)`` pairs for the best ``top_k`` rows."""
+
+        return self._exact_search(np.asarray(query_embedding).reshape(1, -1), top_k, rows)[0]
+
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        block_elements: int = 1 << 26,
+    ) -> List[List[Tuple[str, float]]]:
+        """Score a batch of queries with one matrix-matrix product per block.
+
+        Queries are processed in blocks so the ``queries x rows`` score matrix
+        stays under ``block_elements`` floats.
+        """
+
+        return self._exact_search(query_embeddings, top_k, rows, block_elements)
+
+    def _exact_search(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        block_elements: int = 1 << 26,
+    ) -> List[List[Tuple[str, float]]]:
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        matrix, norms = self.matrix, self.norms
+        if rows is not None:
+            matrix, norms = matrix[rows], norms[rows]
+        if top_k <= 0 or matrix.shape[0] == 0:
+            return [[] for _ in range(queries.shape[0])]
+        count = matrix.shape[0]
+        query_norms = np.linalg.norm(queries, axis=1)
+        block = max(1, block_elements // count)
+        results: List[List[Tuple[str, float]]] = []
+        for start in range(0, queries.shape[0], block):
+            part = queries[start : start + block]
+            scores = (part @ matrix.T) / (query_norms[start : start + block, None] * norms[None, :] + 1e-10)
+            self._mask(scores, rows)
+            if top_k < count:
+                candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            else:
+                candidates = np.broadcast_to(np.arange(count), scores.shape)
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1, kind="stable")
+            best = np.take_along_axis(candidates, order, axis=1)
+            best_scores = np.take_along_axis(candidate_scores, order, axis=1)
+            selected = best if rows is None else rows[best]
+            for query_rows, query_scores in zip(selected, best_scores):
+                results.append(
+                    [
+                        (self.ids[row], float(score))
+                        for row, score in zip(query_rows, query_scores)
+                        if self.ids[row] is not None
+                    ]
+                )
+        return results
+
+    def _mask(self, scores: np.ndarray, rows: Optional[np.ndarray]) -> None:
+        """Hook for indexes whose matrix contains rows that must never be returned."""
+
+    def _reserve(self, size: int) -> None:
+        capacity = self._matrix.shape[0]
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        matrix = np.empty((capacity, self.dimension), dtype=np.float32)
+        norms = np.empty(capacity, dtype=np.float32)
+        matrix[: len(self.ids)] = self.matrix
+        norms[: len(self.ids)] = self.norms
+        self._matrix, self._norms = matrix, norms
+
+
+class IVFIndex(MatrixIndex):
+    """Inverted-file ANN index over spherical k-means centroids.
+
+    Queries are scored against the centroids first and only the rows assigned to
+    the ``nprobe`` closest lists are scored exactly. Raising ``nprobe`` trades
+    latency for recall; ``nprobe >= nlist`` is equivalent to exact search.
+    """
+
+    def __init__(
+        self,
+        dimension: int,
+        nlist: int = 0,
+        nprobe: int = 8,
+        iterations: int = 20,
+        seed: int = 0,
+    ) -> None:
+        super().__init__(dimension)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self) -> None:
+        """Cluster the current rows and assign every row to its nearest list."""
+
+        count = len(self.ids)
+        if count == 0:
+            return
+        nlist = self.nlist or int(np.sqrt(count))
+        nlist = max(1, min(nlist, count))
+        rng = np.random.default_rng(self.seed)
+        sample_rows = np.arange(count)
+        if count > nlist * 256:
+            sample_rows = np.sort(rng.choice(count, nlist * 256, replace=False))
+        sample = self._normalized(sample_rows)
+        centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+            centroids = sums / (np.linalg.norm(sums, axis=1, keepdims=True) + 1e-10)
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = count
+        self._assignments = self._assign(np.arange(count))
+        self._lists = None
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray) -> np.ndarray:
+        rows = super().add(ids, vectors)
+        if self.centroids is None or rows.size == 0:
+            return rows
+        if len(self.ids) > 2 * self.trained_size:
+            # The corpus has outgrown the centroids it was clustered on.
+            self.train()
+            return rows
+        assignments = np.zeros(len(self.ids), dtype=np.int32)
+        assignments[: self._assignments.shape[0]] = self._assignments
+        assignments[rows] = self._assign(rows)
+        self._assignments = assignments
+        self._lists = None
+        return rows
+
+    def remove(self, ids: Iterable[str]) -> Optional[np.ndarray]:
+        keep = super().remove(ids)
+        if keep is not None and self.centroids is not None:
+            self._assignments = self._assignments[keep]
+            self._lists = None
+        return keep
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[Tuple[str, float]]:
+        if self.centroids is None:
+            return super().search(query_embedding, top_k, rows)
+        nprobe = max(1, nprobe or self.nprobe)
+        if nprobe >= self.centroids.shape[0]:
+            return super().search(query_embedding, top_k, rows)
+        query = np.asarray(query_embedding, dtype=np.float32).ravel()
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        order, offsets = self._inverted_lists()
+        candidates = np.concatenate([order[offsets[c] : offsets[c + 1]] for c in probed])
+        if rows is not None:
+            # A selective filter is cheaper to score exactly than the probed lists.
+            if rows.shape[0] <= candidates.shape[0]:
+                return super().search(query, top_k, rows)
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        return super().search(query, top_k, np.sort(candidates))
+
+    def search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int,
+        rows: Optional[np.ndarray] = None,
+        block_elements: int = 1 << 26,
+    ) -> List[List[Tuple[str, float]]]:
+        if self.centroids is None or self.nprobe >= self.centroids.shape[0]:
+            return super().search_many(query_embeddings, top_k, rows, block_elements)
+        # Each query probes different lists, so candidates are scored per query.
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, self.dimension)
+        return [self.search(query, top_k, rows) for query in queries]
+
+    def save(self, path: Path, generation: int) -> None:
+        """Persist the index atomically; ``generation`` ties it to a store state."""
+
+        path = Path(path)
+        temporary = path.with_name(path.name + ".tmp")
+        with temporary.open("wb") as handle:
+            np.savez(
+                handle,
+                ids=np.asarray(self.ids, dtype=str),
+                vectors=self.matrix,
+                centroids=self.centroids if self.centroids is not None else np.empty((0, self.dimension), np.float32),
+                assignments=self._assignments,
+                state=np.asarray([generation, self.trained_size, self.nlist, self.iterations, self.seed], dtype=np.int64),
+            )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: Path, generation: int, dimension: int, nprobe: int = 8) -> Optional["IVFIndex"]:
+        """Load a persisted index, or return ``None`` if it is missing or stale."""
+
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            saved_generation, trained_size, nlist, iterations, seed = (int(v) for v in data["state"])
+            vectors = data["vectors"]
+            if saved_generation != generation or vectors.shape[-1] != dimension:
+                return None
+            index = cls(dimension, nlist=nlist, nprobe=nprobe, iterations=iterations, seed=seed)
+            ids = [str(chunk_id) for chunk_id in data["ids"]]
+            if ids:
+                MatrixIndex.add(index, ids, vectors)
+            centroids = data["centroids"]
+            if centroids.shape[0]:
+                index.centroids = centroids
+                index._assignments = data["assignments"].astype(np.int32)
+                index.trained_size = trained_size
+        return index
+
+    def _normalized(self, rows: np.ndarray) -> np.ndarray:
+        return self.matrix[rows] / (self.norms[rows, None] + 1e-10)
+
+    def _assign(self, rows: np.ndarray, block: int = 65536) -> np.ndarray:
+        assignments = np.empty(rows.shape[0], dtype=np.int32)
+        for start in range(0, rows.shape[0], block):
+            part = rows[start : start + block]
+            assignments[start : start + block] = np.argmax(self._normalized(part) @ self.centroids.T, axis=1)
+        return assignments
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable")
+            counts = np.bincount(self._assignments, minlength=self.centroids.shape[0])
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._lists = (order, offsets)
+        return self._lists
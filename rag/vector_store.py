@@ -1,33 +1,129 @@
 """Simple persistent vector store backed by SQLite."""
 from __future__ import annotations
 
+import argparse
 import json
+import os
+import re
 import sqlite3
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 import numpy as np
 
+from rag.dedup import BANDS, MAX_DISTANCE, bands, hamming, maximal_marginal_relevance, simhash
+from rag.embedding_codec import check_dtype, decode, dequantize, encode
+from rag.filters import compile_filters, numeric_value
 from rag.models import DocumentChunk
+from rag.segments import SegmentFile, SegmentIndex
+from rag.vector_index import IVFIndex, MatrixIndex
 
 
 @dataclass
 class VectorStoreConfig:
     path: Path
     table_name: str = "chunks"
+    # "scan" scores every row straight from SQLite; "matrix" keeps an in-memory
+    # float32 matrix of all embeddings and only reads the top-k rows back;
+    # "ivf" adds an approximate inverted-file index persisted next to the store.
+    index: str = "scan"
+    nlist: int = 0
+    nprobe: int = 8
+    # Encoding for new embeddings: float32, float16, int8 (scalar quantized) or float64.
+    dtype: str = "float32"
+    # "sqlite" keeps embeddings as BLOBs in the table; "segments" appends them to
+    # memory-mapped segment files next to the store and SQLite keeps the row mapping.
+    storage: str = "sqlite"
+    # Maintain an FTS5 full-text index of chunk text for lexical (BM25) search.
+    fts: bool = True
+    # Fingerprint chunk text with SimHash so ingest can store near-duplicates
+    # as references to one canonical chunk instead of embedding them again.
+    dedup: bool = False
+    # Fingerprint bits (out of 64) in which near-duplicates may differ; at most 3.
+    dedup_distance: int = 3
+    # SQLite journal mode; "wal" lets readers query while an ingest writes.
+    journal_mode: str = "wal"
+    # Page cache and memory-mapped I/O sizes for this connection.
+    cache_size_mb: int = 64
+    mmap_size_mb: int = 256
+
+    @property
+    def ann_path(self) -> Path:
+        path = Path(self.path)
+        return path.with_name(f"{path.name}.{self.table_name}.ivf.npz")
+
+    @property
+    def segments_path(self) -> Path:
+        path = Path(self.path)
+        return path.with_name(f"{path.name}.{self.table_name}.segments")
+
+
+FTS_TOKEN = re.compile(r"[\w-]+")
+# Candidates fetched per requested result before maximal marginal relevance.
+MMR_CANDIDATES = 4
+JOURNAL_MODES = {"wal", "delete", "truncate", "persist", "memory", "off"}
+
+_encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def fts_query(text: str) -> str:
+    """An FTS5 MATCH expression that ORs the quoted tokens of free text.
+
+    Tokens keep hyphens and underscores, matching the index tokenizer, so
+    identifiers such as ``PAY-123`` or ``ERR_TIMEOUT`` are looked up whole.
+    """
+
+    tokens = dict.fromkeys(token.lower() for token in FTS_TOKEN.findall(text))
+    return " OR ".join(f'"{token}"' for token in tokens)
 
 
 class SQLiteVectorStore:
     """Lightweight vector store suitable for local experimentation."""
 
     def __init__(self, config: VectorStoreConfig) -> None:
+        if config.index not in {"scan", "matrix", "ivf"}:
+            raise ValueError(f"Unsupported vector index: {config.index}")
+        if config.storage not in {"sqlite", "segments"}:
+            raise ValueError(f"Unsupported embedding storage: {config.storage}")
+        check_dtype(config.dtype)
+        if config.journal_mode.lower() not in JOURNAL_MODES:
+            raise ValueError(f"Unsupported journal mode: {config.journal_mode}")
+        if not 0 <= config.dedup_distance <= MAX_DISTANCE:
+            raise ValueError(f"dedup_distance must be between 0 and {MAX_DISTANCE}")
         self.config = config
+        self._segment_files: Dict[Tuple[int, str], SegmentFile] = {}
         self._connection = sqlite3.connect(self.config.path)
+        self._configure_connection()
+        self._matrix_index: Optional[MatrixIndex] = None
+        self._index_generation: Optional[int] = None
+        self._index_dirty = False
         self._ensure_schema()
 
+    def _configure_connection(self) -> None:
+        connection = self._connection
+        connection.execute(f"PRAGMA journal_mode = {self.config.journal_mode}")
+        # In WAL mode NORMAL only syncs at checkpoints; a power loss can drop
+        # the latest commits but cannot corrupt the database.
+        synchronous = "NORMAL" if self.config.journal_mode.lower() == "wal" else "FULL"
+        connection.execute(f"PRAGMA synchronous = {synchronous}")
+        connection.execute(f"PRAGMA cache_size = {-self.config.cache_size_mb * 1024}")
+        connection.execute(f"PRAGMA mmap_size = {self.config.mmap_size_mb * 1024 * 1024}")
+
     def _ensure_schema(self) -> None:
         cursor = self._connection.cursor()
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.config.table_name}_state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            f"INSERT OR IGNORE INTO {self.config.table_name}_state (key, value) VALUES ('generation', 0)"
+        )
         cursor.execute(
             f"""
             CREATE TABLE IF NOT EXISTS {self.config.table_name} (
@@ -35,66 +131,675 @@ class SQLiteVectorStore:
                 embedding BLOB NOT NULL,
                 dimension INTEGER NOT NULL,
                 text TEXT NOT NULL,
-                metadata TEXT NOT NULL
+                metadata TEXT NOT NULL,
+                dtype TEXT NOT NULL DEFAULT 'float64',
+                scale REAL NOT NULL DEFAULT 1.0
             )
             """
         )
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({self.config.table_name})")}
+        # Stores created before embeddings had a dtype hold float64 vectors.
+        if "dtype" not in columns:
+            cursor.execute(
+                f"ALTER TABLE {self.config.table_name} ADD COLUMN dtype TEXT NOT NULL DEFAULT 'float64'"
+            )
+        if "scale" not in columns:
+            cursor.execute(f"ALTER TABLE {self.config.table_name} ADD COLUMN scale REAL NOT NULL DEFAULT 1.0")
+        # Rows whose embedding lives in a segment file have an empty BLOB.
+        if "segment" not in columns:
+            cursor.execute(f"ALTER TABLE {self.config.table_name} ADD COLUMN segment INTEGER")
+            cursor.execute(f"ALTER TABLE {self.config.table_name} ADD COLUMN segment_row INTEGER")
         cursor.execute(
-            f"CREATE INDEX IF NOT EXISTS idx_{self.config.table_name}_doc_type ON {self.config.table_name}((json_extract(metadata, '$.doc_type')) )"
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.config.table_name}_segments (
+                id INTEGER PRIMARY KEY,
+                dtype TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                rows INTEGER NOT NULL,
+                file TEXT NOT NULL
+            )
+            """
         )
+        self._ensure_metadata_table(cursor)
+        if self.config.fts:
+            self._ensure_fts_table(cursor)
+        self._ensure_duplicates_table(cursor)
+        if self.config.dedup:
+            self._ensure_simhash_table(cursor)
+        if self._bulk_load_owner() is None:
+            # Also finishes a bulk load whose process died before rebuilding.
+            self._restore_indexes(cursor)
         self._connection.commit()
 
+    @property
+    def metadata_table(self) -> str:
+        return f"{self.config.table_name}_metadata"
+
+    def _ensure_metadata_table(self, cursor: sqlite3.Cursor) -> None:
+        """Create the normalized ``(chunk_id, key, value)`` side table used for filtering.
+
+        Stores created before the side table existed are backfilled from the
+        JSON metadata column once.
+        """
+
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.metadata_table,)
+        ).fetchone()
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.metadata_table} (
+                chunk_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                num REAL,
+                PRIMARY KEY (chunk_id, key)
+            ) WITHOUT ROWID
+            """
+        )
+        if exists is None:
+            rows = self._connection.execute(f"SELECT id, metadata FROM {self.config.table_name}")
+            for batch in iter(lambda: rows.fetchmany(10_000), []):
+                cursor.executemany(
+                    f"INSERT INTO {self.metadata_table} (chunk_id, key, value, num) VALUES (?, ?, ?, ?)",
+                    (
+                        row
+                        for chunk_id, metadata_json in batch
+                        for row in self._metadata_rows(DocumentChunk(id=chunk_id, text="", metadata=json.loads(metadata_json)))
+                    ),
+                )
+
+    @property
+    def fts_table(self) -> str:
+        return f"{self.config.table_name}_fts"
+
+    def _ensure_fts_table(self, cursor: sqlite3.Cursor) -> None:
+        """Create the FTS5 index over chunk text, kept in sync by triggers.
+
+        It is an external-content table: it stores only postings and reads the
+        text from the chunks table, and the triggers update it inside the same
+        transaction as every insert, update and delete (except during
+        ``bulk_load``, which re-indexes once at the end). Existing stores are
+        indexed once when the table is first created.
+        """
+
+        table, fts = self.config.table_name, self.fts_table
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone()
+        cursor.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                text, content='{table}', content_rowid='rowid', tokenize="unicode61 tokenchars '-_'"
+            )
+            """
+        )
+        if exists is None:
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+    def _create_secondary_indexes(self, cursor: sqlite3.Cursor) -> None:
+        """Indexes and FTS triggers that ``bulk_load`` drops and rebuilds after the load."""
+
+        table = self.config.table_name
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_segment ON {table}(segment, segment_row)")
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_doc_type ON {table}((json_extract(metadata, '$.doc_type')) )"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.metadata_table}_value ON {self.metadata_table}(key, value, chunk_id)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.metadata_table}_num ON {self.metadata_table}(key, num, chunk_id)"
+        )
+        if not self.config.fts:
+            return
+        fts = self.fts_table
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {fts} (rowid, text) VALUES (new.rowid, new.text);
+            END
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF text ON {table} BEGIN
+                INSERT INTO {fts} ({fts}, rowid, text) VALUES ('delete', old.rowid, old.text);
+                INSERT INTO {fts} (rowid, text) VALUES (new.rowid, new.text);
+            END
+            """
+        )
+
+    def _drop_secondary_indexes(self, cursor: sqlite3.Cursor) -> None:
+        table, fts = self.config.table_name, self.fts_table
+        for index in (f"idx_{table}_segment", f"idx_{table}_doc_type", f"idx_{self.metadata_table}_value", f"idx_{self.metadata_table}_num"):
+            cursor.execute(f"DROP INDEX IF EXISTS {index}")
+        for trigger in (f"{fts}_insert", f"{fts}_delete", f"{fts}_update"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    def _bulk_load_owner(self) -> Optional[int]:
+        """Process id of a live bulk load on this store, if any."""
+
+        row = self._connection.execute(
+            f"SELECT value FROM {self.config.table_name}_state WHERE key = 'bulk_load'"
+        ).fetchone()
+        if row is None:
+            return None
+        pid = int(row[0])
+        if pid == os.getpid() or os.name != "posix":
+            return pid
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return None
+        except PermissionError:
+            pass
+        return pid
+
+    def _restore_indexes(self, cursor: sqlite3.Cursor) -> None:
+        """Create the secondary indexes, re-indexing FTS if a bulk load skipped it."""
+
+        self._create_secondary_indexes(cursor)
+        interrupted = cursor.execute(
+            f"DELETE FROM {self.config.table_name}_state WHERE key = 'bulk_load'"
+        ).rowcount
+        if interrupted and self.config.fts:
+            cursor.execute(f"INSERT INTO {self.fts_table} ({self.fts_table}) VALUES ('rebuild')")
+        self._connection.commit()
+
+    @contextmanager
+    def bulk_load(self) -> Iterator["SQLiteVectorStore"]:
+        """Load many chunks with secondary indexes dropped and durability relaxed.
+
+        The metadata and doc_type indexes and the FTS triggers are dropped for
+        the duration and rebuilt in one pass afterwards, which is much cheaper
+        than maintaining them row by row. Each ``upsert`` still commits, so in
+        WAL mode readers keep querying the rows loaded so far, but filtered
+        queries scan without their indexes and lexical search does not see new
+        rows until the load finishes. ``synchronous`` is OFF during the load: a
+        power loss can corrupt the store, so re-run the load from scratch then.
+        A load whose process dies is finished by the next connection to open
+        the store.
+        """
+
+        cursor = self._connection.cursor()
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {self.config.table_name}_state (key, value) VALUES ('bulk_load', ?)",
+            (os.getpid(),),
+        )
+        self._drop_secondary_indexes(cursor)
+        self._connection.commit()
+        self._connection.execute("PRAGMA synchronous = OFF")
+        try:
+            yield self
+        finally:
+            self._configure_connection()
+            self._restore_indexes(self._connection.cursor())
+            self._connection.execute("PRAGMA optimize")
+
+    @property
+    def duplicates_table(self) -> str:
+        return f"{self.config.table_name}_duplicates"
+
+    @property
+    def simhash_table(self) -> str:
+        return f"{self.config.table_name}_simhash"
+
+    def _ensure_duplicates_table(self, cursor: sqlite3.Cursor) -> None:
+        """Near-duplicate chunks stored as references to the canonical chunk they resemble."""
+
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {self.duplicates_table} (
+                id TEXT PRIMARY KEY,
+                canonical_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.duplicates_table}_canonical ON {self.duplicates_table}(canonical_id)"
+        )
+
+    def _ensure_simhash_table(self, cursor: sqlite3.Cursor) -> None:
+        """SimHash fingerprints of chunk text, banded for near-duplicate lookups.
+
+        Triggers drop a row's fingerprint when the row is deleted or its text
+        changes; rows without a fingerprint (including every row of a store
+        opened with ``dedup`` for the first time) are fingerprinted on open.
+        """
+
+        table, simhash_table = self.config.table_name, self.simhash_table
+        band_columns = ", ".join(f"band{band} INTEGER NOT NULL" for band in range(BANDS))
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {simhash_table} (id TEXT PRIMARY KEY, fingerprint INTEGER NOT NULL, {band_columns})"
+        )
+        for band in range(BANDS):
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{simhash_table}_band{band} ON {simhash_table}(band{band})"
+            )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {simhash_table}_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {simhash_table} WHERE id = old.id;
+            END
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {simhash_table}_update AFTER UPDATE OF text ON {table} BEGIN
+                DELETE FROM {simhash_table} WHERE id = old.id;
+            END
+            """
+        )
+        rows = self._connection.execute(
+            f"SELECT id, text FROM {table} WHERE id NOT IN (SELECT id FROM {simhash_table})"
+        )
+        for batch in iter(lambda: rows.fetchmany(10_000), []):
+            cursor.executemany(
+                f"INSERT INTO {simhash_table} VALUES ({', '.join('?' for _ in range(BANDS + 2))})",
+                (self._simhash_row(chunk_id, text) for chunk_id, text in batch),
+            )
+
+    @staticmethod
+    def _simhash_row(chunk_id: str, text: str) -> Tuple:
+        fingerprint = simhash(text)
+        return (chunk_id, fingerprint, *bands(fingerprint))
+
+    def _metadata_rows(self, chunk: DocumentChunk) -> List[Tuple[str, str, str, Optional[float]]]:
+        return [
+            (chunk.id, key, str(value), numeric_value(value))
+            for key, value in chunk.metadata.items()
+            if value is not None
+        ]
+
+    @property
+    def generation(self) -> int:
+        """Counter bumped by every ``upsert`` and ``delete`` that touches the store."""
+
+        row = self._connection.execute(
+            f"SELECT value FROM {self.config.table_name}_state WHERE key = 'generation'"
+        ).fetchone()
+        return int(row[0]) if row else 0
+
+    def _bump_generation(self, cursor: sqlite3.Cursor) -> int:
+        cursor.execute(
+            f"UPDATE {self.config.table_name}_state SET value = value + 1 WHERE key = 'generation'"
+        )
+        cursor.execute(f"SELECT value FROM {self.config.table_name}_state WHERE key = 'generation'")
+        return int(cursor.fetchone()[0])
+
     def upsert(self, chunks: Iterable[DocumentChunk]) -> None:
+        prepared = self._prepare_chunks(chunks)
+        if not prepared:
+            return
         cursor = self._connection.cursor()
+        appended: List[Tuple[SegmentFile, int]] = []
+        try:
+            self._write_chunks(cursor, prepared, appended)
+            generation = self._bump_generation(cursor)
+            self._connection.commit()
+        except BaseException:
+            self._rollback(appended)
+            raise
+        if self._index_is_current(generation):
+            self._index_upserted([(chunk.id, vector) for chunk, _, _, vector in prepared], generation)
+
+    def _prepare_chunks(self, chunks: Iterable[DocumentChunk]) -> List[Tuple[DocumentChunk, bytes, float, np.ndarray]]:
+        """Encode chunks for storage as ``(chunk, blob, scale, decoded vector)``."""
+
+        # The last copy of a repeated id wins, as it would with one statement per chunk.
+        latest: Dict[str, DocumentChunk] = {}
         for chunk in chunks:
             if chunk.embedding is None:
                 raise ValueError("Chunk is missing embedding")
-            embedding_array = np.asarray(chunk.embedding, dtype=float)
-            cursor.execute(
-                f"""
-                INSERT INTO {self.config.table_name} (id, embedding, dimension, text, metadata)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(id) DO UPDATE SET
-                    embedding=excluded.embedding,
-                    dimension=excluded.dimension,
-                    text=excluded.text,
-                    metadata=excluded.metadata
-                """,
+            latest.pop(chunk.id, None)
+            latest[chunk.id] = chunk
+        prepared: List[Tuple[DocumentChunk, bytes, float, np.ndarray]] = []
+        for chunk in latest.values():
+            blob, scale = encode(chunk.embedding, self.config.dtype)
+            prepared.append((chunk, blob, scale, decode(blob, self.config.dtype, scale)))
+        return prepared
+
+    def _write_chunks(
+        self,
+        cursor: sqlite3.Cursor,
+        prepared: List[Tuple[DocumentChunk, bytes, float, np.ndarray]],
+        appended: List[Tuple[SegmentFile, int]],
+    ) -> None:
+        """Store ``prepared`` chunks in the caller's transaction; segment writes go to ``appended``."""
+
+        if self.config.storage == "segments":
+            locations = self._append_to_segments(cursor, prepared, appended)
+        else:
+            locations = [(None, None)] * len(prepared)
+        cursor.executemany(
+            f"""
+            INSERT INTO {self.config.table_name}
+                (id, embedding, dimension, text, metadata, dtype, scale, segment, segment_row)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                embedding=excluded.embedding,
+                dimension=excluded.dimension,
+                text=excluded.text,
+                metadata=excluded.metadata,
+                dtype=excluded.dtype,
+                scale=excluded.scale,
+                segment=excluded.segment,
+                segment_row=excluded.segment_row
+            """,
+            [
                 (
                     chunk.id,
-                    embedding_array.tobytes(),
+                    blob if segment is None else b"",
                     embedding_array.shape[-1],
                     chunk.text,
-                    json.dumps(chunk.metadata),
-                ),
+                    _encode_json(chunk.metadata),
+                    self.config.dtype,
+                    scale,
+                    segment,
+                    segment_row,
+                )
+                for (chunk, blob, scale, embedding_array), (segment, segment_row) in zip(prepared, locations)
+            ],
+        )
+        ids = [(chunk.id,) for chunk, _, _, _ in prepared]
+        cursor.executemany(f"DELETE FROM {self.metadata_table} WHERE chunk_id = ?", ids)
+        cursor.executemany(
+            f"INSERT INTO {self.metadata_table} (chunk_id, key, value, num) VALUES (?, ?, ?, ?)",
+            (row for chunk, _, _, _ in prepared for row in self._metadata_rows(chunk)),
+        )
+        # A chunk stored in full is no longer a reference to another one.
+        cursor.executemany(f"DELETE FROM {self.duplicates_table} WHERE id = ?", ids)
+        if self.config.dedup:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {self.simhash_table} VALUES ({', '.join('?' for _ in range(BANDS + 2))})",
+                (self._simhash_row(chunk.id, chunk.text) for chunk, _, _, _ in prepared),
+            )
+
+    def _rollback(self, appended: List[Tuple[SegmentFile, int]]) -> None:
+        # Nothing references the appended rows once the transaction is gone.
+        self._connection.rollback()
+        for segment, rows in appended:
+            segment.truncate(rows)
+
+    def split_duplicates(
+        self, chunks: Iterable[DocumentChunk]
+    ) -> Tuple[List[DocumentChunk], List[Tuple[DocumentChunk, str]]]:
+        """Separate chunks to store in full from near-duplicates of an existing chunk.
+
+        Returns the unique chunks and ``(duplicate, canonical_id)`` pairs. The
+        canonical chunk is either already stored or an earlier unique chunk of
+        ``chunks``, so duplicates must be added after the unique chunks are
+        upserted. Without ``dedup`` every chunk is unique.
+        """
+
+        chunks = list(chunks)
+        if not self.config.dedup:
+            return chunks, []
+        unique: List[DocumentChunk] = []
+        duplicates: List[Tuple[DocumentChunk, str]] = []
+        pending: Dict[Tuple[int, int], List[Tuple[str, int]]] = {}
+        where = " OR ".join(f"band{band} = ?" for band in range(BANDS))
+        for chunk in chunks:
+            fingerprint = simhash(chunk.text)
+            chunk_bands = bands(fingerprint)
+            candidates = self._connection.execute(
+                f"SELECT id, fingerprint FROM {self.simhash_table} WHERE {where}", chunk_bands
+            ).fetchall()
+            candidates.extend(
+                candidate for key in enumerate(chunk_bands) for candidate in pending.get(key, ())
             )
+            near = [
+                candidate_id
+                for candidate_id, candidate in candidates
+                if hamming(fingerprint, candidate) <= self.config.dedup_distance
+            ]
+            # A chunk matching its own stored row is an update, not a duplicate.
+            if near and chunk.id not in near:
+                duplicates.append((chunk, near[0]))
+                continue
+            unique.append(chunk)
+            for key in enumerate(chunk_bands):
+                pending.setdefault(key, []).append((chunk.id, fingerprint))
+        return unique, duplicates
+
+    def add_duplicates(self, duplicates: Iterable[Tuple[DocumentChunk, str]]) -> None:
+        """Record chunks as references to their canonical chunk instead of storing them."""
+
+        duplicates = list(duplicates)
+        if not duplicates:
+            return
+        # A chunk that used to be stored in full now defers to its canonical chunk.
+        self.delete([chunk.id for chunk, _ in duplicates])
+        cursor = self._connection.cursor()
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {self.duplicates_table} (id, canonical_id, text, metadata) VALUES (?, ?, ?, ?)",
+            ((chunk.id, canonical_id, chunk.text, json.dumps(chunk.metadata)) for chunk, canonical_id in duplicates),
+        )
+        self._bump_generation(cursor)
         self._connection.commit()
 
+    def _with_references(self, chunks: List[DocumentChunk]) -> List[DocumentChunk]:
+        """Add the sources of each chunk's near-duplicates as ``duplicate_sources`` metadata."""
+
+        by_id = {chunk.id: chunk for chunk in chunks}
+        sources: Dict[str, Dict[str, None]] = {}
+        for offset in range(0, len(by_id), 500):
+            part = list(by_id)[offset : offset + 500]
+            for canonical_id, metadata_json in self._connection.execute(
+                f"SELECT canonical_id, metadata FROM {self.duplicates_table} "
+                f"WHERE canonical_id IN ({', '.join('?' for _ in part)}) ORDER BY rowid",
+                part,
+            ):
+                source = json.loads(metadata_json).get("source", "")
+                sources.setdefault(canonical_id, {})[source] = None
+        for canonical_id, references in sources.items():
+            metadata = by_id[canonical_id].metadata
+            metadata["duplicate_sources"] = ", ".join(references)
+        return chunks
+
+    def _orphaned_duplicates(self, chunk_ids: List[str]) -> List[Tuple[DocumentChunk, str]]:
+        """For canonical chunks about to be deleted, the first surviving duplicate of each.
+
+        It is returned with the canonical chunk's embedding (the texts are near
+        identical) and the canonical id, so it can take the canonical's place.
+        """
+
+        deleted = set(chunk_ids)
+        promoted: Dict[str, DocumentChunk] = {}
+        for offset in range(0, len(chunk_ids), 500):
+            part = chunk_ids[offset : offset + 500]
+            rows = self._connection.execute(
+                f"""
+                SELECT d.id, d.canonical_id, d.text, d.metadata,
+                       c.embedding, c.dtype, c.scale, c.segment, c.segment_row
+                FROM {self.duplicates_table} AS d JOIN {self.config.table_name} AS c ON c.id = d.canonical_id
+                WHERE d.canonical_id IN ({', '.join('?' for _ in part)}) ORDER BY d.rowid
+                """,
+                part,
+            ).fetchall()
+            views: Dict[int, np.ndarray] = {}
+            for chunk_id, canonical_id, text, metadata_json, blob, dtype, scale, segment, segment_row in rows:
+                if chunk_id in deleted or canonical_id in promoted:
+                    continue
+                promoted[canonical_id] = DocumentChunk(
+                    id=chunk_id,
+                    text=text,
+                    metadata=json.loads(metadata_json),
+                    embedding=self._decode_row(views, blob, dtype, scale, segment, segment_row),
+                )
+        return [(chunk, canonical_id) for canonical_id, chunk in promoted.items()]
+
+    def _append_to_segments(
+        self,
+        cursor: sqlite3.Cursor,
+        prepared: List[Tuple[DocumentChunk, bytes, float, np.ndarray]],
+        appended: List[Tuple[SegmentFile, int]],
+    ) -> List[Tuple[Optional[int], Optional[int]]]:
+        """Append encoded vectors to the active segment of each dimension.
+
+        Each segment written is added to ``appended`` with its previous row
+        count, so the caller can truncate it if the transaction fails.
+
+        The segment's committed row count is bumped in the caller's transaction,
+        so rows only become visible if the chunk rows referencing them commit.
+        The transaction takes the write lock before ``rows`` is read, so
+        another writer cannot append at the same offset.
+        """
+
+        if not self._connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        by_dimension: Dict[int, List[int]] = {}
+        for position, (_, _, _, vector) in enumerate(prepared):
+            by_dimension.setdefault(vector.shape[-1], []).append(position)
+        locations: List[Tuple[Optional[int], Optional[int]]] = [(None, None)] * len(prepared)
+        for dimension, positions in by_dimension.items():
+            row = cursor.execute(
+                f"SELECT id, rows, file FROM {self.config.table_name}_segments WHERE dtype = ? AND dimension = ?",
+                (self.config.dtype, dimension),
+            ).fetchone()
+            if row is None:
+                cursor.execute(
+                    f"INSERT INTO {self.config.table_name}_segments (dtype, dimension, rows, file) VALUES (?, ?, 0, '')",
+                    (self.config.dtype, dimension),
+                )
+                segment_id = cursor.lastrowid
+                row = (segment_id, 0, f"segment-{segment_id}-0.bin")
+                cursor.execute(
+                    f"UPDATE {self.config.table_name}_segments SET file = ? WHERE id = ?", (row[2], segment_id)
+                )
+            segment_id, rows, file_name = row
+            segment = self._segment_file(segment_id, file_name, self.config.dtype, dimension)
+            encoded = np.vstack([np.frombuffer(prepared[p][1], dtype=self.config.dtype) for p in positions])
+            norms = np.linalg.norm(np.vstack([prepared[p][3] for p in positions]), axis=1)
+            appended.append((segment, rows))
+            start = segment.append(encoded, norms, rows)
+            cursor.execute(
+                f"UPDATE {self.config.table_name}_segments SET rows = ? WHERE id = ?",
+                (start + len(positions), segment_id),
+            )
+            for offset, position in enumerate(positions):
+                locations[position] = (segment_id, start + offset)
+        return locations
+
+    def _segment_file(self, segment_id: int, file_name: str, dtype: str, dimension: int) -> SegmentFile:
+        key = (segment_id, file_name)
+        if key not in self._segment_files:
+            self._segment_files[key] = SegmentFile(self.config.segments_path / file_name, dtype, dimension)
+        return self._segment_files[key]
+
+    def _segment(self, segment_id: int) -> Tuple[SegmentFile, int]:
+        """The segment file and its committed row count, as currently recorded in SQLite."""
+
+        dtype, dimension, rows, file_name = self._connection.execute(
+            f"SELECT dtype, dimension, rows, file FROM {self.config.table_name}_segments WHERE id = ?",
+            (segment_id,),
+        ).fetchone()
+        return self._segment_file(segment_id, file_name, dtype, dimension), rows
+
+    def _decode_row(
+        self,
+        views: Dict[int, np.ndarray],
+        blob: bytes,
+        dtype: str,
+        scale: float,
+        segment: Optional[int],
+        segment_row: Optional[int],
+    ) -> np.ndarray:
+        if segment is None:
+            return decode(blob, dtype, scale)
+        if segment not in views:
+            segment_file, rows = self._segment(segment)
+            views[segment] = segment_file.vectors(rows)
+        return dequantize(views[segment][segment_row], dtype, scale)
+
+    def compact(self) -> int:
+        """Rewrite segment files without superseded or deleted rows.
+
+        Each segment is copied to a new versioned file and SQLite is switched to
+        it in one transaction before the old file is removed, so a crash leaves
+        either the old or the new layout. Returns the number of bytes reclaimed.
+        """
+
+        reclaimed = 0
+        segments = self._connection.execute(
+            f"SELECT id, dtype, dimension, rows, file FROM {self.config.table_name}_segments"
+        ).fetchall()
+        for segment_id, dtype, dimension, rows, file_name in segments:
+            live = self._connection.execute(
+                f"SELECT id, segment_row FROM {self.config.table_name} WHERE segment = ? ORDER BY segment_row",
+                (segment_id,),
+            ).fetchall()
+            if len(live) == rows:
+                continue
+            current = self._segment_file(segment_id, file_name, dtype, dimension)
+            version = int(Path(file_name).stem.rsplit("-", 1)[1]) + 1
+            new_name = f"segment-{segment_id}-{version}.bin"
+            current.rewrite(
+                self.config.segments_path / new_name,
+                np.asarray([segment_row for _, segment_row in live], dtype=np.int64),
+                rows,
+            )
+            cursor = self._connection.cursor()
+            cursor.executemany(
+                f"UPDATE {self.config.table_name} SET segment_row = ? WHERE id = ?",
+                ((new_row, chunk_id) for new_row, (chunk_id, _) in enumerate(live)),
+            )
+            cursor.execute(
+                f"UPDATE {self.config.table_name}_segments SET rows = ?, file = ? WHERE id = ?",
+                (len(live), new_name, segment_id),
+            )
+            self._bump_generation(cursor)
+            self._connection.commit()
+            self._segment_files.pop((segment_id, file_name), None)
+            current.remove()
+            reclaimed += (rows - len(live)) * (np.dtype(dtype).itemsize * dimension + 4)
+        if reclaimed:
+            self._matrix_index = None
+        return reclaimed
+
     def similarity_search(
         self,
         query_embedding: np.ndarray,
         top_k: int = 5,
         filters: Optional[dict] = None,
+        diversity: Optional[float] = None,
     ) -> List[DocumentChunk]:
+        """The ``top_k`` chunks most similar to ``query_embedding``.
+
+        With ``diversity`` (0-1), ``MMR_CANDIDATES * top_k`` candidates are
+        re-ordered by maximal marginal relevance so near-identical chunks do
+        not crowd out the rest of the results.
+        """
+
+        if diversity:
+            candidates = self.similarity_search(query_embedding, top_k * MMR_CANDIDATES, filters)
+            return maximal_marginal_relevance(query_embedding, candidates, top_k, diversity)
+        if self.config.index != "scan":
+            queries = np.asarray(query_embedding, dtype=np.float32).reshape(1, -1)
+            return self._search_many(queries, top_k, filters)[0]
         cursor = self._connection.cursor()
-        filter_clause = ""
-        params: list = []
-        if filters:
-            clauses = []
-            for key, value in filters.items():
-                clauses.append(f"json_extract(metadata, '$.{key}') = ?")
-                params.append(value)
-            filter_clause = "WHERE " + " AND ".join(clauses)
+        filter_clause, params = self._filter_clause(filters)
         cursor.execute(
-            f"SELECT id, embedding, dimension, text, metadata FROM {self.config.table_name} {filter_clause}",
+            f"""
+            SELECT id, embedding, dimension, text, metadata, dtype, scale, segment, segment_row
+            FROM {self.config.table_name} {filter_clause}
+            """,
             params,
         )
         rows = cursor.fetchall()
         scored: List[tuple[float, DocumentChunk]] = []
         if not rows:
             return []
-        for chunk_id, embedding_blob, dimension, text, metadata_json in rows:
-            embedding = np.frombuffer(embedding_blob, dtype=float)
+        views: Dict[int, np.ndarray] = {}
+        for chunk_id, embedding_blob, dimension, text, metadata_json, dtype, scale, segment, segment_row in rows:
+            embedding = self._decode_row(views, embedding_blob, dtype, scale, segment, segment_row)
             if embedding.shape[0] != dimension:
                 continue
             metadata = json.loads(metadata_json)
@@ -108,15 +813,404 @@ class SQLiteVectorStore:
                 )
             )
         scored.sort(key=lambda item: item[0], reverse=True)
-        return [chunk for _, chunk in scored[:top_k]]
+        return self._with_references([chunk for _, chunk in scored[:top_k]])
+
+    def lexical_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[dict] = None,
+    ) -> List[DocumentChunk]:
+        """Chunks ranked by FTS5 BM25 relevance of their text to ``query``."""
+
+        return [chunk for chunk, _ in self.lexical_search_with_scores(query, top_k, filters)]
+
+    def lexical_search_with_scores(
+        self,
+        query: str,
+        top_k: int = 5,
+        filters: Optional[dict] = None,
+    ) -> List[Tuple[DocumentChunk, float]]:
+        """``lexical_search`` with each chunk's BM25 score (higher is better)."""
+
+        if not self.config.fts:
+            raise ValueError("Lexical search needs a store opened with fts=True")
+        expression = fts_query(query)
+        if not expression:
+            return []
+        sql = f"""
+            SELECT c.id, c.text, c.metadata, c.embedding, c.dtype, c.scale, c.segment, c.segment_row,
+                   bm25({self.fts_table})
+            FROM {self.fts_table} AS f JOIN {self.config.table_name} AS c ON c.rowid = f.rowid
+            WHERE {self.fts_table} MATCH ?
+        """
+        params: list = [expression]
+        if filters:
+            id_query, filter_params = compile_filters(filters, self.config.table_name, self.metadata_table)
+            sql += f" AND c.id IN ({id_query})"
+            params.extend(filter_params)
+        # bm25() is lower for better matches.
+        sql += f" ORDER BY bm25({self.fts_table}) LIMIT ?"
+        params.append(top_k)
+        views: Dict[int, np.ndarray] = {}
+        scored = [
+            (
+                DocumentChunk(
+                    id=chunk_id,
+                    text=text,
+                    metadata=json.loads(metadata_json),
+                    embedding=self._decode_row(views, embedding_blob, dtype, scale, segment, segment_row),
+                ),
+                -bm25,
+            )
+            for chunk_id, text, metadata_json, embedding_blob, dtype, scale, segment, segment_row, bm25 in self._connection.execute(
+                sql, params
+            )
+        ]
+        self._with_references([chunk for chunk, _ in scored])
+        return scored
+
+    def get(self, chunk_ids: Iterable[str]) -> List[DocumentChunk]:
+        """Chunks stored in full under ``chunk_ids``, with their embeddings; other ids are skipped."""
+
+        chunk_ids = list(chunk_ids)
+        chunks: List[DocumentChunk] = []
+        views: Dict[int, np.ndarray] = {}
+        for offset in range(0, len(chunk_ids), 500):
+            part = chunk_ids[offset : offset + 500]
+            for chunk_id, text, metadata_json, blob, dtype, scale, segment, segment_row in self._connection.execute(
+                f"""
+                SELECT id, text, metadata, embedding, dtype, scale, segment, segment_row
+                FROM {self.config.table_name} WHERE id IN ({', '.join('?' for _ in part)}) ORDER BY rowid
+                """,
+                part,
+            ):
+                chunks.append(
+                    DocumentChunk(
+                        id=chunk_id,
+                        text=text,
+                        metadata=json.loads(metadata_json),
+                        embedding=self._decode_row(views, blob, dtype, scale, segment, segment_row),
+                    )
+                )
+        return chunks
+
+    def duplicates_of(self, canonical_ids: Iterable[str]) -> List[Tuple[DocumentChunk, str]]:
+        """``(duplicate, canonical_id)`` pairs recorded against the given canonical chunks."""
+
+        canonical_ids = list(canonical_ids)
+        duplicates: List[Tuple[DocumentChunk, str]] = []
+        for offset in range(0, len(canonical_ids), 500):
+            part = canonical_ids[offset : offset + 500]
+            for chunk_id, canonical_id, text, metadata_json in self._connection.execute(
+                f"SELECT id, canonical_id, text, metadata FROM {self.duplicates_table} "
+                f"WHERE canonical_id IN ({', '.join('?' for _ in part)}) ORDER BY rowid",
+                part,
+            ):
+                duplicates.append((DocumentChunk(id=chunk_id, text=text, metadata=json.loads(metadata_json)), canonical_id))
+        return duplicates
+
+    def similarity_search_many(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        filters: Optional[dict] = None,
+        diversity: Optional[float] = None,
+    ) -> List[List[DocumentChunk]]:
+        """Search for several queries at once, returning one result list per query.
+
+        All queries are scored against the store with a single matrix-matrix
+        product, and the winning rows for every query are read back in one pass.
+        ``diversity`` applies maximal marginal relevance as in ``similarity_search``.
+        """
+
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.size == 0:
+            return []
+        queries = queries.reshape(len(queries), -1)
+        if diversity:
+            candidates = self.similarity_search_many(queries, top_k * MMR_CANDIDATES, filters)
+            return [
+                maximal_marginal_relevance(query, ranked, top_k, diversity)
+                for query, ranked in zip(queries, candidates)
+            ]
+        if self.config.index != "scan":
+            return self._search_many(queries, top_k, filters)
+        # Without a persistent index, decode the matching rows once for the whole batch.
+        index = MatrixIndex(queries.shape[-1])
+        self._read_into(index, filters)
+        return self._search_many(queries, top_k, None, index)
 
     def delete(self, chunk_ids: Iterable[str]) -> None:
+        """Delete chunks; a deleted canonical chunk is replaced by one of its duplicates.
+
+        The promotion happens in the same transaction as the delete, so readers
+        never see the content missing.
+        """
+
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return
         cursor = self._connection.cursor()
-        cursor.executemany(
-            f"DELETE FROM {self.config.table_name} WHERE id = ?",
-            ((chunk_id,) for chunk_id in chunk_ids),
-        )
-        self._connection.commit()
+        appended: List[Tuple[SegmentFile, int]] = []
+        try:
+            if not self._connection.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            promoted = self._orphaned_duplicates(chunk_ids)
+            prepared = self._prepare_chunks(chunk for chunk, _ in promoted)
+            cursor.executemany(
+                f"DELETE FROM {self.config.table_name} WHERE id = ?",
+                ((chunk_id,) for chunk_id in chunk_ids),
+            )
+            deleted = cursor.rowcount
+            cursor.executemany(
+                f"DELETE FROM {self.duplicates_table} WHERE id = ?",
+                ((chunk_id,) for chunk_id in chunk_ids),
+            )
+            deleted += cursor.rowcount
+            cursor.executemany(
+                f"DELETE FROM {self.metadata_table} WHERE chunk_id = ?",
+                ((chunk_id,) for chunk_id in chunk_ids),
+            )
+            if prepared:
+                self._write_chunks(cursor, prepared, appended)
+                cursor.executemany(
+                    f"UPDATE {self.duplicates_table} SET canonical_id = ? WHERE canonical_id = ?",
+                    ((chunk.id, canonical_id) for chunk, canonical_id in promoted),
+                )
+            generation = self._bump_generation(cursor) if deleted else None
+            self._connection.commit()
+        except BaseException:
+            self._rollback(appended)
+            raise
+        if generation is not None and self._index_is_current(generation):
+            self._matrix_index.remove(chunk_ids)
+            self._index_upserted([(chunk.id, vector) for chunk, _, _, vector in prepared], generation)
 
     def close(self) -> None:
+        self.save_index()
         self._connection.close()
+
+    def migrate_storage(self, batch_size: int = 1000) -> int:
+        """Re-encode every embedding not stored as ``config.dtype`` in ``config.storage``.
+
+        Rows are rewritten in batches, each in its own transaction, so a large
+        store can be migrated incrementally and the migration can be resumed.
+        Returns the number of rewritten rows.
+        """
+
+        target = self.config.dtype
+        misplaced = "segment IS NULL" if self.config.storage == "segments" else "segment IS NOT NULL"
+        migrated = 0
+        last_rowid = 0
+        while True:
+            rows = self._connection.execute(
+                f"""
+                SELECT rowid, id, embedding, text, metadata, dtype, scale, segment, segment_row
+                FROM {self.config.table_name}
+                WHERE rowid > ? AND (dtype != ? OR {misplaced}) ORDER BY rowid LIMIT ?
+                """,
+                (last_rowid, target, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            views: Dict[int, np.ndarray] = {}
+            chunks = []
+            for rowid, chunk_id, embedding_blob, text, metadata_json, dtype, scale, segment, segment_row in rows:
+                embedding = self._decode_row(views, embedding_blob, dtype, scale, segment, segment_row)
+                chunks.append(DocumentChunk(id=chunk_id, text=text, metadata=json.loads(metadata_json), embedding=embedding))
+                last_rowid = rowid
+            # Upserting keeps each row's rowid and re-encodes it into the configured storage.
+            self.upsert(chunks)
+            migrated += len(chunks)
+        if migrated:
+            self._matrix_index = None
+            self.compact()
+            self._connection.execute("VACUUM")
+        return migrated
+
+    def save_index(self) -> None:
+        """Persist the ANN index if it changed since it was loaded or built."""
+
+        index = self._matrix_index
+        if not isinstance(index, IVFIndex) or not self._index_dirty:
+            return
+        # Another connection may have written since; its index would be stale.
+        if self._index_generation == self.generation:
+            index.save(self.config.ann_path, self._index_generation)
+            self._index_dirty = False
+
+    def _filter_clause(self, filters: Optional[dict]) -> Tuple[str, list]:
+        if not filters:
+            return "", []
+        id_query, params = compile_filters(filters, self.config.table_name, self.metadata_table)
+        return f"WHERE id IN ({id_query})", params
+
+    def matching_ids(self, filters: Optional[dict]) -> List[str]:
+        """Ids of chunks matching ``filters``, resolved from the metadata side table."""
+
+        id_query, params = compile_filters(filters, self.config.table_name, self.metadata_table)
+        return [chunk_id for (chunk_id,) in self._connection.execute(id_query, params)]
+
+    def _search_many(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        filters: Optional[dict],
+        index: Optional[MatrixIndex] = None,
+    ) -> List[List[DocumentChunk]]:
+        index = index or self._load_matrix_index(queries.shape[-1])
+        rows = None
+        if filters:
+            # Filters resolve to row numbers first so only matching vectors are scored.
+            positions = [index.positions[chunk_id] for chunk_id in self.matching_ids(filters) if chunk_id in index.positions]
+            rows = np.asarray(sorted(positions), dtype=np.int64)
+        ranked = index.search_many(queries, top_k, rows)
+        chunks = self._fetch_chunks({chunk_id for result in ranked for chunk_id, _ in result}, index)
+        self._with_references(list(chunks.values()))
+        return [[chunks[chunk_id] for chunk_id, _ in result if chunk_id in chunks] for result in ranked]
+
+    def _load_matrix_index(self, dimension: int) -> MatrixIndex:
+        generation = self.generation
+        index = self._matrix_index
+        if index is not None and index.dimension == dimension and self._index_generation == generation:
+            return index
+        if self.config.index == "ivf":
+            index = IVFIndex.load(self.config.ann_path, generation, dimension, nprobe=self.config.nprobe)
+            if index is not None:
+                self._matrix_index, self._index_generation = index, generation
+                return index
+            index = IVFIndex(dimension, nlist=self.config.nlist, nprobe=self.config.nprobe)
+        else:
+            index = self._segment_index(dimension)
+            if index is not None:
+                self._matrix_index, self._index_generation = index, generation
+                return index
+            index = MatrixIndex(dimension)
+        self._read_into(index)
+        self._matrix_index = index
+        self._index_generation = generation
+        if isinstance(index, IVFIndex):
+            index.train()
+            self._index_dirty = True
+            self.save_index()
+        return index
+
+    def _segment_index(self, dimension: int) -> Optional[SegmentIndex]:
+        """A zero-copy index over the float32 segment, if it holds every row of ``dimension``."""
+
+        if self.config.storage != "segments":
+            return None
+        segment = self._connection.execute(
+            f"SELECT id, rows FROM {self.config.table_name}_segments WHERE dtype = 'float32' AND dimension = ?",
+            (dimension,),
+        ).fetchone()
+        if segment is None:
+            return None
+        segment_id, rows = segment
+        (outside,) = self._connection.execute(
+            f"SELECT COUNT(*) FROM {self.config.table_name} WHERE dimension = ? AND (segment IS NULL OR segment != ?)",
+            (dimension, segment_id),
+        ).fetchone()
+        if outside:
+            return None
+        segment_file, rows = self._segment(segment_id)
+        ids_by_row: List[Optional[str]] = [None] * rows
+        for chunk_id, segment_row in self._connection.execute(
+            f"SELECT id, segment_row FROM {self.config.table_name} WHERE segment = ?", (segment_id,)
+        ):
+            ids_by_row[segment_row] = chunk_id
+        return SegmentIndex(segment_file.vectors(rows), segment_file.norms(rows), ids_by_row)
+
+    def _read_into(self, index: MatrixIndex, filters: Optional[dict] = None, batch_size: int = 10_000) -> None:
+        """Load stored embeddings with the index's dimension (and matching ``filters``) into ``index``."""
+
+        query = (
+            f"SELECT id, embedding, dtype, scale, segment, segment_row FROM {self.config.table_name} WHERE dimension = ?"
+        )
+        params: list = [index.dimension]
+        if filters:
+            id_query, filter_params = compile_filters(filters, self.config.table_name, self.metadata_table)
+            query += f" AND id IN ({id_query})"
+            params.extend(filter_params)
+        cursor = self._connection.execute(query, params)
+        views: Dict[int, np.ndarray] = {}
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            ids: List[str] = []
+            vectors: List[np.ndarray] = []
+            for chunk_id, embedding_blob, dtype, scale, segment, segment_row in rows:
+                embedding = self._decode_row(views, embedding_blob, dtype, scale, segment, segment_row)
+                if embedding.shape[0] != index.dimension:
+                    continue
+                ids.append(chunk_id)
+                vectors.append(embedding)
+            if ids:
+                index.add(ids, np.vstack(vectors))
+
+    def _index_is_current(self, generation: int) -> bool:
+        """Whether the loaded index can absorb the write that produced ``generation``.
+
+        If another connection wrote in between, the index is dropped and rebuilt
+        lazily on the next search instead of being patched.
+        """
+
+        if self._matrix_index is None:
+            return False
+        # A segment index maps the file as it was; remap it instead of patching.
+        if self._index_generation != generation - 1 or isinstance(self._matrix_index, SegmentIndex):
+            self._matrix_index = None
+            return False
+        return True
+
+    def _index_upserted(self, written: List[Tuple[str, np.ndarray]], generation: int) -> None:
+        index = self._matrix_index
+        matching = [(chunk_id, vector) for chunk_id, vector in written if vector.shape[-1] == index.dimension]
+        # Rows re-written with another dimension must not keep their stale vector.
+        index.remove(chunk_id for chunk_id, vector in written if vector.shape[-1] != index.dimension)
+        if matching:
+            index.add([chunk_id for chunk_id, _ in matching], np.vstack([vector for _, vector in matching]))
+        self._index_generation, self._index_dirty = generation, True
+
+    def _fetch_chunks(self, chunk_ids: Iterable[str], index: MatrixIndex) -> Dict[str, DocumentChunk]:
+        chunk_ids = list(chunk_ids)
+        chunks: Dict[str, DocumentChunk] = {}
+        for offset in range(0, len(chunk_ids), 500):
+            part = chunk_ids[offset : offset + 500]
+            placeholders = ", ".join("?" for _ in part)
+            cursor = self._connection.execute(
+                f"SELECT id, text, metadata FROM {self.config.table_name} WHERE id IN ({placeholders})",
+                part,
+            )
+            for chunk_id, text, metadata_json in cursor:
+                chunks[chunk_id] = DocumentChunk(
+                    id=chunk_id,
+                    text=text,
+                    metadata=json.loads(metadata_json),
+                    embedding=index.vector(chunk_id),
+                )
+        return chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-encode stored embeddings with a new storage dtype or location")
+    parser.add_argument("path", type=Path, help="Path to the SQLite vector store")
+    parser.add_argument("--table", default="chunks")
+    parser.add_argument("--dtype", required=True, help="Target dtype: float32, float16, int8 or float64")
+    parser.add_argument("--storage", default="sqlite", help="Where embeddings live: sqlite or segments")
+    args = parser.parse_args()
+
+    store = SQLiteVectorStore(
+        VectorStoreConfig(path=args.path, table_name=args.table, dtype=args.dtype, storage=args.storage)
+    )
+    try:
+        migrated = store.migrate_storage()
+    finally:
+        store.close()
+    print(f"Re-encoded {migrated} embeddings as {args.dtype} ({args.storage}) in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
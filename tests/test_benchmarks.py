@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from benchmarks import run
+
+
+def test_benchmark_suite_emits_json(tmp_path: Path) -> None:
+    output = tmp_path / "bench.json"
+    run.main(
+        [
+            "--sizes", "50",
+            "--index", "matrix",
+            "--files-per-type", "1",
+            "--units-per-file", "3",
+            "--queries", "3",
+            "--startup-repeats", "1",
+            "--stream-sizes", "3",
+            "--chunk-megabytes", "0.05",
+            "--rerank-budgets", "2", "4",
+            "--write-sizes", "30",
+            "--shard-counts", "1", "2",
+            "--template-kilobytes", "1",
+            "--output", str(output),
+        ]
+    )
+
+    report = json.loads(output.read_text(encoding="utf-8"))
+    assert set(report["ingest"]) == {"jira", "csv", "markdown", "html"}
+    assert report["embedding"]["hashing"]["texts"] > 0
+    assert [entry["kind"] for entry in report["streaming"]] == ["xlsx", "pdf"]
+    assert [entry["method"] for entry in report["chunking"]] == ["split_join", "approximate_tokens"]
+    assert [entry["candidates"] for entry in report["rerank"]] == [2, 4]
+    assert set(report["startup"]["hashing"]) == {"rag.ingest", "rag.retriever", "generator.pipeline"}
+    assert [entry["selectivity"] for entry in report["search"]] == [1.0, 0.1, 0.01]
+    assert {"p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"} <= set(report["search"][0])
+    assert [entry["mode"] for entry in report["write"]] == ["rollback", "wal", "wal_bulk"]
+    assert [entry["shards"] for entry in report["sharded_search"]] == [1, 2]
+    assert [entry["method"] for entry in report["prompt"]] == ["replace", "compiled"]
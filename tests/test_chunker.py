@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import re
+
+import numpy as np
+
+from rag import model_registry
+from rag.ingestion.chunker import approximate_spans, chunk_records, chunk_spans, iter_chunks, tokenizer_spans
+from rag.models import ArtifactRecord
+from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
+
+
+def test_windows_are_slices_sized_in_estimated_tokens() -> None:
+    text = "  alpha beta,\tgamma\n\ndelta epsilon-zeta eta  "
+    starts, ends, tokens = approximate_spans(text)
+
+    assert [text[start:end] for start, end in zip(starts, ends)] == text.split()
+    # "beta," and "epsilon-zeta" carry punctuation tokens.
+    assert tokens.tolist() == [1, 2, 1, 1, 3, 1]
+    assert [text[start:end] for start, end in chunk_spans(text, 4, 1)] == [
+        "alpha beta,\tgamma",
+        "gamma\n\ndelta",
+        "delta epsilon-zeta",
+        "eta",
+    ]
+
+
+def test_unicode_offsets_index_the_original_string() -> None:
+    text = "naïve café 日本語 end"
+    starts, ends, tokens = approximate_spans(text)
+
+    assert [text[start:end] for start, end in zip(starts, ends)] == ["naïve", "café", "日本語", "end"]
+    assert tokens.tolist() == [1, 1, 3, 1]
+
+
+def test_chunk_metadata_records_offsets() -> None:
+    record = ArtifactRecord(text=" ".join(f"word{n}" for n in range(25)), metadata={"source": "notes.md"})
+
+    chunks = list(iter_chunks([record], chunk_size=10, overlap=2))
+
+    assert len(chunks) == 3
+    for chunk in chunks:
+        start, end = int(chunk.metadata["char_start"]), int(chunk.metadata["char_end"])
+        assert record.text[start:end] == chunk.text
+    assert chunks[1].text.startswith("word8 ")
+
+
+def test_named_tokenizer_sizes_windows_by_its_tokens() -> None:
+    class CharTokenizer:
+        def __call__(self, text, **_):
+            return {"offset_mapping": [match.span() for match in re.finditer(r"\S", text)]}
+
+    model_registry.clear()
+    model_registry.get_model("tokenizer", "chars", CharTokenizer)
+    try:
+        starts, ends, tokens = tokenizer_spans("ab cd", "chars")
+        assert starts.tolist() == [0, 1, 3, 4] and tokens.sum() == 4
+    finally:
+        model_registry.clear()
+
+
+def test_small_rows_are_packed_per_sheet_up_to_the_budget() -> None:
+    rows = [
+        ArtifactRecord(f"id: REQ-{n} | owner: Team", {"doc_type": "spreadsheet", "source": "reqs.xlsx", "sheet": sheet, "row": str(n)})
+        for sheet in ("A", "B")
+        for n in range(2, 8)
+    ]
+
+    chunks = chunk_records(rows, chunk_size=36, overlap=0)
+    window_chunks = chunk_records(rows, chunk_size=36, overlap=0, chunking="window")
+
+    assert len(window_chunks) == 12
+    assert [(chunk.metadata["sheet"], chunk.metadata["row"], chunk.metadata.get("row_end")) for chunk in chunks] == [
+        ("A", "2", "5"),
+        ("A", "6", "7"),
+        ("B", "2", "5"),
+        ("B", "6", "7"),
+    ]
+    assert chunks[0].text.splitlines() == [row.text for row in rows[:4]]
+    assert len({chunk.id for chunk in chunks}) == 4
+
+
+def test_long_jira_issue_keeps_its_summary_in_every_window() -> None:
+    description = " ".join(f"step{n}" for n in range(40))
+    issues = [
+        ArtifactRecord(f"Summary: Refund fails\nDescription: {description}", {"doc_type": "jira", "jira_key": "PAY-1"}),
+        ArtifactRecord("Summary: Typo\nDescription: Fix label", {"doc_type": "jira", "jira_key": "PAY-2"}),
+        ArtifactRecord("Summary: Crash\nDescription: On save", {"doc_type": "jira", "jira_key": "PAY-3"}),
+    ]
+
+    chunks = chunk_records(issues, chunk_size=20, overlap=4)
+
+    long_issue = [chunk for chunk in chunks if chunk.metadata["jira_key"] == "PAY-1"]
+    assert len(long_issue) > 1
+    assert all(chunk.text.startswith("Summary: Refund fails\n") for chunk in long_issue)
+    assert [chunk.metadata["jira_key"] for chunk in chunks[-2:]] == ["PAY-2", "PAY-3"]
+    assert chunks[-1].text == "Summary: Crash\nDescription: On save"
+
+
+def test_packed_chunks_keep_exact_metadata_for_filters(tmp_path) -> None:
+    issues = [
+        ArtifactRecord(f"Summary: Issue {n}\nDescription: short", {"doc_type": "jira", "source": "jira.json", "jira_key": f"PAY-{n}", "status": status})
+        for n, status in ((1, "Done"), (2, "To Do"), (3, "Done"))
+    ]
+    rows = [
+        ArtifactRecord(f"id: REQ-{n}", {"doc_type": "spreadsheet", "source": "reqs.csv", "row": str(n), "owner": owner})
+        for n, owner in ((2, "Team A"), (3, "Team A"), (4, "Team B"))
+    ]
+    chunks = chunk_records(issues + rows, chunk_size=200, overlap=0)
+    for chunk in chunks:
+        chunk.embedding = np.ones(4, dtype=np.float32)
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite"))
+    store.upsert(chunks)
+
+    query = np.ones(4, dtype=np.float32)
+    assert [chunk.metadata["jira_key"] for chunk in store.similarity_search(query, 5, {"jira_key": "PAY-2"})] == ["PAY-2"]
+    assert sorted(chunk.metadata["jira_key"] for chunk in store.similarity_search(query, 5, {"status": "Done"})) == ["PAY-1", "PAY-3"]
+    # Rows pack only while their non-numeric metadata agrees.
+    team_a = store.similarity_search(query, 5, {"owner": "Team A"})
+    assert [(chunk.metadata["row"], chunk.metadata.get("row_end")) for chunk in team_a] == [("2", "3")]
+    store.close()
+
+
+def test_markdown_splits_on_headings_outside_code_fences() -> None:
+    text = "Preface.\n# Guide\n## Install\nRun it.\n```\n# a comment\n```\n## Usage\nCall it.\n"
+    record = ArtifactRecord(text, {"doc_type": "markdown", "section": "full_text"})
+
+    chunks = chunk_records([record], chunk_size=200, overlap=0)
+
+    assert [chunk.text for chunk in chunks] == [
+        "Preface.",
+        "# Guide\n## Install\nRun it.\n```\n# a comment\n```",
+        "## Usage\nCall it.",
+    ]
+    assert [chunk.metadata["section"] for chunk in chunks] == ["full_text", "Install", "Usage"]
+    assert chunks[2].metadata["heading_path"] == "Guide > Usage"
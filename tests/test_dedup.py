@@ -0,0 +1,26 @@
+from __future__ import annotations
+
+import numpy as np
+
+from rag.dedup import hamming, maximal_marginal_relevance, simhash
+from rag.models import DocumentChunk
+
+
+def test_simhash_is_close_for_near_duplicates_only() -> None:
+    text = " ".join(f"step {n}: restart the payment service, then check the retry queue" for n in range(8))
+
+    assert simhash(text) == simhash(text.upper())
+    assert hamming(simhash(text), simhash(text.replace("step 7", "step 8"))) <= 3
+    assert hamming(simhash(text), simhash("quarterly invoice export fails for archived accounts")) > 3
+
+
+def test_maximal_marginal_relevance_skips_redundant_results() -> None:
+    query = np.array([1.0, 0.0, 0.0])
+    chunks = [
+        DocumentChunk(id="a", text="", metadata={}, embedding=np.array([1.0, 0.1, 0.0])),
+        DocumentChunk(id="a-copy", text="", metadata={}, embedding=np.array([1.0, 0.11, 0.0])),
+        DocumentChunk(id="b", text="", metadata={}, embedding=np.array([0.7, 0.0, 0.7])),
+    ]
+
+    assert [chunk.id for chunk in maximal_marginal_relevance(query, chunks, 2, diversity=0.0)] == ["a", "a-copy"]
+    assert [chunk.id for chunk in maximal_marginal_relevance(query, chunks, 2, diversity=0.5)] == ["a", "b"]
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+from rag.embedder import EmbeddingClient, EmbeddingConfig
+from rag.embedding_cache import EmbeddingCache
+
+
+def test_only_cache_misses_are_embedded(tmp_path: Path) -> None:
+    config = EmbeddingConfig(cache_path=str(tmp_path / "cache.sqlite"), cache_memory_items=100)
+    client = EmbeddingClient(config)
+    calls = []
+    compute = client._compute
+    client._compute = lambda texts: calls.append(list(texts)) or compute(texts)
+
+    first = client.embed(["alpha beta", "gamma", "alpha  beta"])
+    second = client.embed(["gamma", "delta"])
+
+    assert calls == [["alpha beta", "gamma"], ["delta"]]
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(first[1], second[0])
+    assert (client.cache_stats().hits, client.cache_stats().misses) == (1, 3)
+    client.close()
+
+    reopened = EmbeddingClient(config)
+    reopened.embed(["alpha beta"])
+    assert reopened.cache_stats().disk_hits == 1
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path: Path) -> None:
+    vector = np.zeros(16, dtype=np.float64)
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", memory_items=0, max_bytes=int(vector.nbytes * 3.5))
+    for key in ("a", "b", "c"):
+        cache.put_many({key: vector})
+    cache.get_many(["a"])
+    cache.put_many({"d": vector})
+
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+from generator.concurrency import RetryPolicy
+from generator import pipeline
+from generator.pipeline import BatchConfig, GeneratorConfig, PromptConfig
+from rag.retriever import RetrieverConfig
+from rag.vector_store import VectorStoreConfig
+
+
+def _generator(tmp_path: Path, llm_callable) -> pipeline.TestCaseGenerator:
+    template = tmp_path / "prompt.md"
+    template.write_text("Summary: {{summary}}\n{{retrieved_context}}", encoding="utf-8")
+    return pipeline.TestCaseGenerator(
+        config=GeneratorConfig(
+            retriever=RetrieverConfig(vector_store=VectorStoreConfig(path=tmp_path / "store.sqlite")),
+            prompt=PromptConfig(master_prompt_path=template),
+        ),
+        llm_callable=llm_callable,
+    )
+
+
+def test_generate_many_bounds_concurrency_and_retries(tmp_path: Path) -> None:
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0, "failed_once": False}
+
+    def llm(prompt: str) -> str:
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            fail = "ticket 3" in prompt and not state["failed_once"]
+            state["failed_once"] = state["failed_once"] or fail
+        time.sleep(0.01)
+        with lock:
+            state["active"] -= 1
+        if fail:
+            raise RuntimeError("transient")
+        if "ticket 5" in prompt:
+            raise RuntimeError("permanent")
+        return prompt.splitlines()[0]
+
+    generator = _generator(tmp_path, llm)
+    inputs = [{"summary": f"ticket {idx}"} for idx in range(10)]
+    batch = BatchConfig(max_concurrency=3, retrieval_batch_size=4, retry=RetryPolicy(max_retries=1, backoff_seconds=0))
+
+    results = dict(generator.generate_many(inputs, batch))
+
+    assert sorted(results) == list(range(10))
+    assert state["peak"] <= 3
+    assert results[3]["raw_output"] == "Summary: ticket 3"
+    assert results[5]["error"] == "RuntimeError: permanent"
+    generator.close()
+
+
+def test_agenerate_many_accepts_coroutine_callables(tmp_path: Path) -> None:
+    async def llm(prompt: str) -> str:
+        await asyncio.sleep(0)
+        return prompt.splitlines()[0]
+
+    generator = _generator(tmp_path, llm)
+
+    async def collect():
+        return {index: result async for index, result in generator.agenerate_many([{"summary": "a"}, {"summary": "b"}])}
+
+    results = asyncio.run(collect())
+    assert results[1]["raw_output"] == "Summary: b"
+    generator.close()
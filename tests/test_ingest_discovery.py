@@ -18,13 +18,23 @@ stub_modules = {
     "rag.vector_store": {"SQLiteVectorStore": object, "VectorStoreConfig": object},
 }
 
+installed_stubs = []
 for name, attributes in stub_modules.items():
+    if name in sys.modules:
+        continue
     module = types.ModuleType(name)
     module.__dict__.update(attributes)
-    sys.modules.setdefault(name, module)
+    sys.modules[name] = module
+    installed_stubs.append(name)
 
 from rag.ingest import discover_artifacts
 
+# Drop the stubs again so other test modules import the real implementations.
+for name in installed_stubs:
+    del sys.modules[name]
+if installed_stubs:
+    del sys.modules["rag.ingest"]
+
 
 def test_discover_artifacts_handles_uppercase_suffixes(tmp_path: Path) -> None:
     docs_dir = tmp_path / "docs"
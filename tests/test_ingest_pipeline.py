@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import random
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+
+from benchmarks.synthetic import write_pdf, write_xlsx
+from rag.ingest import IngestStats, discover_artifacts, ingest, iter_batches, iter_loaded, purge_removed
+from rag.ingestion.pdf_loader import PdfLoader
+from rag.ingestion.spreadsheet_loader import SpreadsheetLoader
+from rag.manifest import SourceManifest
+from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
+
+
+class FakeEmbedder:
+    def __init__(self) -> None:
+        self.batch_sizes: List[int] = []
+
+    def embed(self, texts: Iterable[str]) -> List[np.ndarray]:
+        texts = list(texts)
+        self.batch_sizes.append(len(texts))
+        return [np.full(4, len(text), dtype=np.float32) for text in texts]
+
+
+def test_iter_batches_groups_generators() -> None:
+    assert list(iter_batches((n for n in range(5)), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_ingest_commits_bounded_batches(tmp_path: Path) -> None:
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for idx in range(3):
+        (docs / f"note{idx}.md").write_text(" ".join(f"word{n}" for n in range(50)), encoding="utf-8")
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite"))
+    embedder = FakeEmbedder()
+    seen: List[int] = []
+
+    stats = ingest(
+        sorted(docs.iterdir()),
+        embedder,
+        store,
+        chunk_size=10,
+        overlap=0,
+        batch_size=4,
+        progress=lambda current: seen.append(current.chunks),
+    )
+
+    assert stats.chunks == 15
+    assert max(embedder.batch_sizes) <= 4
+    assert seen == [4, 8, 12, 15]
+    count = store._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    assert count == 15
+
+
+def test_parallel_loading_is_ordered_and_isolates_failures(tmp_path: Path) -> None:
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    for idx in range(4):
+        (docs / f"note{idx}.md").write_text(f"note {idx} " * 30, encoding="utf-8")
+    (docs / "broken.json").write_text("{not json", encoding="utf-8")
+    paths = sorted(docs.iterdir())
+
+    sequential = [result.path for result in iter_loaded(paths, 10, 0)]
+    parallel = list(iter_loaded(paths, 10, 0, workers=2))
+
+    assert [result.path for result in parallel] == sequential
+    failed = [result.path.name for result in parallel if result.error]
+    assert failed == ["broken.json"]
+    assert all(result.chunks for result in parallel if not result.error)
+
+
+def test_manifest_skips_unchanged_and_replaces_stale_chunks(tmp_path: Path) -> None:
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    kept = docs / "kept.md"
+    edited = docs / "edited.md"
+    dropped = docs / "dropped.md"
+    for path in (kept, edited, dropped):
+        path.write_text(f"{path.stem} " * 20, encoding="utf-8")
+    store_path = tmp_path / "store.sqlite"
+    store = SQLiteVectorStore(VectorStoreConfig(path=store_path))
+    manifest = SourceManifest(store_path)
+
+    def run() -> IngestStats:
+        paths = discover_artifacts([docs])
+        removed = purge_removed(manifest, store, paths, [docs])
+        stats = ingest(paths, FakeEmbedder(), store, chunk_size=10, overlap=0, manifest=manifest)
+        stats.removed = removed
+        return stats
+
+    def stored_texts() -> List[str]:
+        return [text for (text,) in store._connection.execute("SELECT text FROM chunks")]
+
+    first = run()
+    assert (first.files, first.chunks) == (3, 6)
+
+    second = run()
+    assert (second.files, second.skipped, second.chunks) == (0, 3, 0)
+
+    edited.write_text("changed " * 10, encoding="utf-8")
+    dropped.unlink()
+    third = run()
+    assert (third.files, third.skipped, third.removed) == (1, 1, 1)
+    texts = stored_texts()
+    assert not any("edited" in text or "dropped" in text for text in texts)
+    assert len(texts) == 3
+
+
+def test_streaming_loaders_yield_pdf_pages_and_workbook_rows(tmp_path: Path) -> None:
+    rng = random.Random(0)
+    write_pdf(tmp_path / "spec.pdf", rng, 3)
+    write_xlsx(tmp_path / "reqs.xlsx", rng, 4)
+
+    pages = PdfLoader(tmp_path / "spec.pdf").iter_load()
+    first = next(pages)
+    assert first.metadata["page"] == "1" and first.metadata["doc_type"] == "pdf"
+    assert len(list(pages)) == 2
+
+    rows = SpreadsheetLoader(tmp_path / "reqs.xlsx").load()
+    assert [row.metadata["row"] for row in rows] == ["2", "3", "4", "5"]
+    assert rows[0].text.startswith("id: REQ-0 | requirement: ")
+
+
+def test_streamed_file_that_fails_part_way_leaves_no_orphans(tmp_path: Path) -> None:
+    bad = tmp_path / "broken.csv"
+    bad.write_text("a,b\n1,2\n3,4\n", encoding="utf-8")
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite"))
+    manifest = SourceManifest(tmp_path / "store.sqlite")
+    original = SpreadsheetLoader._load_csv
+
+    def fail_after_first_row(self):
+        rows = original(self)
+        yield next(rows)
+        raise ValueError("corrupt row")
+
+    SpreadsheetLoader._load_csv = fail_after_first_row
+    try:
+        stats = ingest([bad], FakeEmbedder(), store, batch_size=1, manifest=manifest)
+    finally:
+        SpreadsheetLoader._load_csv = original
+
+    assert stats.failures == [(bad, "ValueError: corrupt row")] and stats.files == 0
+    assert store.matching_ids({"doc_type": "spreadsheet"}) == []
+    assert manifest.get(bad) is None
+
+
+def test_near_duplicate_chunks_are_stored_as_references(tmp_path: Path) -> None:
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    runbook = " ".join(f"step{n} restart the payment service and check the queue" for n in range(4))
+    (docs / "a.md").write_text(runbook, encoding="utf-8")
+    (docs / "b.md").write_text(runbook + " today", encoding="utf-8")
+    (docs / "c.md").write_text("an unrelated note about invoice exports", encoding="utf-8")
+    store_path = tmp_path / "store.sqlite"
+    store = SQLiteVectorStore(VectorStoreConfig(path=store_path, dedup=True))
+    manifest = SourceManifest(store_path)
+    embedder = FakeEmbedder()
+
+    stats = ingest(discover_artifacts([docs]), embedder, store, manifest=manifest)
+
+    assert (stats.chunks, stats.duplicates) == (3, 1)
+    assert sum(embedder.batch_sizes) == 2
+    (canonical,) = store.similarity_search(np.full(4, len(runbook), dtype=np.float32), 1, {"source": str(docs / "a.md")})
+    assert canonical.metadata["duplicate_sources"] == str(docs / "b.md")
+
+    # Removing the canonical copy promotes the duplicate in its place.
+    (docs / "a.md").unlink()
+    purge_removed(manifest, store, discover_artifacts([docs]), [docs])
+    sources = {chunk.metadata["source"] for chunk in store.similarity_search(np.ones(4), 5)}
+    assert sources == {str(docs / "b.md"), str(docs / "c.md")}
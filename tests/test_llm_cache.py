@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+from generator import pipeline
+from generator.llm_cache import LLMCache, LLMCacheConfig, response_key
+from generator.pipeline import GeneratorConfig, PromptConfig
+from generator.verifier import JsonSchemaVerifier
+from rag.retriever import RetrieverConfig
+from rag.vector_store import VectorStoreConfig
+
+
+def test_entries_expire_by_age_and_evict_least_recently_used(tmp_path: Path) -> None:
+    now = [1000.0]
+    config = LLMCacheConfig(path=tmp_path / "llm.sqlite", max_bytes=30, max_age_seconds=60)
+    cache = LLMCache(config, clock=lambda: now[0])
+    keys = [response_key("model-a", f"prompt {n}") for n in range(3)]
+
+    assert keys[0] != response_key("model-b", "prompt 0")
+    cache.put(keys[0], "model-a", "x" * 10)
+    cache.put(keys[1], "model-a", "y" * 10)
+    assert cache.get(keys[0]) == "x" * 10
+    cache.put(keys[2], "model-a", "z" * 15)
+
+    # Over 30 bytes: the least recently used entry goes first.
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "x" * 10
+    cache.close()
+
+    now[0] += 61
+    reopened = LLMCache(config, clock=lambda: now[0])
+    assert reopened.get(keys[0]) is None and reopened.get(keys[2]) is None
+    assert reopened.stats.expired == 2
+    reopened.close()
+
+
+class CountingVerifier(JsonSchemaVerifier):
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def verify(self, llm_output: str):
+        self.calls += 1
+        return super().verify(llm_output)
+
+
+def _generator(tmp_path: Path, llm_callable, verifier) -> pipeline.TestCaseGenerator:
+    template = tmp_path / "prompt.md"
+    template.write_text("Summary: {{summary}}\n{{retrieved_context}}", encoding="utf-8")
+    return pipeline.TestCaseGenerator(
+        config=GeneratorConfig(
+            retriever=RetrieverConfig(vector_store=VectorStoreConfig(path=tmp_path / "store.sqlite")),
+            prompt=PromptConfig(master_prompt_path=template),
+            llm_cache=LLMCacheConfig(path=tmp_path / "llm.sqlite", model="stub-1"),
+        ),
+        llm_callable=llm_callable,
+        verifier=verifier,
+    )
+
+
+def test_identical_prompts_share_one_call_and_cached_verification(tmp_path: Path) -> None:
+    lock = threading.Lock()
+    calls = []
+
+    def llm(prompt: str) -> str:
+        with lock:
+            calls.append(prompt)
+        time.sleep(0.02)
+        return '{"summary": "%s"}' % prompt.splitlines()[0]
+
+    verifier = CountingVerifier()
+    generator = _generator(tmp_path, llm, verifier)
+    inputs = [{"summary": f"ticket {n % 2}"} for n in range(6)]
+
+    first = dict(generator.generate_many(inputs))
+
+    assert len(calls) == 2
+    assert generator.llm_stats.coalesced == 4
+    assert first[4]["raw_output"] == '{"summary": "Summary: ticket 0"}'
+    assert first[5]["verification"]["passed"] == "True"
+    assert verifier.calls == 2
+    generator.close()
+
+    # A fresh generator (as after a restart) answers from disk without re-verifying.
+    verifier = CountingVerifier()
+    generator = _generator(tmp_path, llm, verifier)
+    second = dict(generator.generate_many(inputs))
+    assert len(calls) == 2 and verifier.calls == 0
+    assert second == first
+    assert generator.generate({"summary": "ticket 1"})["raw_output"] == first[1]["raw_output"]
+    assert generator.llm_stats.hits == 7
+    generator.close()
+
+    # A cache passed in belongs to the caller and outlives the generator.
+    shared = LLMCache(LLMCacheConfig(path=tmp_path / "llm.sqlite", model="stub-1"))
+    generator = pipeline.TestCaseGenerator(generator.config, llm, verifier, llm_cache=shared)
+    generator.close()
+    assert shared.get(response_key("stub-1", first[0]["prompt"])) == first[0]["raw_output"]
+    shared.close()
+
+
+def test_agenerate_many_coalesces_identical_prompts(tmp_path: Path) -> None:
+    calls = []
+
+    async def llm(prompt: str) -> str:
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return prompt.splitlines()[0]
+
+    generator = _generator(tmp_path, llm, None)
+
+    async def collect():
+        inputs = [{"summary": "same"}] * 4 + [{"summary": "other"}]
+        return {index: result async for index, result in generator.agenerate_many(inputs)}
+
+    results = asyncio.run(collect())
+    assert len(calls) == 2
+    assert {result["raw_output"] for result in results.values()} == {"Summary: same", "Summary: other"}
+    generator.close()
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import threading
+
+from rag import model_registry
+from rag.embedder import EmbeddingClient, EmbeddingConfig
+from rag.ingest import LOADER_MAPPING, loader_class
+
+
+def test_registry_loads_each_model_once_across_threads() -> None:
+    model_registry.clear()
+    calls = []
+
+    def factory() -> object:
+        calls.append(1)
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(model_registry.get_model("test", "m", factory)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1 and len({id(result) for result in results}) == 1
+    assert ("test", "m") in model_registry.loaded_models()
+    model_registry.clear()
+
+
+def test_embedding_clients_share_a_lazily_loaded_model() -> None:
+    model_registry.clear()
+    first = EmbeddingClient(EmbeddingConfig(backend="hashing"))
+    assert model_registry.loaded_models() == []
+
+    first.embed(["hello"])
+    second = EmbeddingClient(EmbeddingConfig(backend="hashing"))
+    assert second._vectorizer is first._vectorizer
+    assert model_registry.loaded_models() == [("hashing", "1024")]
+
+
+def test_loader_classes_resolve_by_suffix() -> None:
+    assert loader_class(".PDF").__name__ == "PdfLoader"
+    assert loader_class(".docx") is None
+    assert all(loader_class(suffix) is not None for suffix in LOADER_MAPPING)
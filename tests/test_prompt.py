@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from generator.pipeline import PromptBuilder, PromptConfig
+from generator.prompt import NO_CONTEXT, CompiledTemplate, pack_context
+from rag.ingestion.chunker import count_tokens, iter_chunks
+from rag.models import ArtifactRecord, DocumentChunk
+
+
+def test_compiled_template_renders_in_one_pass() -> None:
+    template = CompiledTemplate("A {{summary}} B {{missing}} C {{summary}}")
+
+    assert template.placeholders == ["summary", "missing", "summary"]
+    # A value that looks like a placeholder is not substituted again.
+    assert template.render({"summary": "{{missing}}", "unused": "x"}) == "A {{missing}} B {{missing}} C {{missing}}"
+    assert template.count_tokens({"summary": "two words"}) == template.literal_tokens + 4
+
+
+def test_context_is_packed_by_budget_without_repeating_overlaps() -> None:
+    record = ArtifactRecord(" ".join(f"word{n}" for n in range(28)), {"source": "runbook.md", "doc_type": "markdown"})
+    first, second, third = iter_chunks([record], chunk_size=12, overlap=4)
+    large = DocumentChunk(id="large", text="x " * 400, metadata={"source": "big.pdf"})
+    copy = DocumentChunk(id="copy", text=first.text, metadata={"source": "runbook.md", "chunk_index": "9"})
+
+    packed = pack_context([second, large, first, copy, third], budget=80)
+
+    assert [chunk.id for chunk in packed.chunks] == [second.id, first.id, third.id]
+    # Later windows keep only text the prompt does not already contain.
+    assert packed.chunks[1].text == "word0 word1 word2 word3 word4 word5 word6 word7"
+    assert packed.chunks[2].text.startswith("word20 ")
+    assert packed.text.count("word8 ") == 1
+    assert packed.dropped == 2 and packed.tokens <= 80
+    assert pack_context([large], budget=10).text == NO_CONTEXT
+
+
+def test_prompt_stays_within_max_prompt_tokens(tmp_path: Path) -> None:
+    template = tmp_path / "prompt.md"
+    template.write_text("Instructions. " * 50 + "Summary: {{summary}}\n{{retrieved_context}}", encoding="utf-8")
+    chunks = [
+        DocumentChunk(id=f"c{n}", text=f"note {n} " * 20, metadata={"source": f"doc{n}.md", "doc_type": "markdown"})
+        for n in range(10)
+    ]
+    builder = PromptBuilder(PromptConfig(master_prompt_path=template, max_context_snippets=10, max_prompt_tokens=250))
+
+    assembled = builder.assemble({"summary": "Renew a policy"}, chunks)
+
+    assert assembled.context.chunks and assembled.context.dropped
+    assert assembled.prompt_tokens <= 250
+    assert abs(count_tokens(assembled.text) - assembled.prompt_tokens) <= 5
+    assert builder.build({"summary": "Renew a policy"}, chunks) == assembled.text
+
+
+def test_context_is_only_budgeted_where_the_template_renders_it(tmp_path: Path) -> None:
+    chunks = [DocumentChunk(id=f"c{n}", text=f"note {n} " * 20, metadata={"source": f"doc{n}.md"}) for n in range(4)]
+    bare = tmp_path / "bare.md"
+    bare.write_text("Summary: {{summary}}", encoding="utf-8")
+    twice = tmp_path / "twice.md"
+    twice.write_text("{{retrieved_context}}\nSummary: {{summary}}\n{{retrieved_context}}", encoding="utf-8")
+
+    without = PromptBuilder(PromptConfig(master_prompt_path=bare, max_prompt_tokens=20)).assemble({"summary": "Renew"}, chunks)
+    doubled = PromptBuilder(PromptConfig(master_prompt_path=twice, max_context_snippets=4, max_prompt_tokens=200)).assemble(
+        {"summary": "Renew"}, chunks
+    )
+
+    assert without.text == "Summary: Renew"
+    assert without.prompt_tokens == count_tokens(without.text) and not without.context.chunks
+    assert doubled.context.chunks and doubled.prompt_tokens <= 200
+    assert abs(count_tokens(doubled.text) - doubled.prompt_tokens) <= 5
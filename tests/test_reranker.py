@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from generator import pipeline
+from generator.pipeline import GeneratorConfig, PromptConfig
+from rag.models import DocumentChunk
+from rag.reranker import BM25Scorer, RerankerConfig, ScoringReranker, build_reranker
+from rag.retriever import RetrieverConfig
+from rag.vector_store import VectorStoreConfig
+
+
+def _chunk(idx: int, text: str) -> DocumentChunk:
+    return DocumentChunk(id=f"c{idx}", text=text, metadata={})
+
+
+class CountingScorer:
+    name = "length"
+    cacheable = True
+
+    def __init__(self) -> None:
+        self.pairs = 0
+
+    def score_pairs(self, pairs):
+        self.pairs += len(pairs)
+        return [float(len(text)) for _, text in pairs]
+
+
+def test_bm25_reranks_lexical_matches_first() -> None:
+    chunks = [
+        _chunk(0, "Release notes for the mobile app"),
+        _chunk(1, "PAY-123 refunds fail when the card expired"),
+        _chunk(2, "Refunds are processed nightly"),
+    ]
+    reranker = build_reranker(RerankerConfig(enabled=True, top_k=2))
+
+    ranked = reranker.rerank("PAY-123 refunds", chunks)
+
+    assert [chunk.id for chunk in ranked] == ["c1", "c2"]
+    assert BM25Scorer().score("anything", []) == []
+
+
+def test_scores_are_batched_across_queries_and_cached() -> None:
+    scorer = CountingScorer()
+    reranker = ScoringReranker(scorer, top_k=1)
+    candidates = [_chunk(0, "short"), _chunk(1, "a longer text")]
+
+    first = reranker.rerank_many(["q1", "q2"], [candidates, candidates])
+    again = reranker.rerank("q1", candidates)
+
+    assert [ranked[0].id for ranked in first] == ["c1", "c1"] and again[0].id == "c1"
+    assert scorer.pairs == 4
+
+
+def test_generator_over_fetches_candidates_for_the_reranker(tmp_path: Path) -> None:
+    template = tmp_path / "prompt.md"
+    template.write_text("{{retrieved_context}}", encoding="utf-8")
+    generator = pipeline.TestCaseGenerator(
+        GeneratorConfig(
+            retriever=RetrieverConfig(vector_store=VectorStoreConfig(path=tmp_path / "store.sqlite"), top_k=3),
+            prompt=PromptConfig(master_prompt_path=template),
+            reranker=RerankerConfig(enabled=True, candidates=12),
+        ),
+        llm_callable=lambda prompt: prompt,
+    )
+
+    assert generator.candidate_k == 12
+    assert isinstance(generator.reranker, ScoringReranker) and generator.reranker.top_k == 3
+    generator.close()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from rag.embedder import EmbeddingClient
+from rag.models import DocumentChunk
+from rag.result_cache import ResultCache
+from rag.retriever import RetrieverConfig, SemanticRetriever
+from rag.vector_store import VectorStoreConfig
+
+TEXTS = [
+    "Policy renewal sends a confirmation email",
+    "Claims are rejected when the policy has lapsed",
+    "Admins can export the premium report as CSV",
+    "Renewal quotes expire after thirty days",
+    "Password reset links are valid for one hour",
+]
+
+
+def _populate(path: Path) -> None:
+    embedder = EmbeddingClient()
+    retriever = SemanticRetriever(RetrieverConfig(vector_store=VectorStoreConfig(path=path)))
+    retriever.vector_store.upsert(
+        DocumentChunk(id=f"doc-{idx}", text=text, metadata={"doc_type": "text"}, embedding=embedding)
+        for idx, (text, embedding) in enumerate(zip(TEXTS, embedder.embed(TEXTS)))
+    )
+    retriever.close()
+
+
+@pytest.mark.parametrize("index", ["scan", "matrix"])
+def test_retrieve_many_matches_looped_retrieve(tmp_path: Path, index: str) -> None:
+    path = tmp_path / "store.sqlite"
+    _populate(path)
+    retriever = SemanticRetriever(RetrieverConfig(vector_store=VectorStoreConfig(path=path, index=index), top_k=2))
+    queries = ["policy renewal", "premium report export", "password reset"]
+
+    batched = retriever.retrieve_many(queries)
+
+    assert [[chunk.id for chunk in result] for result in batched] == [
+        [chunk.id for chunk in retriever.retrieve(query)] for query in queries
+    ]
+    retriever.close()
+
+
+def test_hybrid_search_finds_exact_identifiers(tmp_path: Path) -> None:
+    path = tmp_path / "store.sqlite"
+    _populate(path)
+    retriever = SemanticRetriever(RetrieverConfig(vector_store=VectorStoreConfig(path=path), top_k=2, mode="hybrid"))
+    embedder = EmbeddingClient()
+    store = retriever.vector_store
+    text = "PAY-4711 fails with ERR_TIMEOUT"
+    store.upsert([DocumentChunk(id="jira", text=text, metadata={"doc_type": "jira"}, embedding=embedder.embed_query(text))])
+
+    assert [chunk.id for chunk in store.lexical_search("pay-4711", 5)] == ["jira"]
+    assert store.lexical_search("PAY", 5) == []
+    assert retriever.retrieve("what about PAY-4711?")[0].id == "jira"
+    assert store.lexical_search("ERR_TIMEOUT", 5, {"doc_type": "text"}) == []
+
+    # The full-text index follows updates and deletes of the chunk rows.
+    store.upsert([DocumentChunk(id="jira", text="PAY-4712 renamed", metadata={}, embedding=embedder.embed_query(text))])
+    assert store.lexical_search("PAY-4711", 5) == []
+    store.delete(["jira"])
+    assert store.lexical_search("PAY-4712", 5) == []
+    retriever.close()
+
+
+def test_result_cache_is_invalidated_by_writes_and_ttl(tmp_path: Path) -> None:
+    path = tmp_path / "store.sqlite"
+    _populate(path)
+    retriever = SemanticRetriever(RetrieverConfig(vector_store=VectorStoreConfig(path=path), top_k=1))
+    first = retriever.retrieve("policy  renewal")
+    assert retriever.retrieve("policy renewal") == first
+    assert (retriever.cache_stats().hits, retriever.cache_stats().misses) == (1, 1)
+
+    text = "Policy renewal is blocked for lapsed policies"
+    retriever.vector_store.upsert(
+        [DocumentChunk(id="new", text=text, metadata={}, embedding=EmbeddingClient().embed_query("policy renewal"))]
+    )
+    assert retriever.retrieve("policy renewal")[0].id == "new"
+    assert retriever.cache_stats().misses == 2
+    retriever.close()
+
+    now = [0.0]
+    cache = ResultCache(max_items=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.put("a", [1], generation=0)
+    cache.put("b", [2], generation=0)
+    cache.put("c", [3], generation=0)
+    now[0] = 5
+    assert cache.get("a", 0) is None and cache.get("c", 0) == [3]
+    now[0] = 20
+    assert cache.get("c", 0) is None
+    assert cache.stats.evicted == 1 and cache.stats.expired == 1
+    cache.put("d", [4], generation=0)
+    assert cache.get("d", generation=1) is None and cache.stats.invalidated == 2
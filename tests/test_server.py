@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from generator import pipeline
+from generator.pipeline import GeneratorConfig, PromptConfig
+from generator.server import ServerConfig, GenerationService, make_server, stub_llm
+from generator.verifier import JsonSchemaVerifier
+from rag.embedder import EmbeddingClient
+from rag.models import DocumentChunk
+from rag.retriever import RetrieverConfig
+from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
+
+TEXTS = ["Policy renewal sends an email", "Claims are rejected after lapse", "Premium report exports CSV"]
+
+
+def test_service_coalesces_queries_and_reloads(tmp_path: Path) -> None:
+    store_path = tmp_path / "store.sqlite"
+    store = SQLiteVectorStore(VectorStoreConfig(path=store_path, index="matrix"))
+    store.upsert(
+        DocumentChunk(id=f"doc-{idx}", text=text, metadata={"source": f"doc-{idx}"}, embedding=vector)
+        for idx, (text, vector) in enumerate(zip(TEXTS, EmbeddingClient().embed(TEXTS)))
+    )
+    store.close()
+    template = tmp_path / "prompt.md"
+    template.write_text("Summary: {{summary}}\n{{retrieved_context}}", encoding="utf-8")
+
+    def factory() -> pipeline.TestCaseGenerator:
+        config = GeneratorConfig(
+            retriever=RetrieverConfig(vector_store=VectorStoreConfig(path=store_path, index="matrix"), top_k=1),
+            prompt=PromptConfig(master_prompt_path=template),
+        )
+        return pipeline.TestCaseGenerator(config, stub_llm, verifier=JsonSchemaVerifier())
+
+    service = GenerationService(factory, ServerConfig(port=0, max_wait_ms=50))
+    server = make_server(service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def post(route: str, body: dict) -> dict:
+        request = urllib.request.Request(base + route, data=json.dumps(body).encode(), method="POST")
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    try:
+        queries = ["policy renewal", "claims lapse", "premium report"] * 4
+        with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+            answers = list(pool.map(lambda query: post("/retrieve", {"query": query}), queries))
+        assert [answer["chunks"][0]["id"] for answer in answers[:3]] == ["doc-0", "doc-1", "doc-2"]
+        assert service.coalescer.batches < len(queries)
+
+        many = post("/retrieve_many", {"queries": ["claims lapse"], "top_k": 2})
+        assert len(many["results"][0]) == 2
+        generated = post("/generate", {"input": {"summary": "renewal"}})
+        assert generated["verification"]["passed"] == "True"
+        assert "Summary: renewal" in generated["prompt"]
+
+        template.write_text("Ticket: {{summary}}\n{{retrieved_context}}", encoding="utf-8")
+        assert post("/reload", {})["reloads"] == 1
+        assert post("/generate", {"inputs": [{"summary": "x"}]})["results"][0]["prompt"].startswith("Ticket: x")
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def test_out_of_process_upsert_reloads_and_invalidates_cached_results(tmp_path: Path) -> None:
+    store_path = tmp_path / "store.sqlite"
+    store = SQLiteVectorStore(VectorStoreConfig(path=store_path, index="matrix"))
+    store.upsert(
+        DocumentChunk(id=f"doc-{idx}", text=text, metadata={"source": f"doc-{idx}"}, embedding=vector)
+        for idx, (text, vector) in enumerate(zip(TEXTS, EmbeddingClient().embed(TEXTS)))
+    )
+    store.close()
+    template = tmp_path / "prompt.md"
+    template.write_text("Summary: {{summary}}\n{{retrieved_context}}", encoding="utf-8")
+
+    def factory() -> pipeline.TestCaseGenerator:
+        config = GeneratorConfig(
+            retriever=RetrieverConfig(vector_store=VectorStoreConfig(path=store_path, index="matrix"), top_k=1),
+            prompt=PromptConfig(master_prompt_path=template),
+        )
+        return pipeline.TestCaseGenerator(config, stub_llm)
+
+    service = GenerationService(factory, ServerConfig(port=0, watch_interval=0.05))
+    try:
+        query = {"query": "audit trail export"}
+        assert service.retrieve(query)["chunks"][0]["id"] != "doc-new"
+        writer = (
+            "import sys; from rag.embedder import EmbeddingClient; from rag.models import DocumentChunk\n"
+            "from rag.vector_store import SQLiteVectorStore, VectorStoreConfig\n"
+            "store = SQLiteVectorStore(VectorStoreConfig(path=sys.argv[1], index='matrix'))\n"
+            "text = 'audit trail export'\n"
+            "store.upsert([DocumentChunk(id='doc-new', text=text, metadata={}, embedding=EmbeddingClient().embed_query(text))])\n"
+            "store.close()\n"
+        )
+        subprocess.run([sys.executable, "-c", writer, str(store_path)], check=True, cwd=Path(__file__).resolve().parents[1])
+
+        deadline = time.monotonic() + 5
+        while service.coalescer.reloads == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert service.coalescer.reloads == 1
+        assert service.retrieve(query)["chunks"][0]["id"] == "doc-new"
+    finally:
+        service.close()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+from rag.models import DocumentChunk
+from rag.sharded_store import ShardedStoreConfig, ShardedVectorStore, id_hash, jump_hash, store_config
+from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
+
+
+def _chunks(count: int, dimension: int = 8) -> list[DocumentChunk]:
+    rng = np.random.default_rng(11)
+    doc_types = ["jira", "pdf", "html", "spreadsheet"]
+    return [
+        DocumentChunk(
+            id=f"chunk-{idx}",
+            text=f"text {idx} {doc_types[idx % 4]}",
+            metadata={"doc_type": doc_types[idx % 4], "source": f"file-{idx % 7}"},
+            embedding=rng.normal(size=dimension),
+        )
+        for idx in range(count)
+    ]
+
+
+def test_hash_shards_match_a_single_store_and_rebalance_in_place(tmp_path: Path) -> None:
+    chunks = _chunks(120)
+    single = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "single.sqlite"))
+    single.upsert(chunks)
+    sharded = ShardedVectorStore(ShardedStoreConfig(path=tmp_path / "store.sqlite", shards=3, shard={"index": "matrix"}))
+    sharded.upsert(chunks)
+    queries = np.random.default_rng(2).normal(size=(4, 8))
+
+    def ids(results: list[list[DocumentChunk]]) -> list[list[str]]:
+        return [[chunk.id for chunk in result] for result in results]
+
+    expected = ids(single.similarity_search_many(queries, 5, {"doc_type": "pdf"}))
+    assert ids(sharded.similarity_search_many(queries, 5, {"doc_type": "pdf"})) == expected
+    assert min(sharded.shard_sizes().values()) > 20
+
+    sharded.add_shard()
+    moved = sharded.rebalance(batch_size=7)
+    # Jump hashing only moves the chunks that now belong to the new shard.
+    assert moved == sharded.shard_sizes()[3] == sum(jump_hash(id_hash(chunk.id), 4) == 3 for chunk in chunks)
+    assert ids(sharded.similarity_search_many(queries, 5, {"doc_type": "pdf"})) == expected
+    assert sharded.rebalance() == 0
+
+    sharded.delete(["chunk-0", "chunk-1"])
+    assert sum(sharded.shard_sizes().values()) == 118
+    assert "chunk-0" not in {chunk.id for chunk in sharded.similarity_search(queries[0], 120)}
+    sharded.close()
+
+
+def test_key_partition_prunes_shards_and_moves_whole_values(tmp_path: Path) -> None:
+    config = store_config({"path": str(tmp_path / "store.sqlite"), "shards": 2, "partition": "doc_type", "fts": True})
+    assert isinstance(config, ShardedStoreConfig) and config.shard == {"fts": True}
+    store = ShardedVectorStore(config)
+    store.upsert(_chunks(40))
+
+    assert len(store._candidate_shards({"doc_type": "jira"})) == 1
+    # New values are spread over the shards as they first appear.
+    assert len(store._candidate_shards({"doc_type": {"$in": ["jira", "html"]}})) == 1
+    assert len(store._candidate_shards({"doc_type": {"$in": ["jira", "pdf"]}})) == 2
+    assert len(store._candidate_shards({"doc_type": "email"})) == 0
+    assert [chunk.id for chunk in store.lexical_search("text 13", 1)] == ["chunk-13"]
+    results = store.similarity_search(np.ones(8), 40, {"doc_type": {"$not": "pdf"}})
+    assert len(results) == 30 and all(chunk.metadata["doc_type"] != "pdf" for chunk in results)
+
+    store.add_shard()
+    assert store.rebalance() == 10
+    assert sorted(store.shard_sizes().values()) == [10, 10, 20]
+    # A chunk whose partition value changes moves with it.
+    changed = DocumentChunk(id="chunk-0", text="text 0", metadata={"doc_type": "pdf"}, embedding=np.ones(8))
+    store.upsert([changed])
+    assert store.similarity_search(np.ones(8), 1, {"doc_type": "pdf"})[0].id == "chunk-0"
+    assert len(store.similarity_search(np.ones(8), 40, {"doc_type": "jira"})) == 9
+    store.close()
+
+    reopened = ShardedVectorStore(config)
+    assert reopened.shard_count == 3 and sum(reopened.shard_sizes().values()) == 40
+    reopened.close()
+
+
+def test_reader_handle_sees_values_and_shards_added_by_a_writer(tmp_path: Path) -> None:
+    config = ShardedStoreConfig(path=tmp_path / "store.sqlite", shards=1, partition="doc_type")
+    chunks = _chunks(8)
+    writer = ShardedVectorStore(config)
+    writer.upsert([chunk for chunk in chunks if chunk.metadata["doc_type"] == "jira"])
+    reader = ShardedVectorStore(config)
+    before = reader.generation
+
+    writer.add_shard()
+    writer.upsert([chunk for chunk in chunks if chunk.metadata["doc_type"] == "pdf"])
+
+    assert reader.shard_count == 2
+    assert reader.generation > before
+    found = reader.similarity_search(chunks[1].embedding, 5, {"doc_type": "pdf"})
+    assert sorted(chunk.id for chunk in found) == ["chunk-1", "chunk-5"]
+    writer.close()
+    reader.close()
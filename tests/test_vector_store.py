@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from rag.models import DocumentChunk
+from rag.vector_store import SQLiteVectorStore, VectorStoreConfig
+
+
+def _chunks(count: int, dimension: int = 8) -> list[DocumentChunk]:
+    rng = np.random.default_rng(7)
+    return [
+        DocumentChunk(
+            id=f"chunk-{idx}",
+            text=f"text {idx}",
+            metadata={"doc_type": "jira" if idx % 2 else "pdf"},
+            embedding=rng.normal(size=dimension),
+        )
+        for idx in range(count)
+    ]
+
+
+def test_matrix_index_matches_scan(tmp_path: Path) -> None:
+    chunks = _chunks(50)
+    scan = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "scan.sqlite"))
+    matrix = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "matrix.sqlite", index="matrix"))
+    scan.upsert(chunks)
+    matrix.upsert(chunks)
+    query = np.random.default_rng(1).normal(size=8)
+
+    for filters in (None, {"doc_type": "jira"}):
+        expected = [chunk.id for chunk in scan.similarity_search(query, 5, filters)]
+        actual = [chunk.id for chunk in matrix.similarity_search(query, 5, filters)]
+        assert actual == expected
+
+
+def test_matrix_index_tracks_upsert_and_delete(tmp_path: Path) -> None:
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite", index="matrix"))
+    store.upsert(_chunks(10))
+    query = np.ones(8)
+    store.similarity_search(query, 3)
+
+    store.upsert([DocumentChunk(id="exact", text="exact", metadata={}, embedding=np.ones(8))])
+    assert store.similarity_search(query, 1)[0].id == "exact"
+
+    store.delete(["exact"])
+    assert "exact" not in {chunk.id for chunk in store.similarity_search(query, 20)}
+
+
+def test_ivf_index_is_persisted_and_reloaded(tmp_path: Path) -> None:
+    config = VectorStoreConfig(path=tmp_path / "store.sqlite", index="ivf", nlist=4, nprobe=4)
+    chunks = _chunks(64)
+    store = SQLiteVectorStore(config)
+    store.upsert(chunks)
+    query = np.random.default_rng(3).normal(size=8)
+    # Probing every list makes the ANN search exact.
+    first = [chunk.id for chunk in store.similarity_search(query, 5)]
+    store.close()
+    assert config.ann_path.exists()
+
+    reopened = SQLiteVectorStore(config)
+    assert [chunk.id for chunk in reopened.similarity_search(query, 5)] == first
+    reopened.upsert([DocumentChunk(id="exact", text="exact", metadata={}, embedding=query)])
+    assert reopened.similarity_search(query, 1)[0].id == "exact"
+
+
+def test_legacy_float64_store_is_read_and_migrated(tmp_path: Path) -> None:
+    path = tmp_path / "legacy.sqlite"
+    legacy = sqlite3.connect(path)
+    legacy.execute(
+        "CREATE TABLE chunks (id TEXT PRIMARY KEY, embedding BLOB NOT NULL, dimension INTEGER NOT NULL,"
+        " text TEXT NOT NULL, metadata TEXT NOT NULL)"
+    )
+    vector = np.arange(1, 9, dtype=float)
+    legacy.execute("INSERT INTO chunks VALUES (?, ?, ?, ?, ?)", ("old", vector.tobytes(), 8, "old", "{}"))
+    legacy.commit()
+    legacy.close()
+
+    store = SQLiteVectorStore(VectorStoreConfig(path=path, dtype="int8"))
+    assert store.similarity_search(vector, 1)[0].id == "old"
+    assert store.migrate_storage() == 1
+    (blob, dtype), = store._connection.execute("SELECT embedding, dtype FROM chunks").fetchall()
+    assert (dtype, len(blob)) == ("int8", 8)
+    restored = store.similarity_search(vector, 1)[0].embedding
+    np.testing.assert_allclose(restored, vector, atol=8 / 127)
+
+
+def test_float64_storage_keeps_full_precision(tmp_path: Path) -> None:
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite", dtype="float64"))
+    vector = np.array([1 / 3, 1 + 1e-12, -2.5, 0.1], dtype=np.float64)
+    store.upsert([DocumentChunk(id="exact", text="exact", metadata={}, embedding=vector)])
+
+    (blob,), = store._connection.execute("SELECT embedding FROM chunks").fetchall()
+    np.testing.assert_array_equal(np.frombuffer(blob, dtype=np.float64), vector)
+    store.close()
+
+
+def test_typed_filters_select_before_scoring(tmp_path: Path) -> None:
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite", index="matrix"))
+    statuses = ["To Do", "In Progress", "Done"]
+    store.upsert(
+        DocumentChunk(
+            id=f"PAY-{idx}",
+            text=f"issue {idx}",
+            metadata={"jira_key": f"{'PAY' if idx < 6 else 'OPS'}-{idx}", "status": statuses[idx % 3], "page": str(idx)},
+            embedding=np.ones(4),
+        )
+        for idx in range(9)
+    )
+
+    def ids(filters: dict) -> set:
+        return {chunk.id for chunk in store.similarity_search(np.ones(4), 20, filters)}
+
+    assert ids({"status": "Done"}) == {"PAY-2", "PAY-5", "PAY-8"}
+    assert ids({"status": ["To Do", "Done"], "page": {"$lt": 4}}) == {"PAY-0", "PAY-2", "PAY-3"}
+    assert ids({"jira_key": {"$prefix": "OPS-"}}) == {"PAY-6", "PAY-7", "PAY-8"}
+    assert ids({"page": {"$gte": 2, "$lte": 10}, "status": {"$not": "Done"}}) == {"PAY-3", "PAY-4", "PAY-6", "PAY-7"}
+    assert ids({"status": {"$nin": ["To Do", "In Progress"]}}) == ids({"status": "Done"})
+
+    store.delete(["PAY-2"])
+    assert ids({"status": "Done"}) == {"PAY-5", "PAY-8"}
+    # Scan mode resolves the same expressions through SQL.
+    store.config.index = "scan"
+    assert {chunk.id for chunk in store.similarity_search(np.ones(4), 20, {"page": {"$gt": 6}})} == {"PAY-7", "PAY-8"}
+
+
+def test_segment_storage_maps_vectors_and_compacts(tmp_path: Path) -> None:
+    config = VectorStoreConfig(path=tmp_path / "store.sqlite", index="matrix", storage="segments")
+    chunks = _chunks(20)
+    store = SQLiteVectorStore(config)
+    store.upsert(chunks)
+    query = np.random.default_rng(5).normal(size=8)
+    scan = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "scan.sqlite"))
+    scan.upsert(chunks)
+    expected = [chunk.id for chunk in scan.similarity_search(query, 5)]
+
+    assert [chunk.id for chunk in store.similarity_search(query, 5)] == expected
+    assert type(store._matrix_index).__name__ == "SegmentIndex"
+    (blob,) = store._connection.execute("SELECT embedding FROM chunks WHERE id = 'chunk-0'").fetchone()
+    assert blob == b""
+
+    store.upsert([DocumentChunk(id="chunk-0", text="moved", metadata={}, embedding=query)])
+    store.delete(["chunk-1"])
+    assert store.similarity_search(query, 1)[0].id == "chunk-0"
+    assert store.compact() == 2 * (8 * 4 + 4)
+    results = store.similarity_search(query, 30)
+    assert len(results) == 19 and results[0].text == "moved"
+    np.testing.assert_allclose(results[0].embedding, query, rtol=1e-6)
+
+    store.config.index = "scan"
+    assert store.similarity_search(query, 1)[0].id == "chunk-0"
+    assert len(list(config.segments_path.iterdir())) == 2
+
+
+def test_bulk_load_rebuilds_indexes_while_wal_readers_query(tmp_path: Path) -> None:
+    config = VectorStoreConfig(path=tmp_path / "store.sqlite")
+    writer = SQLiteVectorStore(config)
+    reader = SQLiteVectorStore(config)
+    chunks = _chunks(20)
+    query = np.random.default_rng(1).normal(size=8)
+
+    def indexes() -> set:
+        rows = writer._connection.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")
+        return {name for (name,) in rows}
+
+    assert {"idx_chunks_doc_type", "chunks_fts_insert"} <= indexes()
+    with writer.bulk_load():
+        assert "idx_chunks_doc_type" not in indexes() and "chunks_fts_insert" not in indexes()
+        writer.upsert(chunks[:10])
+        # A reader keeps querying committed rows while the writer holds an open transaction.
+        writer._connection.execute("BEGIN IMMEDIATE")
+        writer._connection.execute("DELETE FROM chunks WHERE id = 'chunk-0'")
+        assert len(reader.similarity_search(query, 20, {"doc_type": "pdf"})) == 5
+        writer._connection.rollback()
+        writer.upsert(chunks[10:])
+
+    assert {"idx_chunks_doc_type", "chunks_fts_insert"} <= indexes()
+    assert [chunk.id for chunk in reader.lexical_search("text 13", 1)] == ["chunk-13"]
+    assert writer._connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_interrupted_bulk_load_is_finished_on_open(tmp_path: Path) -> None:
+    config = VectorStoreConfig(path=tmp_path / "store.sqlite")
+    store = SQLiteVectorStore(config)
+    store.bulk_load().__enter__()
+    store.upsert(_chunks(4))
+    dead = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+    store._connection.execute("UPDATE chunks_state SET value = ? WHERE key = 'bulk_load'", (int(dead.stdout),))
+    store._connection.commit()
+    store._connection.close()
+
+    reopened = SQLiteVectorStore(config)
+
+    assert [chunk.id for chunk in reopened.lexical_search("text 2", 1)] == ["chunk-2"]
+    assert reopened._connection.execute("SELECT 1 FROM chunks_state WHERE key = 'bulk_load'").fetchone() is None
+
+
+def test_concurrent_segment_writers_do_not_overwrite_each_other(tmp_path: Path) -> None:
+    import threading
+
+    config = VectorStoreConfig(path=tmp_path / "store.sqlite", index="scan", storage="segments", fts=False)
+    SQLiteVectorStore(config).close()
+    chunks = _chunks(200)
+
+    def write(part: list[DocumentChunk]) -> None:
+        store = SQLiteVectorStore(config)
+        for offset in range(0, len(part), 5):
+            store.upsert(part[offset : offset + 5])
+        store.close()
+
+    writers = [threading.Thread(target=write, args=(chunks[half::2],)) for half in (0, 1)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    store = SQLiteVectorStore(config)
+    stored = {chunk.id: chunk.embedding for chunk in store.get(chunk.id for chunk in chunks)}
+    assert all(np.allclose(stored[chunk.id], chunk.embedding, atol=1e-5) for chunk in chunks)
+    store.close()
+
+
+def test_failed_upsert_rolls_back_and_truncates_segments(tmp_path: Path, monkeypatch) -> None:
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite", index="matrix", storage="segments"))
+    chunks = _chunks(6)
+    store.upsert(chunks[:3])
+    segment_files = sorted(store.config.segments_path.glob("*.bin"))
+    sizes = [path.stat().st_size for path in segment_files]
+    assert segment_files
+
+    def fail(cursor):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "_bump_generation", fail)
+        try:
+            store.upsert(chunks[3:])
+        except sqlite3.OperationalError:
+            pass
+        else:
+            raise AssertionError("upsert should have failed")
+
+    assert not store._connection.in_transaction
+    assert [path.stat().st_size for path in segment_files] == sizes
+    assert store._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0] == 3
+    store.upsert(chunks[3:])
+    assert store.similarity_search(chunks[4].embedding, 1)[0].id == "chunk-4"
+    store.close()
+
+
+def test_deleting_a_canonical_chunk_promotes_its_duplicate_atomically(tmp_path: Path, monkeypatch) -> None:
+    store = SQLiteVectorStore(VectorStoreConfig(path=tmp_path / "store.sqlite", dedup=True))
+    canonical, copy, other = _chunks(3)
+    store.upsert([canonical, other])
+    store.add_duplicates([(copy, canonical.id)])
+
+    def fail(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(store, "_write_chunks", fail)
+        try:
+            store.delete([canonical.id])
+        except sqlite3.OperationalError:
+            pass
+    # The failed promotion rolled the delete back with it.
+    assert [chunk.id for chunk in store.get([canonical.id])] == [canonical.id]
+
+    store.delete([canonical.id])
+    promoted = store.get([copy.id])
+    assert [chunk.id for chunk in promoted] == [copy.id]
+    np.testing.assert_allclose(promoted[0].embedding, canonical.embedding, atol=1e-5)
+    assert store.duplicates_of([copy.id]) == []
+    store.close()